@@ -0,0 +1,84 @@
+import random
+import sys
+import time
+
+from aspa_logic import *
+from aspa_table import FrozenASPATable
+
+# Benchmarks of the ASPA verification options of aspa_logic, `python aspa_bench.py` for the prefilter
+# and `python aspa_bench.py what_if` for ASPA.what_if.
+
+
+# (share of paths without an attested AS, paths/s without and with the prefilter on dict records,
+# the same on a FrozenASPATable) of downflow batches with the given share of ASes attested
+def prefilter_speedup(adoption, path_count=200000, asn_count=80000, seed=0):
+    rng = random.Random(seed)
+    asns = range(1, asn_count + 1)
+    neighbor_as = rng.choice(asns)
+    aspa_records = {IPv4: {customer: set(rng.sample(asns, rng.randint(1, 4)))
+                           for customer in rng.sample(asns, int(adoption * asn_count))}}
+    batch = PathBatch.from_paths([Segment(rng.choice(asns), AS_SEQUENCE) for _ in range(rng.randint(2, 8))]
+                                 + [Segment(neighbor_as, AS_SEQUENCE)] for _ in range(path_count))
+    unattested = sum(1 for index in range(path_count)
+                     if not any(asn in aspa_records[IPv4]
+                                for asn in batch.values[batch.offsets[index]:batch.offsets[index + 1]]))
+
+    rates = []
+    for records in (aspa_records, FrozenASPATable.build(aspa_records)):
+        results = []
+        for prefilter in (False, True):
+            aspa = ASPA(records, prefilter=prefilter)
+            started = time.perf_counter()
+            results.append(aspa.verify_many(batch, neighbor_as, IPv4, Downflow))
+            rates.append(path_count / (time.perf_counter() - started))
+        if results[0] != results[1]:
+            raise AssertionError('prefilter changed a verdict')
+    return (unattested / path_count, *rates)
+
+
+# (routes affected, transitions, what_if seconds, seconds of a full rerun of every route) for a new
+# ASPA record of the most used transit and of a median one, on a full table of routes over
+# Zipf like transit popularity
+def what_if_latency(route_count=1000000, path_count=100000, asn_count=80000, transit_count=3000, seed=0):
+    rng = random.Random(seed)
+    asns = rng.sample(range(1, 400000), asn_count)
+    transits, neighbors = asns[:transit_count], asns[transit_count:transit_count + 20]
+    aspa_records = {IPv4: {customer: {rng.choice(transits)} for customer in rng.sample(asns, asn_count // 5)}}
+    paths = [CanonicalPath.intern([Segment(asn, AS_SEQUENCE) for asn in
+                                   [rng.choice(asns)] + [transits[int(transit_count ** rng.random()) - 1]
+                                                         for _ in range(rng.randint(1, 4))] + [neighbor]])
+             for neighbor in (rng.choice(neighbors) for _ in range(path_count))]
+    aspa = ASPA(aspa_records)
+    for route in range(route_count):
+        aspath = paths[rng.randrange(path_count)]
+        aspa.add_route(route, aspath, aspath.values[-1], IPv4, Downflow)
+
+    by_routes = sorted(aspa.customer_routes[IPv4], key=lambda customer: len(aspa.customer_routes[IPv4][customer]))
+    rows = []
+    for customer in (by_routes[-1], by_routes[len(by_routes) // 2]):
+        added = {IPv4: {customer: {rng.choice(transits)}}}
+        started = time.perf_counter()
+        transitions = aspa.what_if(added)
+        seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        full_aspa = ASPA({IPv4: dict(aspa_records[IPv4])})
+        full_aspa.aspa_records[IPv4].update(added[IPv4])
+        for aspath, neighbor_as, afi, direction, _ in aspa.routes.values():
+            full_aspa._check_path(aspath, neighbor_as, afi, direction)
+        full_seconds = time.perf_counter() - started
+        rows.append((len(aspa.customer_routes[IPv4][customer]),
+                     sum(len(group) for group in transitions.values()), seconds, full_seconds))
+    return rows
+
+
+if __name__ == '__main__' and sys.argv[1:] == ['what_if']:
+    print('customer  routes affected  transitions  what_if s  full rerun s')
+    for name, (affected, transition_count, seconds, full_seconds) in zip(('top', 'median'), what_if_latency()):
+        print(f'{name:8s} {affected:16d} {transition_count:12d} {seconds:10.3f} {full_seconds:13.2f}')
+elif __name__ == '__main__':
+    print('adoption  no hop attested  dict paths/s  prefilter  speedup  frozen paths/s  prefilter  speedup')
+    for adoption in (0.01, 0.05, 0.1, 0.2):
+        unattested, plain, prefiltered, frozen, frozen_prefiltered = prefilter_speedup(adoption)
+        print(f'{adoption:8.0%} {unattested:16.0%} {plain:13.0f} {prefiltered:10.0f} {prefiltered / plain:8.2f}'
+              f' {frozen:15.0f} {frozen_prefiltered:10.0f} {frozen_prefiltered / frozen:8.2f}')
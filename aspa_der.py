@@ -0,0 +1,246 @@
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from itertools import islice
+
+from aspa_logic import *
+from aspa_table import intern_provider_sets
+
+# Loader of RPKI ASPA objects (.asa, draft-ietf-sidrops-aspa-profile): the CMS wrapper is walked
+# only as far as the eContent, which is decoded as the ASProviderAttestation of RPKI-ASPA-2023.asn
+# straight from the file bytes, without building a DER tree. Signatures, certificates and the EE
+# certificate resources are NOT validated, so only use it on objects a validator already accepted.
+#
+# `python aspa_der.py [count]` loads that many generated objects once per worker count, workers=0
+# decoding in the calling process, to compare the decode rate with the pool overhead.
+
+TAG_INTEGER, TAG_OCTET_STRING, TAG_OID, TAG_SEQUENCE, TAG_SET, TAG_CONTEXT_0 = 0x02, 0x04, 0x06, 0x30, 0x31, 0xa0
+ID_SIGNED_DATA = bytes.fromhex('2a864886f70d010702')    # 1.2.840.113549.1.7.2
+ID_CT_ASPA = bytes.fromhex('2a864886f70d0109100131')    # 1.2.840.113549.1.9.16.1.49
+ASPA_VERSION = 1
+
+
+# (tag, value start, value stop) of the DER TLV at offset, which must end by end
+def _tlv(data, offset, end):
+    if offset + 2 > end:
+        raise ValueError('truncated DER header')
+    tag, length = data[offset], data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7f
+        if count == 0 or count > 4 or offset + count > end:
+            raise ValueError('unsupported DER length')
+        length = int.from_bytes(data[offset:offset + count], 'big')
+        if length < 0x80 or data[offset] == 0:
+            raise ValueError('non-minimal DER length')
+        offset += count
+    if offset + length > end:
+        raise ValueError('truncated DER value')
+    return tag, offset, offset + length
+
+
+def _expect(data, offset, end, tag, name):
+    found, start, stop = _tlv(data, offset, end)
+    if found != tag:
+        raise ValueError(f'{name}: expected tag 0x{tag:02x}, found 0x{found:02x}')
+    return start, stop
+
+
+# ASID ::= INTEGER (0..4294967295) in minimal two's complement
+def _asid(data, start, stop):
+    length = stop - start
+    if length == 0 or length > 5 or data[start] & 0x80:
+        raise ValueError('ASID out of range')
+    if length > 1 and data[start] == 0 and not data[start + 1] & 0x80:
+        raise ValueError('non-minimal ASID encoding')
+    value = int.from_bytes(data[start:stop], 'big')
+    if value > 0xffffffff:
+        raise ValueError('ASID out of range')
+    return value
+
+
+# ASProviderAttestation eContent to (customer, providers), checking the profile constraints:
+# version 1 explicitly encoded, providers ascending, unique and without the customer
+def decode_aspa(data):
+    end = len(data)
+    start, stop = _expect(data, 0, end, TAG_SEQUENCE, 'ASProviderAttestation')
+    if stop != end:
+        raise ValueError('trailing data after ASProviderAttestation')
+
+    version_start, offset = _expect(data, start, stop, TAG_CONTEXT_0, 'version')
+    start, version_stop = _expect(data, version_start, offset, TAG_INTEGER, 'version')
+    if version_stop != offset or data[start:version_stop] != bytes([ASPA_VERSION]):
+        raise ValueError(f'ASPA version is not {ASPA_VERSION}')
+
+    start, offset = _expect(data, offset, end, TAG_INTEGER, 'customerASID')
+    customer = _asid(data, start, offset)
+
+    offset, stop = _expect(data, offset, end, TAG_SEQUENCE, 'providers')
+    if stop != end:
+        raise ValueError('trailing data after providers')
+    providers = []
+    previous = -1
+    while offset < stop:
+        start, offset = _expect(data, offset, stop, TAG_INTEGER, 'ProviderAS')
+        provider = _asid(data, start, offset)
+        if provider <= previous:
+            raise ValueError('providers are not unique and in ascending order')
+        if provider == customer:
+            raise ValueError('customerASID is one of the providers')
+        providers.append(provider)
+        previous = provider
+    if not providers:
+        raise ValueError('empty providers')
+    return customer, providers
+
+
+# eContent of an RPKI signed object (RFC 6488 ContentInfo with SignedData) of eContentType id-ct-ASPA,
+# skipping everything but the encapContentInfo
+def asa_econtent(data):
+    data = memoryview(data)
+    end = len(data)
+    start, stop = _expect(data, 0, end, TAG_SEQUENCE, 'ContentInfo')
+    start, offset = _expect(data, start, stop, TAG_OID, 'contentType')
+    if data[start:offset] != ID_SIGNED_DATA:
+        raise ValueError('contentType is not id-signedData')
+    start, stop = _expect(data, offset, stop, TAG_CONTEXT_0, 'content')
+    start, stop = _expect(data, start, stop, TAG_SEQUENCE, 'SignedData')
+    _, _, offset = _tlv(data, start, stop)                                      # version
+    _, _, offset = _tlv(data, offset, stop)                                     # digestAlgorithms
+    start, stop = _expect(data, offset, stop, TAG_SEQUENCE, 'encapContentInfo')
+    start, offset = _expect(data, start, stop, TAG_OID, 'eContentType')
+    if data[start:offset] != ID_CT_ASPA:
+        raise ValueError('eContentType is not id-ct-ASPA')
+    start, stop = _expect(data, offset, stop, TAG_CONTEXT_0, 'eContent')
+    start, stop = _expect(data, start, stop, TAG_OCTET_STRING, 'eContent')
+    return data[start:stop]
+
+
+def decode_asa(data):
+    return decode_aspa(asa_econtent(data))
+
+
+def _der(tag, content):
+    length = len(content)
+    if length < 0x80:
+        return bytes([tag, length]) + content
+    length_bytes = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([tag, 0x80 | len(length_bytes)]) + length_bytes + content
+
+
+def _der_integer(value):
+    return _der(TAG_INTEGER, value.to_bytes(value.bit_length() // 8 + 1, 'big'))
+
+
+def encode_aspa(customer, providers):
+    return _der(TAG_SEQUENCE, _der(TAG_CONTEXT_0, _der_integer(ASPA_VERSION)) + _der_integer(customer)
+                + _der(TAG_SEQUENCE, b''.join(_der_integer(provider) for provider in sorted(providers))))
+
+
+# Signed object shaped like an .asa for fixtures: the certificate and signature are placeholders
+def encode_asa(customer, providers, certificate_size=1500, signature_size=256):
+    encap_content_info = _der(TAG_SEQUENCE, _der(TAG_OID, ID_CT_ASPA)
+                              + _der(TAG_CONTEXT_0, _der(TAG_OCTET_STRING, encode_aspa(customer, providers))))
+    signed_data = _der(TAG_SEQUENCE, _der_integer(3) + _der(TAG_SET, b'') + encap_content_info
+                       + _der(TAG_CONTEXT_0, _der(TAG_SEQUENCE, bytes(certificate_size)))
+                       + _der(TAG_SET, _der(TAG_SEQUENCE, bytes(signature_size))))
+    return _der(TAG_SEQUENCE, _der(TAG_OID, ID_SIGNED_DATA) + _der(TAG_CONTEXT_0, signed_data))
+
+
+def _decode_files(paths):
+    customers, offsets, providers = array('I'), array('I', [0]), array('I')
+    rejected = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as asa:
+                customer, customer_providers = decode_asa(asa.read())
+        except (OSError, ValueError) as error:
+            rejected.append((path, str(error)))
+            continue
+        customers.append(customer)
+        providers.extend(customer_providers)
+        offsets.append(len(providers))
+    return customers, offsets, providers, rejected
+
+
+def _asa_paths(root):
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.endswith('.asa'):
+                yield os.path.join(directory, name)
+
+
+def _chunks(paths, chunk_size):
+    paths = iter(paths)
+    while chunk := list(islice(paths, chunk_size)):
+        yield chunk
+
+
+# Decodes the .asa files below root across a process pool (workers=0 decodes in the calling process)
+# into customer -> providers; several objects of one customer are merged. Returns the records, the
+# number of decoded objects and the (path, reason) of the rejected files.
+def read_asa_directory(root, workers=None, chunk_size=256):
+    chunks = _chunks(_asa_paths(root), chunk_size)
+    records, decoded, rejected = {}, 0, []
+    if workers == 0:
+        results = map(_decode_files, chunks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_decode_files, chunks)
+
+    try:
+        for customers, offsets, providers, chunk_rejected in results:
+            decoded += len(customers)
+            rejected.extend(chunk_rejected)
+            for index, customer in enumerate(customers):
+                customer_providers = providers[offsets[index]:offsets[index + 1]]
+                if customer in records:
+                    records[customer].update(customer_providers)
+                else:
+                    records[customer] = set(customer_providers)
+    finally:
+        if workers != 0:
+            pool.close()
+            pool.join()
+    return records, decoded, rejected
+
+
+# read_asa_directory into the records of aspa for afis, returning the load report with the
+# aspa_table.intern_provider_sets figures: customers with the same providers and the AFIs share one set
+def load_asa_directory(aspa, root, afis=(IPv4, IPv6), workers=None, chunk_size=256):
+    started = time.perf_counter()
+    records, objects, rejected = read_asa_directory(root, workers, chunk_size)
+    aspa_records = dict(aspa.aspa_records.items())
+    for afi in afis:
+        aspa_records[afi] = dict(records)
+    report = {'objects': objects, 'customers': len(records), 'rejected': rejected}
+    report.update(intern_provider_sets({afi: aspa_records[afi] for afi in afis}))
+    aspa.aspa_records = aspa_records
+    seconds = time.perf_counter() - started
+    report.update(seconds=seconds, objects_per_second=objects / seconds if seconds else 0.0)
+    return report
+
+
+def write_fixtures(root, count, seed=0):
+    rng = random.Random(seed)
+    asns = range(1, 4 * count)
+    for index, customer in enumerate(rng.sample(asns, count)):
+        directory = os.path.join(root, f'{index % 256:02x}')
+        os.makedirs(directory, exist_ok=True)
+        providers = set(rng.sample(asns, rng.randint(1, 4))) - {customer} or {customer + 1}
+        with open(os.path.join(directory, f'{customer}.asa'), 'wb') as asa:
+            asa.write(encode_asa(customer, providers))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    with tempfile.TemporaryDirectory() as root:
+        write_fixtures(root, count)
+        print('workers  seconds  objects/s')
+        for workers in range(0, (os.cpu_count() or 1) + 1):
+            report = load_asa_directory(ASPA({}), root, workers=workers)
+            print(f'{workers:7d} {report["seconds"]:8.2f} {report["objects_per_second"]:10.0f}')
@@ -0,0 +1,290 @@
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from array import array
+
+from aspa_logic import *
+from aspa_table import FrozenAFITable, FrozenASPATable, ProviderSetInterner, provider_set_report
+
+# Streaming loader of the ASPAs in RPKI validator JSON exports, e.g. the "aspas" array of rpki-client
+# ({"customer_asid": 15562, "providers": [2914, ...]}) or Routinator ({"customer": "AS15562",
+# "providers": ["AS2914", ...]}). Providers may also be {"asid": ..., "afi_limit": "ipv4"} objects
+# or an {"ipv4": [...], "ipv6": [...]} object. The export is read in chunks and decoded one array
+# element at a time with JSONDecoder.raw_decode, so memory stays bounded by the chunk size and the
+# records built, whatever else (e.g. "roas") the export contains.
+#
+# `python aspa_json.py [aspa_count]` compares time and peak RSS of json.load with the streaming
+# loader on a generated export with about three times as many ROAs, each loader in its own process.
+
+_AFI_NAMES = {'ipv4': IPv4, 'ipv6': IPv6}
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# characters that can follow a complete number in valid JSON
+_NUMBER_TERMINATORS = frozenset(',]} \t\n\r')
+
+
+def _open(source):
+    if not isinstance(source, str):
+        return source
+    if source.endswith('.gz'):
+        return gzip.open(source, 'rt', encoding='utf-8')
+    return open(source, encoding='utf-8')
+
+
+# Incremental JSON reader over a text stream, decoding one value at a time from a chunked buffer
+class _JSONReader:
+    def __init__(self, stream, chunk_size):
+        self.stream, self.chunk_size = stream, chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer, self.position = '', 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.stream.read(max(self.chunk_size, len(self.buffer) - self.position))
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        self.eof = not data
+
+    # next non-whitespace character without consuming it, '' at the end of the stream
+    def peek(self):
+        while True:
+            buffer = self.buffer
+            position = self.position = _WHITESPACE.match(buffer, self.position).end()
+            if position < len(buffer):
+                return buffer[position]
+            if self.eof:
+                return ''
+            self._fill()
+
+    def take(self, expected):
+        char = self.buffer[self.position] if self.position < len(self.buffer) else ''
+        if char not in expected or not char:
+            char = self.peek()
+        if char not in expected:
+            raise ValueError(f'expected one of {expected!r} at {char!r}')
+        self.position += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number cut by the end of the buffer, e.g. within its fraction or exponent, decodes
+                # as a shorter number: only take one followed by a terminator
+                if (type(value) not in (int, float) or self.eof
+                        or end < len(self.buffer) and self.buffer[end] in _NUMBER_TERMINATORS):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError as error:
+                if self.eof:
+                    raise ValueError(f'invalid JSON: {error}') from None
+            self._fill()
+
+    def array(self):
+        self.take('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        scan_once = self.decoder.scan_once
+        while True:
+            # fast path for an element directly followed by its separator within the buffer, which also
+            # terminates a number
+            buffer = self.buffer
+            position = _WHITESPACE.match(buffer, self.position).end()
+            try:
+                value, end = scan_once(buffer, position)
+            except (StopIteration, json.JSONDecodeError):
+                end = len(buffer)
+            if end < len(buffer) and buffer[end] in ',]':
+                self.position = end + 1
+                yield value
+                if buffer[end] == ']':
+                    return
+                continue
+
+            yield self.value()
+            if self.take(',]') == ']':
+                return
+
+
+# Yields the entries of the "aspas" array of a validator export (or of a top level array) one at a time
+def iter_export_entries(source, chunk_size=1 << 16):
+    stream = _open(source)
+    try:
+        reader = _JSONReader(stream, chunk_size)
+        if reader.peek() == '[':
+            yield from reader.array()
+            return
+
+        reader.take('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.take(':')
+            if key == 'aspas':
+                yield from reader.array()
+                return
+            if reader.peek() == '[':
+                for _ in reader.array():
+                    pass
+            else:
+                reader.value()
+            if reader.take(',}') == '}':
+                return
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+def _asn(value):
+    if isinstance(value, str):
+        value = int(value[2:] if value[:2].upper() == 'AS' else value)
+    if not isinstance(value, int) or not 0 <= value <= 0xffffffff:
+        raise ValueError(f'invalid ASN {value!r}')
+    return value
+
+
+# customer and {afi: providers} of one export entry, afi None for the providers of all AFIs
+def _entry_providers(entry):
+    try:
+        customer = _asn(entry['customer_asid'] if 'customer_asid' in entry else entry['customer'])
+        providers = entry['providers'] if 'providers' in entry else entry['provider_set']
+        if isinstance(providers, list):
+            try:
+                return customer, {None: frozenset(array('I', providers))}
+            except (TypeError, OverflowError):
+                pass
+        if isinstance(providers, dict):
+            return customer, {_AFI_NAMES[afi.lower()]: {_asn(provider) for provider in afi_providers}
+                              for afi, afi_providers in providers.items()}
+
+        afi_providers = {}
+        for provider in providers:
+            afi = None
+            if isinstance(provider, dict):
+                afi = _AFI_NAMES.get(str(provider.get('afi_limit', '')).lower(), None)
+                provider = provider['asid']
+            afi_providers.setdefault(afi, set()).add(_asn(provider))
+        return customer, afi_providers
+    except (KeyError, TypeError, AttributeError, ValueError) as error:
+        raise ValueError(f'invalid ASPA entry {entry!r}: {error}') from None
+
+
+# Streams the ASPAs of a validator export (path, .gz path or text stream) into the records of aspa
+# for afis, merging entries of the same customer. With frozen=True the records are packed into a
+# FrozenASPATable replacing all of aspa.aspa_records. As long as no entry has AFI limits the records
+# are built once and shared between the AFIs, dict records also share one frozenset between all
+# customers with the same providers (aspa_table.ProviderSetInterner). Returns the load report, with
+# the aspa_table.provider_set_report figures for dict records.
+def load_json_export(aspa, source, afis=(IPv4, IPv6), frozen=False, chunk_size=1 << 16):
+    started = time.perf_counter()
+    # keyed by None while all AFIs get the same records
+    columns = {None: (array('I'), array('I', [0]), array('I'))}
+    records = {None: {}}
+    interner = ProviderSetInterner()
+    count = 0
+    for entry in iter_export_entries(source, chunk_size):
+        customer, afi_providers = _entry_providers(entry)
+        count += 1
+        if None in records and any(afi is not None for afi in afi_providers):
+            columns = {afi: tuple(array(column.typecode, column) for column in columns[None]) for afi in afis}
+            records = {afi: dict(records[None]) for afi in afis}
+
+        for afi in records:
+            providers = afi_providers.get(None, None)
+            if afi in afi_providers and afi is not None:
+                providers = afi_providers[afi] if providers is None else providers | afi_providers[afi]
+            if providers is None:
+                providers = set()
+
+            if frozen:
+                customers, offsets, flat_providers = columns[afi]
+                customers.append(customer)
+                flat_providers.extend(providers)
+                offsets.append(len(flat_providers))
+            else:
+                records_afi = records[afi]
+                existing = records_afi.get(customer, None)
+                records_afi[customer] = interner.intern(providers if existing is None else existing | providers)
+
+    report = {'aspas': count}
+    if frozen:
+        tables = {afi: FrozenAFITable.from_columns(*afi_columns) for afi, afi_columns in columns.items()}
+        aspa.aspa_records = FrozenASPATable({afi: tables[None] if None in tables else tables[afi] for afi in afis})
+    else:
+        aspa_records = dict(aspa.aspa_records.items())
+        for afi in afis:
+            aspa_records[afi] = dict(records[None]) if None in records else records[afi]
+        aspa.aspa_records = aspa_records
+        report.update(provider_set_report({afi: aspa_records[afi] for afi in afis}))
+    seconds = time.perf_counter() - started
+    report.update(seconds=seconds, aspas_per_second=count / seconds if seconds else 0.0)
+    return report
+
+
+def _load_baseline(aspa, path, afis=(IPv4, IPv6)):
+    started = time.perf_counter()
+    with open(path, encoding='utf-8') as export:
+        entries = json.load(export)['aspas']
+    records = {afi: {} for afi in afis}
+    for entry in entries:
+        customer, afi_providers = _entry_providers(entry)
+        for afi in afis:
+            records[afi][customer] = afi_providers.get(None, set()) | afi_providers.get(afi, set())
+    aspa.aspa_records = records
+    seconds = time.perf_counter() - started
+    return {'aspas': len(entries), 'seconds': seconds, 'aspas_per_second': len(entries) / seconds}
+
+
+def write_export(path, aspa_count, roa_count, seed=0):
+    rng = random.Random(seed)
+    asns = range(1, 4 * aspa_count)
+    with open(path, 'w', encoding='utf-8') as export:
+        export.write('{"metadata": {"generated": 0}, "roas": [')
+        for index in range(roa_count):
+            export.write(('' if index == 0 else ',') + json.dumps(
+                {'asn': rng.choice(asns), 'prefix': f'10.{index >> 8 & 255}.{index & 255}.0/24', 'maxLength': 24,
+                 'ta': 'ripe', 'expires': 0}))
+        export.write('], "aspas": [')
+        for index, customer in enumerate(rng.sample(asns, aspa_count)):
+            export.write(('' if index == 0 else ',') + json.dumps(
+                {'customer_asid': customer, 'expires': 0, 'providers': sorted(rng.sample(asns, rng.randint(1, 4)))}))
+        export.write(']}')
+
+
+def _measure(loader, path):
+    import resource
+
+    aspa = ASPA({})
+    if loader == 'json.load':
+        report = _load_baseline(aspa, path)
+    else:
+        report = load_json_export(aspa, path, frozen=loader == 'stream frozen')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps([report['seconds'], report['aspas_per_second'], peak]))
+
+
+if __name__ == '__main__':
+    import subprocess
+
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure':
+        _measure(sys.argv[2], sys.argv[3])
+        sys.exit()
+
+    aspa_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'export.json')
+        write_export(path, aspa_count, 10 * aspa_count // 3)
+        print(f'{os.path.getsize(path) / 1e6:.0f} MB')
+        print('loader          seconds    ASPAs/s  peak RSS MiB')
+        for loader in ('json.load', 'stream', 'stream frozen'):
+            output = subprocess.run([sys.executable, __file__, '--measure', loader, path], check=True,
+                                    capture_output=True, text=True).stdout
+            seconds, aspas_per_second, peak = json.loads(output)
+            print(f'{loader:15s} {seconds:7.2f} {aspas_per_second:10.0f} {peak:13.0f}')
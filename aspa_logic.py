@@ -1,7 +1,13 @@
+import struct
+import sys
+import weakref
+from array import array
+from collections import OrderedDict
 
 IPv4, IPv6 = 4, 6
 AS_SET, AS_SEQUENCE, AS_CONFED_SEQUENCE, AS_CONFED_SET = range(1, 5)
 Valid, Invalid, Unknown, Unverifiable = range(4)
+Upflow, Downflow, IXflow = range(3)
 
 
 class Segment:
@@ -9,12 +15,321 @@ class Segment:
         self.value, self.type = value, type
 
 
+# AS_PATH attribute value in wire format (RFC 4271 segments of type, ASN count and big endian
+# ASNs, 4 bytes per RFC 6793 or asn_size=2) to values/types arrays origin first like the Segment
+# lists. Copies the ASNs per segment from any bytes-like object without a Python object per ASN.
+def wire_path_columns(data, asn_size=4):
+    view = memoryview(data).cast('B')
+    values, types = array('I'), array('B')
+    header = struct.Struct('>BB')
+    offset = 0
+    while offset < len(view):
+        if offset + 2 > len(view):
+            raise ValueError('truncated AS_PATH segment header')
+        segment_type, count = header.unpack_from(view, offset)
+        offset += 2
+        if offset + count * asn_size > len(view):
+            raise ValueError('truncated AS_PATH segment')
+        if asn_size == 4:
+            values.frombytes(view[offset:offset + 4 * count])
+        else:
+            # zero-extend each big endian 2-byte ASN to 4 bytes by strided slice assignment
+            wide = bytearray(4 * count)
+            wide[2::4] = view[offset:offset + 2 * count:2]
+            wide[3::4] = view[offset + 1:offset + 2 * count:2]
+            values.frombytes(wide)
+        types.extend(array('B', [segment_type]) * count)
+        offset += count * asn_size
+
+    if sys.byteorder == 'little':
+        values.byteswap()
+    values.reverse()
+    types.reverse()
+    return values, types
+
+
+# values/types columns of a Segment list or CanonicalPath for the columnar scans of ASPA
+def _segment_columns(aspath):
+    if isinstance(aspath, CanonicalPath):
+        return aspath.values, aspath.types
+    values, types = [], []
+    for segment in aspath:
+        values.append(segment.value)
+        types.append(segment.type)
+    return values, types
+
+
+# Columnar batch of AS paths: flat ASN and segment type arrays plus per-path offsets.
+class PathBatch:
+    __slots__ = ('values', 'types', 'offsets')
+
+    def __init__(self, values=None, types=None, offsets=None):
+        self.values = values if values is not None else array('I')
+        self.types = types if types is not None else array('B')
+        self.offsets = offsets if offsets is not None else array('Q', [0])
+
+    @classmethod
+    def from_paths(cls, paths):
+        batch = cls()
+        for aspath in paths:
+            batch.append(aspath)
+        return batch
+
+    def append(self, aspath):
+        if isinstance(aspath, CanonicalPath):
+            self.values.extend(aspath.values)
+            self.types.extend(aspath.types)
+            self.offsets.append(len(self.values))
+            return
+        for segment in aspath:
+            self.values.append(segment.value)
+            self.types.append(segment.type)
+        self.offsets.append(len(self.values))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+# Interned AS path with prepends collapsed: consecutive AS_SEQUENCE segments of one ASN are
+# stored once, other segments (AS_SET and confed members) stay in place as markers. Origin
+# first like the Segment lists and verified with the same verdicts. Equal paths are the same
+# object for as long as one is referenced, so routes can share them.
+class CanonicalPath:
+    __slots__ = ('values', 'types', '_hash', '_as_path', '__weakref__')
+    _interned = weakref.WeakValueDictionary()
+
+    def __init__(self, values, types):
+        self.values = values
+        self.types = types
+        self._hash = hash((values.tobytes(), types.tobytes()))
+        self._as_path = None
+
+    @classmethod
+    def intern(cls, aspath):
+        if isinstance(aspath, CanonicalPath):
+            return aspath
+
+        values, types = array('I'), array('B')
+        for segment in aspath:
+            if segment.type == AS_SEQUENCE and types and types[-1] == AS_SEQUENCE and values[-1] == segment.value:
+                continue
+            values.append(segment.value)
+            types.append(segment.type)
+        return cls._intern(values, types)
+
+    # from the ASNs of an AS_SEQUENCE path neighbor first, the ASPath order of ietf-hackathon
+    @classmethod
+    def intern_as_path(cls, as_path):
+        values = array('I')
+        for asn in reversed(as_path):
+            if not values or values[-1] != asn:
+                values.append(asn)
+        return cls._intern(values, array('B', [AS_SEQUENCE]) * len(values))
+
+    @classmethod
+    def _intern(cls, values, types):
+        key = values.tobytes() + types.tobytes()
+        path = cls._interned.get(key, None)
+        if path is None:
+            path = cls._interned[key] = cls(values, types)
+        return path
+
+    # the ASNs neighbor first as used by ietf-hackathon, which has no AS_SET markers
+    @property
+    def as_path(self):
+        if self._as_path is None:
+            if any(segment_type != AS_SEQUENCE for segment_type in self.types):
+                raise ValueError('AS path with AS_SET or confed segments has no ASPath form')
+            self._as_path = tuple(reversed(self.values))
+        return self._as_path
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return Segment(self.values[index], self.types[index])
+
+    def __iter__(self):
+        return map(Segment, self.values, self.types)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, CanonicalPath):
+            return NotImplemented
+        return self.values == other.values and self.types == other.types
+
+
+# Bounded LRU of path verification results with hit/miss counters for sizing.
+class PathCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        result = self.entries.get(key, None)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Pair verdicts of one AFI packed into one dict keyed by customer << 32 | provider. The providers looked
+# up per customer are only kept so that a changed ASPA record drops its own entries.
+class PairCache:
+    def __init__(self, aspa_records_afi):
+        self.aspa_records_afi = aspa_records_afi
+        self.verdicts = {}
+        self.customer_providers = {}
+        self.misses = 0
+
+    def verify(self, as1, as2):
+        pair_check = self.verdicts.get(as1 << 32 | as2, None)
+        if pair_check is not None:
+            return pair_check
+
+        self.misses += 1
+        aspa_records_as1 = self.aspa_records_afi.get(as1, None) if self.aspa_records_afi is not None else None
+        if aspa_records_as1 is None:
+            pair_check = Unknown
+        else:
+            pair_check = Valid if as2 in aspa_records_as1 else Invalid
+        self.verdicts[as1 << 32 | as2] = pair_check
+        self.customer_providers.setdefault(as1, []).append(as2)
+        return pair_check
+
+    def invalidate(self, customer):
+        for provider in self.customer_providers.pop(customer, ()):
+            del self.verdicts[customer << 32 | provider]
+
+    def __len__(self):
+        return len(self.verdicts)
+
+
+# Records of one AFI with the candidate changes of ASPA.what_if on top: customer -> providers, or None
+# for a removed record
+class _CandidateRecords:
+    __slots__ = ('aspa_records_afi', 'candidates')
+
+    def __init__(self, aspa_records_afi, candidates):
+        self.aspa_records_afi, self.candidates = aspa_records_afi, candidates
+
+    def get(self, customer, default=None):
+        if customer in self.candidates:
+            providers = self.candidates[customer]
+            return default if providers is None else providers
+        if self.aspa_records_afi is None:
+            return default
+        return self.aspa_records_afi.get(customer, default)
+
+
+# prefilter=True answers hops of customers without any ASPA record as nA without looking them up, see _attested.
+# The path and pair caches are dropped by assigning aspa_records and by set_record/remove_record/apply_delta.
+# They cannot see records edited in place, e.g. aspa.aspa_records[afi][customer] = providers, so such edits
+# must be followed by records_changed() or the cached verdicts go stale.
 class ASPA:
-    def __init__(self, aspa_records):
+    def __init__(self, aspa_records, path_cache_size=0, pair_cache=False, prefilter=False):
+        self.path_cache = PathCache(path_cache_size) if path_cache_size else None
+        self.pair_caches = {} if pair_cache else None
+        # id of a non-dict records mapping -> (mapping, frozenset of its customers)
+        self.prefilters = {} if prefilter else None
+        if pair_cache:
+            # the plain function rather than a bound method, so no reference cycle keeps an unused ASPA alive
+            self._verify_pair = PairCache.verify
+        self.records_version = 0
         self.aspa_records = aspa_records
+        # stored routes for apply_delta: route -> (aspath, neighbor_as, afi, direction, state),
+        # indexed by afi -> customer -> routes where the customer is the first AS of a verified hop
+        self.routes = {}
+        self.customer_routes = {}
+
+    @property
+    def aspa_records(self):
+        return self._aspa_records
+
+    @aspa_records.setter
+    def aspa_records(self, aspa_records):
+        self._aspa_records = aspa_records
+        self.records_changed()
+
+    # must be called after changing aspa_records in place, set_record/remove_record do it already;
+    # passing the afi and customer of a single changed record keeps the other pair verdicts cached
+    def records_changed(self, afi=None, customer=None):
+        self.records_version += 1
+        if self.path_cache is not None:
+            self.path_cache.clear()
+        if self.prefilters is not None and customer is None:
+            self.prefilters.clear()
+
+        if self.pair_caches is None:
+            return
+        if afi is None:
+            self.pair_caches.clear()
+            return
+
+        pair_cache = self.pair_caches.get(afi, None)
+        if pair_cache is None:
+            return
+        if customer is None or pair_cache.aspa_records_afi is not self._aspa_records.get(afi, None):
+            del self.pair_caches[afi]
+        else:
+            pair_cache.invalidate(customer)
+
+    def set_record(self, afi, customer, providers):
+        self._aspa_records.setdefault(afi, {})[customer] = set(providers)
+        self.records_changed(afi, customer)
+
+    def remove_record(self, afi, customer):
+        self._aspa_records.get(afi, {}).pop(customer, None)
+        self.records_changed(afi, customer)
+
+    # per AFI state handed down to _verify_pair: the records themselves or their PairCache
+    def _afi_records(self, afi):
+        if self.pair_caches is None:
+            return self._aspa_records.get(afi, None)
+
+        pair_cache = self.pair_caches.get(afi, None)
+        if pair_cache is None:
+            pair_cache = self.pair_caches[afi] = PairCache(self._aspa_records.get(afi, None))
+        return pair_cache
+
+    # customers with an ASPA record in the records of _afi_records, for the nA prefilter
+    def _attested(self, aspa_records_afi):
+        if self.pair_caches is not None:
+            aspa_records_afi = aspa_records_afi.aspa_records_afi
+        if aspa_records_afi is None:
+            return ()
+        if isinstance(aspa_records_afi, dict):
+            return aspa_records_afi
+
+        prefilter = self.prefilters.get(id(aspa_records_afi), None)
+        if prefilter is None:
+            prefilter = self.prefilters[id(aspa_records_afi)] = (aspa_records_afi, frozenset(aspa_records_afi))
+        return prefilter[1]
 
     def verify_pair(self, as1, as2, afi):
-        aspa_records_afi = self.aspa_records.get(afi, None)
+        return self._verify_pair(self._afi_records(afi), as1, as2)
+
+    def _verify_pair(self, aspa_records_afi, as1, as2):
         if aspa_records_afi is None:
             return Unknown
 
@@ -27,60 +342,157 @@ class ASPA:
         return Valid
 
     def get_indexes(self, aspath, afi):
+        return self._get_indexes(aspath, self._afi_records(afi))
+
+    # Segment lists run through the columnar scan of _get_range_indexes
+    def _get_indexes(self, aspath, aspa_records_afi):
+        values, types = _segment_columns(aspath)
+        return self._get_range_indexes(values, types, range(len(values)), aspa_records_afi)
+
+    def check_upflow_path(self, aspath, neighbor_as, afi):
+        if self.path_cache is not None:
+            return self._check_cached_path(aspath, neighbor_as, afi, Upflow, self._afi_records(afi))
+        return self._check_upflow_path(aspath, neighbor_as, self._afi_records(afi))
+
+    def _check_upflow_path(self, aspath, neighbor_as, aspa_records_afi):
+        values, types = _segment_columns(aspath)
+        return self._check_range(values, types, 0, len(values), neighbor_as, aspa_records_afi, Upflow)
+
+    def check_downflow_path(self, aspath, neighbor_as, afi):
+        if self.path_cache is not None:
+            return self._check_cached_path(aspath, neighbor_as, afi, Downflow, self._afi_records(afi))
+        return self._check_downflow_path(aspath, neighbor_as, self._afi_records(afi))
+
+    def _check_downflow_path(self, aspath, neighbor_as, aspa_records_afi):
+        values, types = _segment_columns(aspath)
+        return self._check_range(values, types, 0, len(values), neighbor_as, aspa_records_afi, Downflow)
+
+    # Forward and backward (invalid index, unknown index, unverifiable) of a downflow check,
+    # both scans run to the end over one copy of the path
+    def get_bidirectional_indexes(self, aspath, afi):
+        aspa_records_afi = self._afi_records(afi)
+        values, types = _segment_columns(aspath)
+        positions = range(len(values))
+        return (self._get_range_indexes(values, types, positions, aspa_records_afi),
+                self._get_range_indexes(values, types, positions[::-1], aspa_records_afi))
+
+    def check_ix_path(self, aspath, neighbor_as, afi):
+        if self.path_cache is not None:
+            return self._check_cached_path(aspath, neighbor_as, afi, IXflow, self._afi_records(afi))
+        return self._check_ix_path(aspath, neighbor_as, self._afi_records(afi))
+
+    def _check_ix_path(self, aspath, neighbor_as, aspa_records_afi):
+        values, types = _segment_columns(aspath)
+        return self._check_range(values, types, 0, len(values), neighbor_as, aspa_records_afi, IXflow)
+
+    # Forward scan over values/types at positions, the verdict logic shared by Segment lists,
+    # CanonicalPath, PathBatch and wire paths; attested skips the lookup of unattested customers
+    def _get_range_indexes(self, values, types, positions, aspa_records_afi, attested=None):
         unknown_index = 0
         unverifiable_flag = False
 
         as1 = 0
         index = 1
-        for segment in aspath:
-            if segment.type != AS_SEQUENCE:
+        for position in positions:
+            if types[position] != AS_SEQUENCE:
                 as1 = 0
                 unverifiable_flag = True
-            elif segment.type == AS_SEQUENCE:
+            else:
+                as2 = values[position]
                 if not as1:
-                    as1 = segment.value
-                elif as1 != segment.value:
-                    pair_check = self.verify_pair(as1, segment.value, afi)
+                    as1 = as2
+                elif as1 != as2:
+                    if attested is not None and as1 not in attested:
+                        pair_check = Unknown
+                    else:
+                        pair_check = self._verify_pair(aspa_records_afi, as1, as2)
                     if pair_check == Invalid:
                         return index - 1, unknown_index - 1 if unknown_index else index - 1, unverifiable_flag
                     elif pair_check == Unknown and not unknown_index:
                         unknown_index = index
 
-                    as1 = segment.value
+                    as1 = as2
 
             index += 1
 
         return index - 1, unknown_index - 1 if unknown_index else index - 1, unverifiable_flag
 
-    def check_upflow_path(self, aspath, neighbor_as, afi):
-        if len(aspath) == 0:
-            return Invalid
+    # Backward scan of a downflow check of values[start:stop] from the neighbor end, stopping
+    # once the forward indexes decide the outcome: a backward invalid hop only counts within the first
+    # len - forward_invalid_index segments, a backward unknown hop within the first
+    # len - forward_unknown_index segments and not at all with forward_unverifiable. Segments
+    # beyond were scanned forward without an AS_SET unless forward_unverifiable is set.
+    def _get_backward_range_indexes(self, values, types, start, stop, forward_invalid_index, forward_unknown_index,
+                                    forward_unverifiable, aspa_records_afi, attested=None):
+        invalid_limit = stop - start - forward_invalid_index
+        limit = invalid_limit if forward_unverifiable else stop - start - forward_unknown_index
 
-        if aspath[-1].type == AS_SEQUENCE and aspath[-1].value != neighbor_as:
-            return Invalid
+        unknown_index = 0
+        unverifiable_flag = False
 
-        forward_invalid_index, forward_unknown_index, forward_unverifiable = self.get_indexes(aspath, afi)
+        as1 = 0
+        index = 1
+        for position in range(stop - 1, stop - 1 - limit, -1):
+            if types[position] != AS_SEQUENCE:
+                as1 = 0
+                unverifiable_flag = True
+            else:
+                as2 = values[position]
+                if not as1:
+                    as1 = as2
+                elif as1 != as2:
+                    if attested is not None and as1 not in attested:
+                        pair_check = Unknown
+                    else:
+                        pair_check = self._verify_pair(aspa_records_afi, as1, as2)
+                    if pair_check == Invalid:
+                        return index - 1, unknown_index - 1 if unknown_index else index - 1, unverifiable_flag
+                    elif pair_check == Unknown and not unknown_index:
+                        unknown_index = index
 
-        aspath_len = len(aspath)
-        if forward_invalid_index < aspath_len:
-            return Invalid
-        if forward_unverifiable:
-            return Unverifiable
-        if forward_unknown_index < aspath_len:
-            return Unknown
-        return Valid
+                    as1 = as2
 
-    def check_downflow_path(self, aspath, neighbor_as, afi):
-        if len(aspath) == 0:
+            if unknown_index and index >= invalid_limit:
+                break
+            index += 1
+        else:
+            return index - 1, unknown_index - 1 if unknown_index else index - 1, unverifiable_flag
+
+        return index, unknown_index - 1, unverifiable_flag
+
+    def _check_range(self, values, types, start, stop, neighbor_as, aspa_records_afi, direction):
+        aspath_len = stop - start
+        if aspath_len == 0:
             return Invalid
 
-        if aspath[-1].type == AS_SEQUENCE and aspath[-1].value != neighbor_as:
+        if direction != IXflow and types[stop - 1] == AS_SEQUENCE and values[stop - 1] != neighbor_as:
             return Invalid
 
-        forward_invalid_index, forward_unknown_index, forward_unverifiable = self.get_indexes(aspath, afi)
-        backward_invalid_index, backward_unknown_index, backward_unverifiable = self.get_indexes(list(reversed(aspath)), afi)
+        attested = None
+        if self.prefilters is not None:
+            attested = self._attested(aspa_records_afi)
+            for position in range(start, stop):
+                if values[position] in attested:
+                    break
+            else:
+                return self._unattested_verdict(values, types, start, stop, direction)
+
+        forward_invalid_index, forward_unknown_index, forward_unverifiable = \
+            self._get_range_indexes(values, types, range(start, stop), aspa_records_afi, attested)
+
+        if direction != Downflow:
+            if forward_invalid_index < aspath_len:
+                return Invalid
+            if forward_unverifiable:
+                return Unverifiable
+            if forward_unknown_index < aspath_len:
+                return Unknown
+            return Valid
+
+        backward_invalid_index, backward_unknown_index, backward_unverifiable = self._get_backward_range_indexes(
+            values, types, start, stop, forward_invalid_index, forward_unknown_index, forward_unverifiable,
+            aspa_records_afi, attested)
 
-        aspath_len = len(aspath)
         if forward_invalid_index + backward_invalid_index < aspath_len:
             return Invalid
         if forward_unverifiable or backward_unverifiable:
@@ -89,18 +501,182 @@ class ASPA:
             return Unknown
         return Valid
 
-    def check_ix_path(self, aspath, neighbor_as, afi):
-        if len(aspath) == 0:
-            return Invalid
+    # _check_range of a path without an attested AS, all its hops are nA: Unverifiable with an AS_SET or
+    # confed segment, else Unknown if a hop remains outside the up-ramp (and for Downflow the down-ramp),
+    # which then each end at the first hop
+    @staticmethod
+    def _unattested_verdict(values, types, start, stop, direction):
+        if types[start:stop].count(AS_SEQUENCE) != stop - start:
+            return Unverifiable
+        if direction != Downflow:
+            return Valid if values[start:stop].count(values[start]) == stop - start else Unknown
 
-        forward_invalid_index, forward_unknown_index, forward_unverifiable = self.get_indexes(aspath, afi)
+        head, tail = start + 1, stop - 1
+        while head < stop and values[head] == values[start]:
+            head += 1
+        while tail > head and values[tail - 1] == values[stop - 1]:
+            tail -= 1
+        return Unknown if head < tail else Valid
 
-        aspath_len = len(aspath)
-        if forward_invalid_index < aspath_len:
-            return Invalid
-        if forward_unverifiable:
-            return Unverifiable
-        if forward_unknown_index < aspath_len:
-            return Unknown
-        return Valid
+    def _check_cached_path(self, aspath, neighbor_as, afi, direction, aspa_records_afi):
+        if isinstance(aspath, CanonicalPath):
+            key = (aspath, neighbor_as, afi, direction)
+        else:
+            key = (tuple([(segment.value, segment.type) for segment in aspath]), neighbor_as, afi, direction)
+        result = self.path_cache.get(key)
+        if result is None:
+            check = (self._check_upflow_path, self._check_downflow_path, self._check_ix_path)[direction]
+            result = check(aspath, neighbor_as, aspa_records_afi)
+            self.path_cache.put(key, result)
+        return result
+
+    def _check_cached_range(self, values, types, start, stop, neighbor_as, afi, direction, aspa_records_afi):
+        key = (tuple(zip(values[start:stop], types[start:stop])), neighbor_as, afi, direction)
+        result = self.path_cache.get(key)
+        if result is None:
+            result = self._check_range(values, types, start, stop, neighbor_as, aspa_records_afi, direction)
+            self.path_cache.put(key, result)
+        return result
+
+    # verify_many for one AS_PATH attribute value in wire format, see wire_path_columns
+    def verify_wire_path(self, data, neighbor_as, afi, direction, asn_size=4):
+        values, types = wire_path_columns(data, asn_size)
+        aspa_records_afi = self._afi_records(afi)
+        if self.path_cache is not None:
+            return self._check_cached_range(values, types, 0, len(values), neighbor_as, afi, direction,
+                                            aspa_records_afi)
+        return self._check_range(values, types, 0, len(values), neighbor_as, aspa_records_afi, direction)
+
+    def verify_many(self, paths, neighbor_as, afi, direction):
+        aspa_records_afi = self._afi_records(afi)
+        results = array('B')
+
+        if isinstance(paths, PathBatch):
+            values, types, offsets = paths.values, paths.types, paths.offsets
+            for index in range(len(offsets) - 1):
+                if self.path_cache is not None:
+                    results.append(self._check_cached_range(values, types, offsets[index], offsets[index + 1],
+                                                            neighbor_as, afi, direction, aspa_records_afi))
+                else:
+                    results.append(self._check_range(values, types, offsets[index], offsets[index + 1],
+                                                     neighbor_as, aspa_records_afi, direction))
+            return results
+
+        if self.path_cache is not None:
+            for aspath in paths:
+                results.append(self._check_cached_path(aspath, neighbor_as, afi, direction, aspa_records_afi))
+            return results
+
+        check = (self._check_upflow_path, self._check_downflow_path, self._check_ix_path)[direction]
+        for aspath in paths:
+            results.append(check(aspath, neighbor_as, aspa_records_afi))
+        return results
+
+    @staticmethod
+    def _hop_customers(aspath, direction):
+        customers = set()
+        for index in range(1, len(aspath)):
+            segment1, segment2 = aspath[index - 1], aspath[index]
+            if segment1.type == AS_SEQUENCE and segment2.type == AS_SEQUENCE and segment1.value != segment2.value:
+                customers.add(segment1.value)
+                if direction == Downflow:
+                    customers.add(segment2.value)
+        return customers
+
+    def _check_path(self, aspath, neighbor_as, afi, direction):
+        return (self.check_upflow_path, self.check_downflow_path, self.check_ix_path)[direction](aspath, neighbor_as, afi)
+
+    def add_route(self, route, aspath, neighbor_as, afi, direction):
+        if route in self.routes:
+            self.remove_route(route)
+
+        state = self._check_path(aspath, neighbor_as, afi, direction)
+        self.routes[route] = (aspath, neighbor_as, afi, direction, state)
+        customer_routes_afi = self.customer_routes.setdefault(afi, {})
+        for customer in self._hop_customers(aspath, direction):
+            customer_routes_afi.setdefault(customer, {})[route] = None
+        return state
+
+    def remove_route(self, route):
+        aspath, neighbor_as, afi, direction, state = self.routes.pop(route)
+        customer_routes_afi = self.customer_routes[afi]
+        for customer in self._hop_customers(aspath, direction):
+            routes = customer_routes_afi[customer]
+            del routes[route]
+            if not routes:
+                del customer_routes_afi[customer]
+
+    def route_state(self, route):
+        return self.routes[route][4]
+
+    # added: {afi: {customer: providers}} for new or changed records, removed: {afi: customers} for withdrawals;
+    # re-verifies only the stored routes having a changed customer as hop origin and returns the
+    # (route, old_state, new_state) transitions
+    def apply_delta(self, added=None, removed=None):
+        affected = {}
+        for afi, customers in (removed or {}).items():
+            for customer in customers:
+                self.remove_record(afi, customer)
+                affected.update(self.customer_routes.get(afi, {}).get(customer, {}))
+
+        for afi, records in (added or {}).items():
+            for customer, providers in records.items():
+                self.set_record(afi, customer, providers)
+                affected.update(self.customer_routes.get(afi, {}).get(customer, {}))
+
+        return self._revalidate(affected)
+
+    # replaces aspa_records at once, e.g. with an updated copy so verification never sees a partial
+    # update, changed: {afi: customers} whose records differ; returns the transitions like apply_delta
+    def swap_records(self, aspa_records, changed):
+        self.aspa_records = aspa_records
+        affected = {}
+        for afi, customers in changed.items():
+            customer_routes_afi = self.customer_routes.get(afi, {})
+            for customer in customers:
+                affected.update(customer_routes_afi.get(customer, {}))
+        return self._revalidate(affected)
+
+    # The transitions apply_delta(added, removed) would cause, without changing the records: only the
+    # stored routes with a changed customer as hop origin are verified against the records with the
+    # changes on top, routes sharing a CanonicalPath once. Returns {(neighbor_as, origin AS):
+    # [(route, old_state, new_state)]}.
+    def what_if(self, added=None, removed=None):
+        candidates = {}
+        for afi, customers in (removed or {}).items():
+            for customer in customers:
+                candidates.setdefault(afi, {})[customer] = None
+        for afi, records in (added or {}).items():
+            for customer, providers in records.items():
+                candidates.setdefault(afi, {})[customer] = set(providers)
+
+        candidate_aspa = ASPA({afi: _CandidateRecords(self._aspa_records.get(afi, None), afi_candidates)
+                               for afi, afi_candidates in candidates.items()})
+        affected = {}
+        for afi, afi_candidates in candidates.items():
+            customer_routes_afi = self.customer_routes.get(afi, {})
+            for customer in afi_candidates:
+                affected.update(customer_routes_afi.get(customer, {}))
+
+        transitions, verdicts = {}, {}
+        for route in affected:
+            aspath, neighbor_as, afi, direction, old_state = self.routes[route]
+            key = (aspath, neighbor_as, afi, direction) if isinstance(aspath, CanonicalPath) else None
+            new_state = verdicts.get(key, None) if key is not None else None
+            if new_state is None:
+                new_state = candidate_aspa._check_path(aspath, neighbor_as, afi, direction)
+                if key is not None:
+                    verdicts[key] = new_state
+            if new_state != old_state:
+                transitions.setdefault((neighbor_as, aspath[0].value), []).append((route, old_state, new_state))
+        return transitions
 
+    def _revalidate(self, affected):
+        transitions = []
+        for route in affected:
+            aspath, neighbor_as, afi, direction, old_state = self.routes[route]
+            new_state = self._check_path(aspath, neighbor_as, afi, direction)
+            if new_state != old_state:
+                self.routes[route] = (aspath, neighbor_as, afi, direction, new_state)
+                transitions.append((route, old_state, new_state))
+        return transitions
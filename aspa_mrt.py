@@ -0,0 +1,264 @@
+import bz2
+import gzip
+import ipaddress
+import struct
+from collections import namedtuple
+
+from aspa_logic import *
+
+# MRT (RFC 6396) record types and subtypes
+TABLE_DUMP_V2, BGP4MP, BGP4MP_ET = 13, 16, 17
+PEER_INDEX_TABLE, RIB_IPV4_UNICAST, RIB_IPV6_UNICAST = 1, 2, 4
+BGP4MP_MESSAGE, BGP4MP_MESSAGE_AS4, BGP4MP_MESSAGE_LOCAL, BGP4MP_MESSAGE_AS4_LOCAL = 1, 4, 6, 7
+
+# BGP path attributes and message types
+ATTR_AS_PATH, ATTR_MP_REACH_NLRI, ATTR_AS4_PATH = 2, 14, 17
+BGP_UPDATE = 2
+AFI_IPV4, AFI_IPV6 = 1, 2
+
+MRT_HEADER = struct.Struct('>IHHI')
+VERDICT_NAMES = ('Valid', 'Invalid', 'Unknown', 'Unverifiable')
+
+# One announced prefix as seen from one peer, aspath is the verifier input (list of Segment)
+MRTRoute = namedtuple('MRTRoute', 'prefix afi peer_as aspath')
+
+
+def _open(source):
+    if not isinstance(source, str):
+        return source
+    if source.endswith('.gz'):
+        return gzip.open(source, 'rb')
+    if source.endswith('.bz2'):
+        return bz2.open(source, 'rb')
+    return open(source, 'rb')
+
+
+# Yields (type, subtype, body) for each MRT record, reading one record at a time
+def read_records(source):
+    stream = _open(source)
+    try:
+        while True:
+            header = stream.read(MRT_HEADER.size)
+            if not header:
+                return
+            if len(header) < MRT_HEADER.size:
+                raise ValueError('truncated MRT header')
+            _, record_type, subtype, length = MRT_HEADER.unpack(header)
+            body = stream.read(length)
+            if len(body) < length:
+                raise ValueError('truncated MRT record')
+            yield record_type, subtype, body
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+# AS_PATH segments (type 1 byte, ASN count 1 byte, ASNs) as (type, ASNs) in the wire order
+def _path_segments(data, asn_size):
+    segments = []
+    asn_format = '>%dI' if asn_size == 4 else '>%dH'
+    offset = 0
+    while offset < len(data):
+        segment_type, count = data[offset], data[offset + 1]
+        segments.append((segment_type, struct.unpack_from(asn_format % count, data, offset + 2)))
+        offset += 2 + count * asn_size
+    return segments
+
+
+# (type, ASNs) segments in the wire order to Segment objects in the ASPA order
+def _segments_to_aspath(segments):
+    aspath = [Segment(asn, segment_type) for segment_type, asns in segments for asn in asns]
+    aspath.reverse()
+    return aspath
+
+
+# AS_PATH segments (type 1 byte, ASN count 1 byte, ASNs) to Segment objects in the ASPA order,
+# origin first and neighbor last, which is the reverse of the wire order.
+# The MRT/BGP segment types are the AS_SET/AS_SEQUENCE/... constants of aspa_logic.
+def parse_as_path(data, asn_size=4):
+    return _segments_to_aspath(_path_segments(data, asn_size))
+
+
+# Number of ASes in wire segments as RFC 6793 counts them: an AS_SET counts as one AS, confed
+# segments as none
+def _as_count(segments):
+    count = 0
+    for segment_type, asns in segments:
+        if segment_type == AS_SEQUENCE:
+            count += len(asns)
+        elif segment_type == AS_SET:
+            count += 1
+    return count
+
+
+# RFC 6793 section 4.2.3: the AS4_PATH replaces the origin side of a 2 byte AS_PATH, whose leading
+# segments are kept up to as many ASes as the AS_PATH has more than the AS4_PATH. An AS4_PATH with
+# more ASes is ignored, confed segments in it are dropped. Segments in the wire order.
+def _merge_as4_path(segments, as4_segments):
+    as4_segments = [segment for segment in as4_segments if segment[0] in (AS_SEQUENCE, AS_SET)]
+    leading = _as_count(segments) - _as_count(as4_segments)
+    if leading < 0:
+        return segments
+
+    merged = []
+    for segment_type, asns in segments:
+        if segment_type == AS_CONFED_SEQUENCE or segment_type == AS_CONFED_SET:
+            merged.append((segment_type, asns))
+        elif leading == 0:
+            break
+        elif segment_type == AS_SET:
+            merged.append((segment_type, asns))
+            leading -= 1
+        else:
+            merged.append((segment_type, asns[:leading]))
+            leading -= len(asns[:leading])
+    return merged + as4_segments
+
+
+# Returns (aspath, mp_reach) from BGP path attributes, aspath merged with AS4_PATH for 2 byte sessions
+def _parse_attributes(data, asn_size):
+    segments, as4_segments, mp_reach = [], None, None
+    offset = 0
+    while offset < len(data):
+        flags, attribute_type = data[offset], data[offset + 1]
+        if flags & 0x10:
+            length, = struct.unpack_from('>H', data, offset + 2)
+            offset += 4
+        else:
+            length = data[offset + 2]
+            offset += 3
+        value = data[offset:offset + length]
+        if attribute_type == ATTR_AS_PATH:
+            segments = _path_segments(value, asn_size)
+        elif attribute_type == ATTR_AS4_PATH:
+            as4_segments = _path_segments(value, 4)
+        elif attribute_type == ATTR_MP_REACH_NLRI:
+            mp_reach = value
+        offset += length
+
+    if as4_segments is not None and asn_size == 2:
+        segments = _merge_as4_path(segments, as4_segments)
+    return _segments_to_aspath(segments), mp_reach
+
+
+def _parse_prefix(data, offset, afi):
+    prefix_length = data[offset]
+    prefix_bytes = (prefix_length + 7) // 8
+    address_size = 4 if afi == IPv4 else 16
+    address = data[offset + 1:offset + 1 + prefix_bytes].ljust(address_size, b'\0')
+    return str(ipaddress.ip_network((address, prefix_length), strict=False)), offset + 1 + prefix_bytes
+
+
+def _parse_nlri(data, afi):
+    prefixes = []
+    offset = 0
+    while offset < len(data):
+        prefix, offset = _parse_prefix(data, offset, afi)
+        prefixes.append(prefix)
+    return prefixes
+
+
+def _parse_peer_index_table(body):
+    view_name_length, = struct.unpack_from('>H', body, 4)
+    offset = 6 + view_name_length
+    peer_count, = struct.unpack_from('>H', body, offset)
+    offset += 2
+    peer_asns = []
+    for _ in range(peer_count):
+        peer_type = body[offset]
+        offset += 5 + (16 if peer_type & 0x01 else 4)
+        if peer_type & 0x02:
+            peer_as, = struct.unpack_from('>I', body, offset)
+            offset += 4
+        else:
+            peer_as, = struct.unpack_from('>H', body, offset)
+            offset += 2
+        peer_asns.append(peer_as)
+    return peer_asns
+
+
+def _parse_rib(body, afi, peer_asns):
+    prefix, offset = _parse_prefix(body, 4, afi)
+    entry_count, = struct.unpack_from('>H', body, offset)
+    offset += 2
+    for _ in range(entry_count):
+        peer_index, _, attributes_length = struct.unpack_from('>HIH', body, offset)
+        offset += 8
+        aspath, _ = _parse_attributes(body[offset:offset + attributes_length], 4)
+        offset += attributes_length
+        yield MRTRoute(prefix, afi, peer_asns[peer_index], aspath)
+
+
+def _parse_bgp4mp(record_type, subtype, body):
+    offset = 4 if record_type == BGP4MP_ET else 0
+    asn_size = 4 if subtype in (BGP4MP_MESSAGE_AS4, BGP4MP_MESSAGE_AS4_LOCAL) else 2
+    if asn_size == 4:
+        peer_as, _, _, address_family = struct.unpack_from('>IIHH', body, offset)
+        offset += 12
+    else:
+        peer_as, _, _, address_family = struct.unpack_from('>HHHH', body, offset)
+        offset += 8
+    offset += 2 * (4 if address_family == AFI_IPV4 else 16)
+
+    message_length, message_type = struct.unpack_from('>HB', body, offset + 16)
+    if message_type != BGP_UPDATE:
+        return
+    message = body[offset + 19:offset + message_length]
+    withdrawn_length, = struct.unpack_from('>H', message, 0)
+    attributes_length, = struct.unpack_from('>H', message, 2 + withdrawn_length)
+    attributes_offset = 4 + withdrawn_length
+    aspath, mp_reach = _parse_attributes(message[attributes_offset:attributes_offset + attributes_length], asn_size)
+
+    for prefix in _parse_nlri(message[attributes_offset + attributes_length:], IPv4):
+        yield MRTRoute(prefix, IPv4, peer_as, aspath)
+
+    if mp_reach is not None:
+        mp_afi, _, next_hop_length = struct.unpack_from('>HBB', mp_reach, 0)
+        if mp_afi in (AFI_IPV4, AFI_IPV6):
+            afi = IPv4 if mp_afi == AFI_IPV4 else IPv6
+            for prefix in _parse_nlri(mp_reach[5 + next_hop_length:], afi):
+                yield MRTRoute(prefix, afi, peer_as, aspath)
+
+
+# Streams the announced routes of a TABLE_DUMP_V2 or BGP4MP file (plain, .gz or .bz2) or binary stream
+def read_routes(source):
+    peer_asns = []
+    for record_type, subtype, body in read_records(source):
+        if record_type == TABLE_DUMP_V2:
+            if subtype == PEER_INDEX_TABLE:
+                peer_asns = _parse_peer_index_table(body)
+            elif subtype in (RIB_IPV4_UNICAST, RIB_IPV6_UNICAST):
+                yield from _parse_rib(body, IPv4 if subtype == RIB_IPV4_UNICAST else IPv6, peer_asns)
+        elif record_type in (BGP4MP, BGP4MP_ET) and subtype in (BGP4MP_MESSAGE, BGP4MP_MESSAGE_AS4,
+                                                                 BGP4MP_MESSAGE_LOCAL, BGP4MP_MESSAGE_AS4_LOCAL):
+            yield from _parse_bgp4mp(record_type, subtype, body)
+
+
+# Verifies every route of an MRT source with aspa.verify_many, batched per (peer AS, AFI) with the
+# peer as neighbor AS, and writes 'prefix|peer_as|aspath|verdict' lines to output (AS_PATH in wire
+# order, AS_SET members in braces). Lines come out batch by batch, so they are grouped per peer
+# rather than in file order. Returns the verdict counts.
+def verify_mrt(aspa, source, direction, output, batch_size=4096):
+    counts = [0] * len(VERDICT_NAMES)
+    batches = {}
+
+    def flush(key):
+        peer_as, afi = key
+        prefixes, aspaths, batch = batches.pop(key)
+        for prefix, aspath, verdict in zip(prefixes, aspaths, aspa.verify_many(batch, peer_as, afi, direction)):
+            counts[verdict] += 1
+            output.write(f'{prefix}|{peer_as}|{aspath}|{VERDICT_NAMES[verdict]}\n')
+
+    for route in read_routes(source):
+        key = (route.peer_as, route.afi)
+        prefixes, aspaths, batch = batches.setdefault(key, ([], [], PathBatch()))
+        prefixes.append(route.prefix)
+        aspaths.append(' '.join(str(segment.value) if segment.type == AS_SEQUENCE else f'{{{segment.value}}}'
+                                for segment in reversed(route.aspath)))
+        batch.append(route.aspath)
+        if len(batch) >= batch_size:
+            flush(key)
+
+    for key in list(batches):
+        flush(key)
+    return dict(zip(VERDICT_NAMES, counts))
@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from itertools import islice
+
+from aspa_logic import *
+from aspa_table import FrozenAFITable, FrozenASPATable, write_snapshot
+
+# Process pool for full table verification. Every worker maps the same snapshot file
+# (see aspa_table.write_snapshot) read-only, so the ASPA table is shared through the page
+# cache instead of being pickled to each worker; only chunks of paths and results travel
+# between processes. Results are returned in input order.
+#
+# `python aspa_pool.py [max_workers]` prints paths/s and the speedup per worker count. It has only
+# been run on a single core, so the scaling with more cores is not measured yet.
+
+_worker_aspa = None
+
+
+def _init_worker(snapshot_path):
+    global _worker_aspa
+    _worker_aspa = ASPA(FrozenASPATable.open(snapshot_path))
+
+
+def _verify_chunk(task):
+    batch, neighbor_as, afi, direction = task
+    return _worker_aspa.verify_many(batch, neighbor_as, afi, direction)
+
+
+def _apply_chunk(task):
+    verify, paths, afi, direction = task
+    aspa = _worker_aspa.aspa_records.get(afi, None)
+    if aspa is None:
+        aspa = FrozenAFITable(array('I'), array('I', [0]), array('I'))
+    return [verify(aspa, aspath, direction) for aspath in paths]
+
+
+def _batch_chunks(paths, chunk_size):
+    if isinstance(paths, PathBatch):
+        offsets = paths.offsets
+        for first in range(0, len(paths), chunk_size):
+            last = min(first + chunk_size, len(paths))
+            start, stop = offsets[first], offsets[last]
+            yield PathBatch(paths.values[start:stop], paths.types[start:stop],
+                            array('Q', [offset - start for offset in offsets[first:last + 1]]))
+        return
+
+    paths = iter(paths)
+    while True:
+        batch = PathBatch.from_paths(islice(paths, chunk_size))
+        if not len(batch):
+            return
+        yield batch
+
+
+def _list_chunks(paths, chunk_size):
+    paths = iter(paths)
+    while chunk := list(islice(paths, chunk_size)):
+        yield chunk
+
+
+class VerificationPool:
+    def __init__(self, snapshot_path, workers=None, chunk_size=2048):
+        self.chunk_size = chunk_size
+        self.pool = multiprocessing.Pool(workers, _init_worker, (snapshot_path,))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ASPA.verify_many in the workers, paths are Segment lists or a PathBatch
+    def verify_many(self, paths, neighbor_as, afi, direction):
+        results = array('B')
+        tasks = ((batch, neighbor_as, afi, direction) for batch in _batch_chunks(paths, self.chunk_size))
+        for chunk_results in self.pool.imap(_verify_chunk, tasks):
+            results.extend(chunk_results)
+        return results
+
+    # Calls verify(aspa, path, direction) for every path in the workers, where aspa is the
+    # FrozenAFITable of afi. verify must be picklable, e.g. one of the verifyASPath* functions
+    # of ietf-hackathon.
+    def map_verifier(self, verify, paths, afi, direction):
+        results = []
+        tasks = ((verify, chunk, afi, direction) for chunk in _list_chunks(paths, self.chunk_size))
+        for chunk_results in self.pool.imap(_apply_chunk, tasks):
+            results.extend(chunk_results)
+        return results
+
+
+def scaling_curve(path_count=200000, customer_count=50000, max_workers=None, seed=0):
+    rng = random.Random(seed)
+    asns = range(1, 4 * customer_count)
+    aspa_records = {IPv4: {customer: set(rng.sample(asns, rng.randint(1, 4)))
+                           for customer in rng.sample(asns, customer_count)}}
+    neighbor_as = 65000
+    paths = PathBatch.from_paths([Segment(rng.choice(asns), AS_SEQUENCE) for _ in range(rng.randint(1, 7))]
+                                 + [Segment(neighbor_as, AS_SEQUENCE)] for _ in range(path_count))
+
+    curve = []
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, 'aspa.snapshot')
+        write_snapshot(aspa_records, snapshot_path)
+        for workers in range(1, (max_workers or os.cpu_count() or 1) + 1):
+            with VerificationPool(snapshot_path, workers) as pool:
+                started = time.perf_counter()
+                pool.verify_many(paths, neighbor_as, IPv4, Downflow)
+                curve.append((workers, path_count / (time.perf_counter() - started)))
+    return curve
+
+
+if __name__ == '__main__':
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    curve = scaling_curve(max_workers=max_workers)
+    print('workers  paths/s  speedup')
+    for workers, paths_per_second in curve:
+        print(f'{workers:7d} {paths_per_second:8.0f} {paths_per_second / curve[0][1]:8.2f}')
@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from aspa_logic import *
+from aspa_table import FrozenASPATable, write_snapshot
+
+# RCU style generations of ASPA records for verification during reloads. A reload builds the new
+# records aside and publishes them as a new immutable generation with a single store of the current
+# pointer, no reader ever waits for it. Every batch loads the pointer once and verifies against that
+# generation only (caches included) and reports its number. A generation is freed once it is neither
+# current nor used by a running batch: publish drops the retired generations whose batches finished.
+#
+# `python aspa_rcu.py [customer_count]` reports the batch latencies of a reader thread while another
+# reloads all records back to back, without reloads, under a lock, and through generations.
+
+
+# Immutable ASPA records of one generation with their own path and pair caches.
+class ASPAGeneration(ASPA):
+    def __init__(self, generation, aspa_records, path_cache_size=0, pair_cache=False):
+        self.generation = generation
+        # one entry per running batch, list append and pop are atomic
+        self.readers = []
+        super().__init__(aspa_records, path_cache_size, pair_cache)
+
+    def set_record(self, afi, customer, providers):
+        raise TypeError('ASPA generations are immutable, publish a new one')
+
+    def remove_record(self, afi, customer):
+        raise TypeError('ASPA generations are immutable, publish a new one')
+
+    def swap_records(self, aspa_records, changed):
+        raise TypeError('ASPA generations are immutable, publish a new one')
+
+
+class ASPAGenerations:
+    def __init__(self, aspa_records, path_cache_size=0, pair_cache=False):
+        self.path_cache_size, self.pair_cache = path_cache_size, pair_cache
+        self.publish_lock = threading.Lock()
+        # generation -> ASPAGeneration, while it is current or used by a batch
+        self.live = weakref.WeakValueDictionary()
+        # previous generations, dropped by the publishing thread once no batch uses them, so their
+        # memory is not released by a reader
+        self.retired = []
+        self.last_generation = 0
+        self.current = None
+        self.publish(aspa_records)
+
+    # Makes aspa_records the current generation and returns its number; they must not be changed
+    # afterwards. Batches that already started finish on their generation.
+    def publish(self, aspa_records):
+        with self.publish_lock:
+            self.last_generation += 1
+            aspa = ASPAGeneration(self.last_generation, aspa_records, self.path_cache_size, self.pair_cache)
+            self.live[aspa.generation] = aspa
+            if self.current is not None:
+                self.retired.append(self.current)
+            self.current = aspa
+            self._reclaim()
+        return aspa.generation
+
+    # Drops the retired generations without running batches, publish does it already
+    def reclaim(self):
+        with self.publish_lock:
+            self._reclaim()
+
+    def _reclaim(self):
+        self.retired = [aspa for aspa in self.retired if aspa.readers]
+
+    # Publishes the snapshot file written by aspa_table.write_snapshot, e.g. by another process
+    def publish_snapshot(self, path):
+        return self.publish(FrozenASPATable.open(path))
+
+    # The current ASPAGeneration for the calls of a with block that must see the same records
+    @contextmanager
+    def acquire(self):
+        aspa = self.current
+        aspa.readers.append(None)
+        try:
+            yield aspa
+        finally:
+            aspa.readers.pop()
+
+    # (generation, ASPA.verify_many results) of one batch
+    def verify_many(self, paths, neighbor_as, afi, direction):
+        with self.acquire() as aspa:
+            return aspa.generation, aspa.verify_many(paths, neighbor_as, afi, direction)
+
+    def live_generations(self):
+        return sorted(self.live.keys())
+
+
+def _random_records(seed, customer_count):
+    rng = random.Random(seed)
+    asns = range(1, 4 * customer_count)
+    return {IPv4: {customer: set(rng.sample(asns, rng.randint(1, 4))) for customer in rng.sample(asns, customer_count)}}
+
+
+def _write_random_snapshot(task):
+    seed, customer_count, path = task
+    write_snapshot(_random_records(seed, customer_count), path)
+    return path
+
+
+def _percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+
+def reload_latency(reload, customer_count=100000, batch_size=200, seconds=10.0, seed=0):
+    rng = random.Random(seed)
+    asns = range(1, 4 * customer_count)
+    neighbor_as = 65000
+    batch = PathBatch.from_paths([Segment(rng.choice(asns), AS_SEQUENCE) for _ in range(rng.randint(1, 7))]
+                                 + [Segment(neighbor_as, AS_SEQUENCE)] for _ in range(batch_size))
+    if reload == 'locked in place':
+        aspa, lock = ASPA(_random_records(seed, customer_count)), threading.Lock()
+    else:
+        generations = ASPAGenerations(_random_records(seed, customer_count))
+    stop = threading.Event()
+
+    def reloader():
+        with tempfile.TemporaryDirectory() as directory, multiprocessing.Pool(1) as pool:
+            reloads = 0
+            while not stop.is_set():
+                reloads += 1
+                if reload == 'locked in place':
+                    with lock:
+                        aspa.aspa_records[IPv4].clear()
+                        aspa.aspa_records[IPv4].update(_random_records(seed + reloads, customer_count)[IPv4])
+                        aspa.records_changed(IPv4)
+                elif reload == 'rcu dict':
+                    generations.publish(_random_records(seed + reloads, customer_count))
+                elif reload == 'rcu snapshot':
+                    path = os.path.join(directory, f'aspa{reloads % 2}.snapshot')
+                    generations.publish_snapshot(
+                        pool.apply(_write_random_snapshot, ((seed + reloads, customer_count, path),)))
+                else:
+                    stop.wait()
+
+    thread = threading.Thread(target=reloader)
+    thread.start()
+    time.sleep(0.5)
+    latencies, used = [], set()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        if reload == 'locked in place':
+            with lock:
+                aspa.verify_many(batch, neighbor_as, IPv4, Downflow)
+        else:
+            generation, _ = generations.verify_many(batch, neighbor_as, IPv4, Downflow)
+            used.add(generation)
+        latencies.append(time.perf_counter() - started)
+    stop.set()
+    thread.join()
+
+    latencies.sort()
+    return (len(latencies), _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.99) * 1000,
+            latencies[-1] * 1000, max(len(used), 1))
+
+
+if __name__ == '__main__':
+    customer_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('reload            batches  p50 ms  p99 ms  max ms  generations')
+    for reload in ('none', 'locked in place', 'rcu dict', 'rcu snapshot'):
+        batches, p50, p99, worst, generation_count = reload_latency(reload, customer_count)
+        print(f'{reload:16s} {batches:8d} {p50:7.2f} {p99:7.2f} {worst:7.2f} {generation_count:12d}')
@@ -0,0 +1,392 @@
+import asyncio
+import random
+import struct
+import sys
+import time
+from collections import deque
+
+from aspa_logic import *
+
+# RPKI to Router protocol version 2 (draft-ietf-sidrops-8210bis) client keeping the ASPA records of
+# an ASPA object in sync with a cache. Only ASPA PDUs are used, prefix and router key PDUs are skipped.
+# Every End of Data applies the changes of one serial at once: in place through ASPA.apply_delta
+# (cheap for small deltas, the stored routes of the changed customers are re-verified), or with
+# atomic=True by swapping in new per AFI dicts built from the local cache, so concurrent readers
+# never see a partially applied serial.
+#
+# `python aspa_rtr.py [customer_count]` replays deltas of several sizes from a local server to compare
+# the PDU throughput of in place and atomic updates; atomic swaps copy each AFI's whole table, so they
+# only pay off for deltas of a sizeable part of it.
+
+RTR_VERSION = 2
+SERIAL_NOTIFY, SERIAL_QUERY, RESET_QUERY, CACHE_RESPONSE, IPV4_PREFIX = 0, 1, 2, 3, 4
+IPV6_PREFIX, END_OF_DATA, CACHE_RESET, ROUTER_KEY, ERROR_REPORT, ASPA_PDU = 6, 7, 8, 9, 10, 11
+CORRUPT_DATA, INTERNAL_ERROR, NO_DATA_AVAILABLE, INVALID_REQUEST, UNSUPPORTED_PROTOCOL_VERSION = range(5)
+UNSUPPORTED_PDU_TYPE, WITHDRAWAL_OF_UNKNOWN_RECORD, DUPLICATE_ANNOUNCEMENT_RECEIVED = 5, 6, 7
+ASPA_ANNOUNCE = 0x01
+
+# version, type, session id (error code for Error Reports, flags and zero for ASPA PDUs), length
+PDU_HEADER = struct.Struct('>BBHI')
+SERIAL = struct.Struct('>I')
+END_OF_DATA_BODY = struct.Struct('>IIII')
+# lengths of the fixed size PDUs, and the least length of the others that are parsed
+PDU_LENGTHS = {SERIAL_NOTIFY: 12, CACHE_RESPONSE: 8, END_OF_DATA: 24, CACHE_RESET: 8}
+PDU_MIN_LENGTHS = {ERROR_REPORT: 16, ASPA_PDU: 12}
+
+
+class RTRError(Exception):
+    def __init__(self, code, text, pdu=b''):
+        super().__init__(f'RTR error {code}: {text}')
+        # the erroneous PDU, for the Error Report
+        self.code, self.text, self.pdu = code, text, pdu
+
+
+def _pdu(pdu_type, field, body=b''):
+    return PDU_HEADER.pack(RTR_VERSION, pdu_type, field, PDU_HEADER.size + len(body)) + body
+
+
+def serial_notify_pdu(session_id, serial):
+    return _pdu(SERIAL_NOTIFY, session_id, SERIAL.pack(serial))
+
+
+def serial_query_pdu(session_id, serial):
+    return _pdu(SERIAL_QUERY, session_id, SERIAL.pack(serial))
+
+
+def reset_query_pdu():
+    return _pdu(RESET_QUERY, 0)
+
+
+def cache_response_pdu(session_id):
+    return _pdu(CACHE_RESPONSE, session_id)
+
+
+def end_of_data_pdu(session_id, serial, refresh=3600, retry=600, expire=7200):
+    return _pdu(END_OF_DATA, session_id, END_OF_DATA_BODY.pack(serial, refresh, retry, expire))
+
+
+def cache_reset_pdu():
+    return _pdu(CACHE_RESET, 0)
+
+
+def aspa_pdu(customer, providers=(), announce=True):
+    providers = sorted(providers) if announce else []
+    return _pdu(ASPA_PDU, ASPA_ANNOUNCE << 8 if announce else 0,
+                struct.pack(f'>I{len(providers)}I', customer, *providers))
+
+
+def error_report_pdu(code, pdu=b'', text=''):
+    text = text.encode()
+    return _pdu(ERROR_REPORT, code, SERIAL.pack(len(pdu)) + pdu + SERIAL.pack(len(text)) + text)
+
+
+# Cache Response, ASPA PDUs and End of Data of one serial, announced: {customer: providers}
+def cache_response(session_id, serial, announced, withdrawn=()):
+    return b''.join([cache_response_pdu(session_id)]
+                    + [aspa_pdu(customer, providers) for customer, providers in announced.items()]
+                    + [aspa_pdu(customer, announce=False) for customer in withdrawn]
+                    + [end_of_data_pdu(session_id, serial)])
+
+
+def _error_text(body):
+    pdu_length, = SERIAL.unpack_from(body, 0)
+    if 8 + pdu_length > len(body):
+        return ''
+    text_length, = SERIAL.unpack_from(body, 4 + pdu_length)
+    return bytes(body[8 + pdu_length:8 + pdu_length + text_length]).decode(errors='replace')
+
+
+class RTRClient:
+    def __init__(self, aspa, host, port, afis=(IPv4, IPv6), atomic=False):
+        self.aspa = aspa
+        self.host, self.port = host, port
+        # ASPA PDUs have no AFI, each record is set for all of afis
+        self.afis = afis
+        self.atomic = atomic
+        self.session_id = None
+        self.serial = None
+        self.refresh, self.retry, self.expire = 3600, 600, 7200
+        # local cache: customer -> frozenset of providers as of self.serial, shared with the atomic tables
+        self.records = {}
+        self.notified = False
+        self.reader = self.writer = None
+        self.buffer = bytearray()
+        self.pdus = deque()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.buffer.clear()
+        self.pdus.clear()
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Serial Query, or Reset Query before the first End of Data or after a Cache Reset, and applies
+    # the response; returns the transitions of the stored routes (see ASPA.apply_delta)
+    async def sync(self):
+        if self.serial is None:
+            return await self._query(reset_query_pdu(), True)
+        return await self._query(serial_query_pdu(self.session_id, self.serial), False)
+
+    # Syncs whenever the cache sends a Serial Notify or the refresh interval passed, after the retry
+    # interval if the cache has no data yet
+    async def run(self):
+        if self.writer is None:
+            await self.connect()
+        while True:
+            try:
+                await self.sync()
+                timeout = self.refresh
+            except RTRError as error:
+                if error.code != NO_DATA_AVAILABLE:
+                    raise
+                timeout = self.retry
+            try:
+                await asyncio.wait_for(self.wait_notify(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_notify(self):
+        while not self.notified:
+            pdu_type, field, pdu = await self._next_pdu()
+            if pdu_type == ERROR_REPORT:
+                raise RTRError(field, _error_text(pdu[PDU_HEADER.size:]))
+            if pdu_type != SERIAL_NOTIFY:
+                raise await self._error(CORRUPT_DATA, pdu, 'unexpected PDU outside of a response')
+            self.notified = True
+        self.notified = False
+
+    async def _query(self, query, reset):
+        self.writer.write(query)
+        await self.writer.drain()
+        # customer -> providers, None for a withdrawal
+        pending = {}
+        started = False
+        while True:
+            pdu_type, field, pdu = await self._next_pdu()
+            if pdu_type == ASPA_PDU and started:
+                customer, = SERIAL.unpack_from(pdu, PDU_HEADER.size)
+                if customer in pending:
+                    current = pending[customer]
+                else:
+                    current = None if reset else self.records.get(customer, None)
+                if field >> 8 & ASPA_ANNOUNCE:
+                    providers = frozenset(struct.unpack_from(f'>{(len(pdu) - 12) // 4}I', pdu, 12))
+                    if providers == current:
+                        raise await self._error(DUPLICATE_ANNOUNCEMENT_RECEIVED, pdu,
+                                                f'AS{customer} announced with the providers it has')
+                    pending[customer] = providers
+                elif current is None and not reset:
+                    raise await self._error(WITHDRAWAL_OF_UNKNOWN_RECORD, pdu, f'AS{customer} has no ASPA')
+                else:
+                    pending[customer] = None
+            elif pdu_type == CACHE_RESPONSE:
+                if started or (not reset and field != self.session_id):
+                    raise await self._error(CORRUPT_DATA, pdu, 'unexpected Cache Response')
+                started = True
+                if reset:
+                    self.session_id = field
+            elif pdu_type == END_OF_DATA and started:
+                if field != self.session_id:
+                    raise await self._error(CORRUPT_DATA, pdu, 'End of Data of another session')
+                serial, self.refresh, self.retry, self.expire = END_OF_DATA_BODY.unpack_from(pdu, PDU_HEADER.size)
+                transitions = self._apply(pending, reset)
+                self.serial = serial
+                return transitions
+            elif pdu_type == CACHE_RESET and not started and not reset:
+                self.serial = None
+                return await self._query(reset_query_pdu(), True)
+            elif pdu_type == ERROR_REPORT:
+                raise RTRError(field, _error_text(pdu[PDU_HEADER.size:]))
+            elif pdu_type == SERIAL_NOTIFY:
+                self.notified = True
+            elif pdu_type not in (IPV4_PREFIX, IPV6_PREFIX, ROUTER_KEY) or not started:
+                raise await self._error(UNSUPPORTED_PDU_TYPE if pdu_type > ASPA_PDU else CORRUPT_DATA, pdu,
+                                        f'unexpected PDU type {pdu_type}')
+
+    # Applies the changes of one response to the local cache and the ASPA object
+    def _apply(self, pending, reset):
+        if reset:
+            for customer in self.records:
+                pending.setdefault(customer, None)
+        changed = {customer: providers for customer, providers in pending.items()
+                   if self.records.get(customer, None) != providers}
+        for customer, providers in changed.items():
+            if providers is None:
+                del self.records[customer]
+            else:
+                self.records[customer] = providers
+
+        if self.atomic:
+            aspa_records = dict(self.aspa.aspa_records.items())
+            for afi in self.afis:
+                aspa_records[afi] = dict(self.records)
+            return self.aspa.swap_records(aspa_records, {afi: changed for afi in self.afis})
+
+        added = {customer: providers for customer, providers in changed.items() if providers is not None}
+        removed = [customer for customer, providers in changed.items() if providers is None]
+        return self.aspa.apply_delta({afi: added for afi in self.afis}, {afi: removed for afi in self.afis})
+
+    # Sends an Error Report for pdu, closes the connection and returns the RTRError to raise
+    async def _error(self, code, pdu, text):
+        try:
+            self.writer.write(error_report_pdu(code, bytes(pdu), text))
+            await self.writer.drain()
+        finally:
+            self.serial = None
+            await self.close()
+        return RTRError(code, text, bytes(pdu))
+
+    # Next (type, header field, PDU bytes), read from the connection in large chunks
+    async def _next_pdu(self):
+        while not self.pdus:
+            data = await self.reader.read(1 << 16)
+            if not data:
+                raise RTRError(CORRUPT_DATA, 'connection closed by the cache')
+            self.buffer += data
+            self._parse_buffer()
+        pdu_type, field, pdu = self.pdus.popleft()
+        if pdu_type is None:
+            # an erroneous Error Report is not answered with another one
+            if pdu[1] == ERROR_REPORT:
+                await self.close()
+                raise field
+            raise await self._error(field.code, pdu, field.text)
+        return pdu_type, field, pdu
+
+    # Queues the complete PDUs of the buffer; a malformed one is queued as (None, RTRError, PDU bytes)
+    # and ends the parsing, the PDUs before it are still handled first
+    def _parse_buffer(self):
+        buffer, offset = self.buffer, 0
+        while len(buffer) - offset >= PDU_HEADER.size:
+            version, pdu_type, field, length = PDU_HEADER.unpack_from(buffer, offset)
+            if version != RTR_VERSION:
+                error = RTRError(UNSUPPORTED_PROTOCOL_VERSION, f'PDU of protocol version {version}')
+            elif length < PDU_HEADER.size:
+                error = RTRError(CORRUPT_DATA, f'PDU length {length}')
+            elif len(buffer) - offset < length:
+                break
+            elif (PDU_LENGTHS.get(pdu_type, length) != length or length < PDU_MIN_LENGTHS.get(pdu_type, 0)
+                  or pdu_type == ASPA_PDU and length % 4):
+                error = RTRError(CORRUPT_DATA, f'PDU type {pdu_type} of length {length}')
+            else:
+                self.pdus.append((pdu_type, field, buffer[offset:offset + length]))
+                offset += length
+                continue
+
+            pdu = bytes(buffer[offset:offset + max(min(length, len(buffer) - offset), PDU_HEADER.size)])
+            self.pdus.append((None, error, pdu))
+            break
+        del buffer[:offset]
+
+
+# Stand-in RTR cache for tests and benchmarks: answers each query with the response of the next
+# recorded (query, response) exchange, both raw PDU bytes, across all connections. An unexpected
+# query gets an Invalid Request Error Report and the connection is closed.
+class RTRReplayServer:
+    def __init__(self, exchanges):
+        self.exchanges = deque(exchanges)
+        # the queries and Error Reports received
+        self.received = []
+        self.server = None
+        self.port = None
+        self.writers = []
+        self.tasks = []
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self._serve, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        for writer in self.writers:
+            writer.close()
+        self.server.close()
+        await asyncio.gather(*self.tasks)
+        await self.server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def notify(self, session_id, serial):
+        for writer in self.writers:
+            writer.write(serial_notify_pdu(session_id, serial))
+            await writer.drain()
+
+    async def _serve(self, reader, writer):
+        self.writers.append(writer)
+        self.tasks.append(asyncio.current_task())
+        try:
+            while True:
+                header = await reader.readexactly(PDU_HEADER.size)
+                _, pdu_type, _, length = PDU_HEADER.unpack(header)
+                pdu = header + await reader.readexactly(length - PDU_HEADER.size)
+                self.received.append(pdu)
+                if pdu_type == ERROR_REPORT:
+                    break
+                if not self.exchanges or self.exchanges[0][0] != pdu:
+                    writer.write(error_report_pdu(INVALID_REQUEST, pdu, 'unexpected query'))
+                    await writer.drain()
+                    break
+                writer.write(self.exchanges.popleft()[1])
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.remove(writer)
+            writer.close()
+
+
+async def _sync_time(aspa, exchanges, atomic):
+    async with RTRReplayServer(exchanges) as server:
+        async with RTRClient(aspa, '127.0.0.1', server.port, atomic=atomic) as client:
+            times = []
+            for _ in exchanges:
+                started = time.perf_counter()
+                await client.sync()
+                times.append(time.perf_counter() - started)
+    return times
+
+
+def delta_throughput(customer_count=100000, delta_sizes=(10000, 1000), seed=0):
+    rng = random.Random(seed)
+    asns = range(1, 4 * customer_count)
+    records = {customer: set(rng.sample(asns, rng.randint(1, 4))) for customer in rng.sample(asns, customer_count)}
+    session_id = 7
+    exchanges = [(reset_query_pdu(), cache_response(session_id, 1, records))]
+    for serial, delta_size in enumerate(delta_sizes, 1):
+        changed = rng.sample(sorted(records), delta_size)
+        withdrawn = changed[:delta_size // 10]
+        announced = {customer: set(rng.sample(asns, rng.randint(1, 4))) for customer in changed[delta_size // 10:]}
+        for customer in withdrawn:
+            del records[customer]
+        records.update(announced)
+        exchanges.append((serial_query_pdu(session_id, serial), cache_response(session_id, serial + 1, announced,
+                                                                                withdrawn)))
+
+    rows = []
+    in_place = asyncio.run(_sync_time(ASPA({}), exchanges, False))
+    atomic = asyncio.run(_sync_time(ASPA({}), exchanges, True))
+    for delta_size, in_place_time, atomic_time in zip((customer_count,) + tuple(delta_sizes), in_place, atomic):
+        rows.append((delta_size, delta_size / in_place_time, delta_size / atomic_time))
+    return rows
+
+
+if __name__ == '__main__':
+    customer_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('    delta   in place PDUs/s   atomic PDUs/s')
+    for delta_size, in_place, atomic in delta_throughput(customer_count):
+        print(f'{delta_size:9d} {in_place:17.0f} {atomic:15.0f}')
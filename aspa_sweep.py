@@ -0,0 +1,256 @@
+import multiprocessing
+import random
+import sys
+import time
+from array import array
+from itertools import islice
+
+from aspa_logic import *
+
+# Adoption scenario sweep: verifies one set of paths under many hypothetical ASPA adoption sets in a
+# single pass. aspa_records holds the record every AS would publish once it adopts ASPA and a scenario
+# is the set of customers that do. Scenario s is bit s of Python int masks: every customer has the mask
+# of the scenarios it adopts in, each distinct path is parsed into its hops once, and per hop the
+# masks of the scenarios where it is not provider+ or nA combine with and/or into the verdict masks of
+# all scenarios at once. Verdict counts are summed bit sliced (_BitCounter), so the scenario x verdict
+# matrix is only unpacked once at the end. Chunks of distinct paths are verified across a process pool.
+#
+# `python aspa_sweep.py [max_workers]` times the sweep of 200 scenarios per worker count against
+# ASPA.verify_many rerun per scenario, checking that both give the same matrix.
+
+
+# Per scenario counters packed into Python ints: bit s of planes[i] is bit i of the count of scenario s.
+class _BitCounter:
+    __slots__ = ('planes',)
+
+    def __init__(self):
+        self.planes = []
+
+    # adds weight to the count of every scenario in mask
+    def add(self, mask, weight=1):
+        planes = self.planes
+        plane = 0
+        while weight:
+            if weight & 1:
+                carry, index = mask, plane
+                while carry:
+                    while index >= len(planes):
+                        planes.append(0)
+                    planes[index], carry = planes[index] ^ carry, planes[index] & carry
+                    index += 1
+            weight >>= 1
+            plane += 1
+
+    def counts(self, scenario_count):
+        return [sum((plane >> scenario & 1) << index for index, plane in enumerate(self.planes))
+                for scenario in range(scenario_count)]
+
+
+# customer -> mask of the scenarios (iterables of customers) it adopts ASPA in, customers without
+# a record in aspa_records_afi never do
+def scenario_masks(scenarios, aspa_records_afi):
+    adoption = {}
+    for scenario, customers in enumerate(scenarios):
+        for customer in customers:
+            if customer in aspa_records_afi:
+                adoption[customer] = adoption.get(customer, 0) | 1 << scenario
+    return adoption
+
+
+# (hops as (as1, as2) origin first, AS_SET or confed segment present) of values[start:stop], the hops
+# the scans of ASPA check; shared by all scenarios
+def path_hops(values, types, start, stop):
+    hops = []
+    unverifiable = False
+    as1 = 0
+    for position in range(start, stop):
+        if types[position] != AS_SEQUENCE:
+            as1 = 0
+            unverifiable = True
+            continue
+        as2 = values[position]
+        if not as1:
+            as1 = as2
+        elif as1 != as2:
+            hops.append((as1, as2))
+            as1 = as2
+    return hops, unverifiable
+
+
+# Masks of the scenarios where the path is Valid, Invalid, Unknown and Unverifiable. A downflow path is
+# Invalid if a hop that is not provider+ upwards comes before one that is not provider+ downwards,
+# Unknown likewise with nA hops, the other directions with any such hop.
+def path_verdict_masks(hops, unverifiable, aspa_records_afi, adoption, all_scenarios, direction):
+    invalid = unknown = 0
+    if direction == Downflow:
+        forward_invalid = forward_not_valid = 0
+        for as1, as2 in hops:
+            up = adoption.get(as1, 0)
+            if up and as2 in aspa_records_afi[as1]:
+                up_invalid = 0
+            else:
+                up_invalid = up
+            down = adoption.get(as2, 0)
+            if down and as1 in aspa_records_afi[as2]:
+                down_invalid = 0
+            else:
+                down_invalid = down
+            invalid |= forward_invalid & down_invalid
+            unknown |= forward_not_valid & (down_invalid | all_scenarios ^ down)
+            forward_invalid |= up_invalid
+            forward_not_valid |= up_invalid | all_scenarios ^ up
+    else:
+        for as1, as2 in hops:
+            up = adoption.get(as1, 0)
+            if up and as2 not in aspa_records_afi[as1]:
+                invalid |= up
+            unknown |= all_scenarios ^ up
+
+    unverifiable = all_scenarios & ~invalid if unverifiable else 0
+    unknown &= ~(invalid | unverifiable)
+    return all_scenarios & ~(invalid | unverifiable | unknown), invalid, unknown, unverifiable
+
+
+# [[Valid, Invalid, Unknown, Unverifiable] count per scenario] of a PathBatch with a weight per path
+def sweep_batch(batch, weights, neighbor_as, direction, aspa_records_afi, adoption, scenario_count):
+    all_scenarios = (1 << scenario_count) - 1
+    counters = [_BitCounter() for _ in range(4)]
+    values, types, offsets = batch.values, batch.types, batch.offsets
+    for index in range(len(offsets) - 1):
+        start, stop = offsets[index], offsets[index + 1]
+        if start == stop or direction != IXflow and types[stop - 1] == AS_SEQUENCE and values[stop - 1] != neighbor_as:
+            counters[Invalid].add(all_scenarios, weights[index])
+            continue
+        hops, unverifiable = path_hops(values, types, start, stop)
+        for verdict, mask in enumerate(path_verdict_masks(hops, unverifiable, aspa_records_afi, adoption,
+                                                          all_scenarios, direction)):
+            if mask:
+                counters[verdict].add(mask, weights[index])
+
+    columns = [counter.counts(scenario_count) for counter in counters]
+    return [list(row) for row in zip(*columns)]
+
+
+_worker_state = None
+
+
+def _init_worker(aspa_records_afi, adoption, scenario_count):
+    global _worker_state
+    _worker_state = (aspa_records_afi, adoption, scenario_count)
+
+
+def _sweep_chunk(task):
+    batch, weights, neighbor_as, direction = task
+    return sweep_batch(batch, weights, neighbor_as, direction, *_worker_state)
+
+
+def _path_columns(paths):
+    if isinstance(paths, PathBatch):
+        values, types, offsets = paths.values, paths.types, paths.offsets
+        for index in range(len(paths)):
+            yield values[offsets[index]:offsets[index + 1]], types[offsets[index]:offsets[index + 1]]
+        return
+    for aspath in paths:
+        if isinstance(aspath, CanonicalPath):
+            yield aspath.values, aspath.types
+        else:
+            yield array('I', [segment.value for segment in aspath]), array('B', [segment.type for segment in aspath])
+
+
+# distinct paths of Segment lists, CanonicalPaths or a PathBatch in chunks of (PathBatch, weights)
+def _distinct_chunks(paths, chunk_size):
+    weights = {}
+    for path_values, path_types in _path_columns(paths):
+        key = (path_values.tobytes(), path_types.tobytes())
+        weights[key] = weights.get(key, 0) + 1
+
+    keys = iter(weights)
+    while chunk := list(islice(keys, chunk_size)):
+        batch = PathBatch()
+        for values_bytes, types_bytes in chunk:
+            batch.values.frombytes(values_bytes)
+            batch.types.frombytes(types_bytes)
+            batch.offsets.append(len(batch.values))
+        yield batch, array('Q', [weights[key] for key in chunk])
+
+
+# Scenario x verdict matrix of paths (Segment lists, CanonicalPaths or a PathBatch) learned from
+# neighbor_as: [[Valid, Invalid, Unknown, Unverifiable] path count] per scenario, where scenario s
+# is the set of customers in scenarios[s] publishing their record of aspa_records[afi]. Identical
+# paths are verified once; workers=0 sweeps in the calling process.
+def sweep(aspa_records, scenarios, paths, neighbor_as, afi, direction, workers=None, chunk_size=4096):
+    scenarios = list(scenarios)
+    aspa_records_afi = aspa_records.get(afi, None) or {}
+    adoption = scenario_masks(scenarios, aspa_records_afi)
+    # only the records of adopting customers are looked up
+    aspa_records_afi = {customer: aspa_records_afi[customer] for customer in adoption}
+
+    matrix = [[0] * 4 for _ in scenarios]
+    tasks = ((batch, weights, neighbor_as, direction) for batch, weights in _distinct_chunks(paths, chunk_size))
+    if workers == 0:
+        results = (sweep_batch(batch, weights, neighbor_as, direction, aspa_records_afi, adoption, len(scenarios))
+                   for batch, weights, neighbor_as, direction in tasks)
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, (aspa_records_afi, adoption, len(scenarios)))
+        results = pool.imap_unordered(_sweep_chunk, tasks)
+
+    try:
+        for chunk_matrix in results:
+            for row, chunk_row in zip(matrix, chunk_matrix):
+                for verdict, count in enumerate(chunk_row):
+                    row[verdict] += count
+    finally:
+        if workers != 0:
+            pool.close()
+            pool.join()
+    return matrix
+
+
+def _serial_matrix(aspa_records, scenarios, batch, neighbor_as, afi, direction):
+    matrix = []
+    for customers in scenarios:
+        aspa = ASPA({afi: {customer: aspa_records[afi][customer] for customer in customers
+                           if customer in aspa_records[afi]}})
+        row = [0] * 4
+        for verdict in aspa.verify_many(batch, neighbor_as, afi, direction):
+            row[verdict] += 1
+        matrix.append(row)
+    return matrix
+
+
+def sweep_benchmark(path_count=200000, asn_count=80000, transit_count=3000, scenario_count=200, max_workers=None,
+                    serial_scenarios=3, seed=0):
+    rng = random.Random(seed)
+    asns = rng.sample(range(1, 400000), asn_count)
+    transits, neighbor_as = asns[:transit_count], asns[-1]
+    aspa_records = {IPv4: {customer: set(rng.sample(transits, rng.randint(1, 3))) - {customer} or {transits[0]}
+                           for customer in asns}}
+    batch = PathBatch.from_paths([Segment(rng.choice(asns), AS_SEQUENCE)]
+                                 + [Segment(transits[int(transit_count ** rng.random()) - 1], AS_SEQUENCE)
+                                    for _ in range(rng.randint(1, 4))] + [Segment(neighbor_as, AS_SEQUENCE)]
+                                 for _ in range(path_count))
+    scenarios = [transits[:top] for top in range(10, 10 * (scenario_count // 2) + 1, 10)]
+    scenarios += [rng.sample(asns, int(share * asn_count))
+                  for share in (index / scenario_count for index in range(1, scenario_count - len(scenarios) + 1))]
+
+    started = time.perf_counter()
+    expected = _serial_matrix(aspa_records, scenarios[::len(scenarios) // serial_scenarios][:serial_scenarios],
+                              batch, neighbor_as, IPv4, Downflow)
+    serial_seconds = (time.perf_counter() - started) / serial_scenarios
+
+    rows = []
+    for workers in range(0, (max_workers or multiprocessing.cpu_count()) + 1):
+        started = time.perf_counter()
+        matrix = sweep(aspa_records, scenarios, batch, neighbor_as, IPv4, Downflow, workers)
+        rows.append((workers, time.perf_counter() - started))
+        if matrix[::len(scenarios) // serial_scenarios][:serial_scenarios] != expected:
+            raise AssertionError('sweep differs from the serial verification')
+    return rows, serial_seconds, len(scenarios)
+
+
+if __name__ == '__main__':
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    rows, serial_seconds, scenario_count = sweep_benchmark(max_workers=max_workers)
+    print('workers  sweep s  serial s per scenario  serial s for all')
+    for workers, seconds in rows:
+        print(f'{workers:7d} {seconds:8.2f} {serial_seconds:22.2f} {serial_seconds * scenario_count:17.0f}')
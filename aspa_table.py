@@ -0,0 +1,305 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+# Snapshot file: header (magic, version, reserved, number of AFIs), one (afi, customers, providers)
+# entry per AFI, then per AFI the customers, offsets and providers as little endian uint32.
+SNAPSHOT_MAGIC = b'ASPA'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHHI')
+SNAPSHOT_AFI_ENTRY = struct.Struct('<III')
+SNAPSHOT_OFFSET = struct.Struct('<I')
+
+
+# Shares one frozenset between all customers and AFIs with the same providers. Many customers list
+# the same few transit providers and the AFIs of one customer usually have identical records, so
+# a table holds far fewer distinct provider sets than records. Lookups behave as with the sets.
+# `python aspa_table.py` reports the dedupe ratio and memory saved on a generated table.
+class ProviderSetInterner:
+    __slots__ = ('sets',)
+
+    def __init__(self):
+        self.sets = {}
+
+    def intern(self, providers):
+        providers = frozenset(providers)
+        return self.sets.setdefault(providers, providers)
+
+    def __len__(self):
+        return len(self.sets)
+
+
+# Interns the provider sets of a dict aspa_records in place and returns provider_set_report
+def intern_provider_sets(aspa_records, interner=None):
+    interner = interner if interner is not None else ProviderSetInterner()
+    for aspa_records_afi in aspa_records.values():
+        for customer, providers in aspa_records_afi.items():
+            aspa_records_afi[customer] = interner.intern(providers)
+    return provider_set_report(aspa_records)
+
+
+def _provider_set_size(providers):
+    # ints from -5 to 256 are cached by CPython and not owned by the set
+    return sys.getsizeof(providers) + sum(sys.getsizeof(provider) for provider in providers
+                                          if not -5 <= provider <= 256)
+
+
+# Records, distinct provider set objects, records per object and the bytes of the provider sets
+# (with their ints) of a dict aspa_records, bytes_saved compared to one object per record
+def provider_set_report(aspa_records):
+    records, sizes = 0, {}
+    unshared_bytes = 0
+    for aspa_records_afi in aspa_records.values():
+        for providers in aspa_records_afi.values():
+            records += 1
+            size = sizes.get(id(providers), None)
+            if size is None:
+                size = sizes[id(providers)] = _provider_set_size(providers)
+            unshared_bytes += size
+    shared_bytes = sum(sizes.values())
+    return {'records': records, 'provider_sets': len(sizes),
+            'dedupe_ratio': records / len(sizes) if sizes else 1.0,
+            'bytes': shared_bytes, 'bytes_saved': unshared_bytes - shared_bytes}
+
+
+# Providers of one customer: a slice of the flat, per customer sorted provider array.
+class ProviderView:
+    __slots__ = ('providers', 'start', 'stop')
+
+    def __init__(self, providers, start, stop):
+        self.providers, self.start, self.stop = providers, start, stop
+
+    def __contains__(self, provider):
+        index = bisect_left(self.providers, provider, self.start, self.stop)
+        return index < self.stop and self.providers[index] == provider
+
+    def __iter__(self):
+        return iter(self.providers[self.start:self.stop])
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+# ASPA records of one AFI packed into three uint32 buffers: sorted customers, offsets into the
+# flat provider array (len(customers) + 1 entries) and the providers of each customer in sorted order.
+# Behaves like the customer -> providers dict of aspa_records for ASPA.verify_pair and
+# like the ASPAObject of definitions._hop.
+class FrozenAFITable:
+    __slots__ = ('customers', 'offsets', 'providers')
+
+    def __init__(self, customers, offsets, providers):
+        self.customers, self.offsets, self.providers = customers, offsets, providers
+
+    @classmethod
+    def build(cls, aspa_records_afi):
+        customers, offsets, providers = array('I'), array('I', [0]), array('I')
+        for customer in sorted(aspa_records_afi):
+            customers.append(customer)
+            providers.extend(sorted(set(aspa_records_afi[customer])))
+            offsets.append(len(providers))
+        return cls(customers, offsets, providers)
+
+    # From columns in arrival order, e.g. of a streaming loader: customers may be unsorted and repeated,
+    # the providers of a repeated customer are merged
+    @classmethod
+    def from_columns(cls, customers, offsets, providers):
+        order = sorted(range(len(customers)), key=customers.__getitem__)
+        table_customers, table_offsets, table_providers = array('I'), array('I', [0]), array('I')
+        position = 0
+        while position < len(order):
+            index = order[position]
+            customer, customer_providers = customers[index], providers[offsets[index]:offsets[index + 1]]
+            position += 1
+            if position < len(order) and customers[order[position]] == customer:
+                customer_providers = set(customer_providers)
+                while position < len(order) and customers[order[position]] == customer:
+                    index = order[position]
+                    customer_providers.update(providers[offsets[index]:offsets[index + 1]])
+                    position += 1
+            table_customers.append(customer)
+            table_providers.extend(sorted(customer_providers))
+            table_offsets.append(len(table_providers))
+        return cls(table_customers, table_offsets, table_providers)
+
+    def _find(self, customer):
+        index = bisect_left(self.customers, customer)
+        if index < len(self.customers) and self.customers[index] == customer:
+            return index
+        return -1
+
+    def get(self, customer, default=None):
+        index = self._find(customer)
+        if index < 0:
+            return default
+        return ProviderView(self.providers, self.offsets[index], self.offsets[index + 1])
+
+    def __getitem__(self, customer):
+        providers = self.get(customer)
+        if providers is None:
+            raise KeyError(customer)
+        return providers
+
+    def __contains__(self, customer):
+        return self._find(customer) >= 0
+
+    def __iter__(self):
+        return iter(self.customers)
+
+    def __len__(self):
+        return len(self.customers)
+
+    def items(self):
+        for index, customer in enumerate(self.customers):
+            yield customer, ProviderView(self.providers, self.offsets[index], self.offsets[index + 1])
+
+    def thaw(self):
+        return {customer: set(providers) for customer, providers in self.items()}
+
+    def nbytes(self):
+        return sum(buffer.itemsize * len(buffer) for buffer in (self.customers, self.offsets, self.providers))
+
+
+# Immutable replacement for the afi -> customer -> providers dict given to ASPA.
+class FrozenASPATable:
+    __slots__ = ('tables', 'mapping')
+
+    def __init__(self, tables, mapping=None):
+        self.tables = tables
+        self.mapping = mapping
+
+    @classmethod
+    def build(cls, aspa_records):
+        return cls({afi: FrozenAFITable.build(aspa_records_afi) for afi, aspa_records_afi in aspa_records.items()})
+
+    def get(self, afi, default=None):
+        return self.tables.get(afi, default)
+
+    def __getitem__(self, afi):
+        return self.tables[afi]
+
+    def __contains__(self, afi):
+        return afi in self.tables
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def items(self):
+        return self.tables.items()
+
+    def thaw(self):
+        return {afi: table.thaw() for afi, table in self.tables.items()}
+
+    def nbytes(self):
+        return sum(table.nbytes() for table in self.tables.values())
+
+    # Maps a snapshot written by write_snapshot read-only, the tables are views into the shared pages.
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as snapshot:
+            mapping = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            return cls(_snapshot_tables(mapping, path), mapping)
+        except Exception:
+            mapping.close()
+            raise
+
+
+# afi -> FrozenAFITable over the buffers of a mapped snapshot, after checking the counts of its header
+# against the size of the file and the offsets against the providers
+def _snapshot_tables(mapping, path):
+    if len(mapping) < SNAPSHOT_HEADER.size:
+        raise ValueError(f'{path} is not an ASPA snapshot')
+    magic, version, _, afi_count = SNAPSHOT_HEADER.unpack_from(mapping, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f'{path} is not an ASPA snapshot')
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f'{path} has snapshot version {version}, expected {SNAPSHOT_VERSION}')
+
+    position = SNAPSHOT_HEADER.size + afi_count * SNAPSHOT_AFI_ENTRY.size
+    if len(mapping) < position:
+        raise ValueError(f'{path} is truncated')
+    entries = [SNAPSHOT_AFI_ENTRY.unpack_from(mapping, SNAPSHOT_HEADER.size + index * SNAPSHOT_AFI_ENTRY.size)
+               for index in range(afi_count)]
+    size = position + sum(4 * (2 * customer_count + 1 + provider_count) for _, customer_count, provider_count in entries)
+    if len(mapping) != size:
+        raise ValueError(f'{path} has {len(mapping)} bytes, its header describes {size}')
+
+    # the last offset of each AFI, checked before any view on the mapping exists so it can be closed
+    offsets_end = position
+    for afi, customer_count, provider_count in entries:
+        last_offset, = SNAPSHOT_OFFSET.unpack_from(mapping, offsets_end + 8 * customer_count)
+        if last_offset != provider_count:
+            raise ValueError(f'{path}: the offsets of AFI {afi} do not end at its {provider_count} providers')
+        offsets_end += 4 * (2 * customer_count + 1 + provider_count)
+
+    view = memoryview(mapping)
+    tables = {}
+    for afi, customer_count, provider_count in entries:
+        buffers = []
+        for count in (customer_count, customer_count + 1, provider_count):
+            buffers.append(_uint32_view(view, position, count))
+            position += 4 * count
+        tables[afi] = FrozenAFITable(*buffers)
+    return tables
+
+
+def _uint32_view(view, position, count):
+    if sys.byteorder == 'little':
+        return view[position:position + 4 * count].cast('I')
+    buffer = array('I')
+    buffer.frombytes(view[position:position + 4 * count])
+    buffer.byteswap()
+    return buffer
+
+
+# Writes aspa_records (dict or FrozenASPATable) as a snapshot for FrozenASPATable.open. The file is
+# replaced atomically, so processes that already mapped the previous snapshot keep a consistent view.
+def write_snapshot(aspa_records, path):
+    if not isinstance(aspa_records, FrozenASPATable):
+        aspa_records = FrozenASPATable.build(aspa_records)
+
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as snapshot:
+        snapshot.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(aspa_records.tables)))
+        for afi, table in aspa_records.items():
+            snapshot.write(SNAPSHOT_AFI_ENTRY.pack(afi, len(table.customers), len(table.providers)))
+        for table in aspa_records.tables.values():
+            for buffer in (table.customers, table.offsets, table.providers):
+                buffer = array('I', buffer)
+                if sys.byteorder != 'little':
+                    buffer.byteswap()
+                snapshot.write(buffer.tobytes())
+    os.replace(temporary_path, path)
+
+
+def _interning_savings(customer_count=80000, transit_count=3000, seed=0):
+    import random
+    import tracemalloc
+
+    rng = random.Random(seed)
+    transits = rng.sample(range(1000, 400000), transit_count)
+    # a few transit providers are listed by most customers, rank r with a probability of about 1 / r
+    aspa_records = {4: {}, 6: {}}
+    tracemalloc.start()
+    for customer in rng.sample(range(400000, 4200000000), customer_count):
+        providers = {transits[int(transit_count ** rng.random()) - 1]
+                     for _ in range(rng.choice((1, 1, 2, 2, 2, 3, 4)))}
+        aspa_records[4][customer] = providers
+        aspa_records[6][customer] = set(providers) if rng.random() < 0.9 else providers | {rng.choice(transits)}
+    before = tracemalloc.get_traced_memory()[0]
+    report = intern_provider_sets(aspa_records)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return report, before - after
+
+
+if __name__ == '__main__':
+    report, traced_saving = _interning_savings()
+    print(f'{report["records"]} records, {report["provider_sets"]} provider sets, '
+          f'dedupe ratio {report["dedupe_ratio"]:.1f}')
+    print(f'provider set bytes {report["bytes"] + report["bytes_saved"]} -> {report["bytes"]}, '
+          f'traced memory freed by interning {traced_saving}')
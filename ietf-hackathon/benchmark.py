@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import config
+from definitions import *
+from simplified import *
+from simplified2 import *
+from draft import *
+from optimized import *
+from optimizedZeroBased import *
+from fastpath import verify_downstream, verify_upstream
+from pathtrie import ASPathTrie
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import aspa_logic
+
+try:
+    from vectorized import NumpyASPATable, verifyASPathRagged
+except ImportError:
+    NumpyASPATable = None
+
+# Benchmark of all AS_PATH verification implementations on synthetic ASPA sets and
+# AS_PATH distributions. Prints a table and optionally writes the results as JSON
+# (--json) so that runs of different versions can be compared.
+
+IMPLS: Dict[str, Callable] = {
+    "draft-16": verifyASPathDraft16,
+    "optimized": verifyASPathOptimized,
+    "optimized0": verifyASPathOptimizedZeroBased,
+    "simplified": verifyASPathSimplified,
+    "simplified2": verifyASPathSimplified2,
+}
+
+DISTRIBUTIONS = ["valley-free", "shared-origin", "leak", "prepend", "as-set", "long"]
+
+# A generated AS_PATH: (ASN, segment type) pairs, latest AS first like ASPath
+GeneratedPath: TypeAlias = List[Tuple[int, int]]
+
+
+class Topology:
+    # Tier-1s have no providers, transits have Tier-1 providers or transit providers
+    # with a smaller ASN (half of them each), stubs have transit providers.
+    def __init__(self, rng: random.Random, tier1Count: int, transitCount: int, stubCount: int):
+        self.tier1s = list(range(1, tier1Count + 1))
+        self.transits = list(range(1000, 1000 + transitCount))
+        self.stubs = list(range(100000, 100000 + stubCount))
+        self.providers: Dict[int, List[int]] = {asn: [] for asn in self.tier1s}
+        for index, asn in enumerate(self.transits):
+            providers = {rng.choice(self.tier1s if index == 0 or rng.random() < 0.5 else self.transits[:index])
+                         for _ in range(rng.randint(1, 3))}
+            self.providers[asn] = sorted(providers)
+        for asn in self.stubs:
+            self.providers[asn] = rng.sample(self.transits, rng.randint(1, 3))
+
+    # ASPA for a random share of all ASes, plus every Tier-1 with an empty provider set
+    def aspa(self, rng: random.Random, adoption: float) -> ASPAObject:
+        aspa = {asn: [] for asn in self.tier1s}
+        for asn in self.transits + self.stubs:
+            if rng.random() < adoption:
+                aspa[asn] = list(self.providers[asn])
+        return aspa
+
+    # Customer to provider chain from asn up to a Tier-1, asn first
+    def upChain(self, rng: random.Random, asn: int) -> List[int]:
+        chain = [asn]
+        while self.providers[chain[-1]]:
+            chain.append(rng.choice(self.providers[chain[-1]]))
+        return chain
+
+    # Origin climbs to a Tier-1, may cross to a peer Tier-1, then descends to the neighbor
+    def valleyFree(self, rng: random.Random, origins: List[int] = None) -> List[int]:
+        up = self.upChain(rng, rng.choice(origins or self.stubs))
+        down = self.upChain(rng, rng.choice(self.stubs + self.transits))
+        if up[-1] == down[-1]:
+            down.pop()
+        path = down + list(reversed(up))
+        return _dedupe(path)
+
+    def path(self, rng: random.Random, distribution: str) -> GeneratedPath:
+        if distribution == "valley-free":
+            return [(asn, aspa_logic.AS_SEQUENCE) for asn in self.valleyFree(rng)]
+
+        if distribution == "shared-origin":
+            # full table view: many neighbors see the same 50 origins
+            return [(asn, aspa_logic.AS_SEQUENCE) for asn in self.valleyFree(rng, self.stubs[:50])]
+
+        if distribution == "leak":
+            # The AS at the neighbor end re-announces the route to its providers
+            path = self.valleyFree(rng)
+            leak = list(reversed(self.upChain(rng, path[0])[1:3]))
+            return [(asn, aspa_logic.AS_SEQUENCE) for asn in _dedupe(leak + path)]
+
+        if distribution == "prepend":
+            path = []
+            for asn in self.valleyFree(rng):
+                path.extend([(asn, aspa_logic.AS_SEQUENCE)] * (rng.randint(2, 4) if rng.random() < 0.3 else 1))
+            return path
+
+        if distribution == "as-set":
+            path = [(asn, aspa_logic.AS_SEQUENCE) for asn in self.valleyFree(rng)]
+            return path + [(asn, aspa_logic.AS_SET) for asn in rng.sample(self.stubs, 2)]
+
+        if distribution == "long":
+            return [(asn, aspa_logic.AS_SEQUENCE)
+                    for asn in _dedupe(rng.choices(self.transits + self.tier1s, k=rng.randint(15, 30)))]
+
+        raise ValueError(f"Unknown path distribution {distribution}")
+
+
+def _dedupe(path: List[int]) -> List[int]:
+    return [asn for index, asn in enumerate(path) if index == 0 or path[index - 1] != asn]
+
+
+# Runs impl over all paths: returns (seconds, (hop lookups, repeated lookups), peak traced bytes)
+def _measure(run: Callable[[], None], countLookups: Callable[[], Tuple[int, int]]) -> Tuple[float, Tuple[int, int], int]:
+    started = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - started
+
+    lookups = countLookups()
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, lookups, peak
+
+
+def _hackathonRunner(impl: Callable, aspa: ASPAObject, paths: List[ASPath], direction: ASPADirection):
+    def run():
+        for path in paths:
+            impl(aspa, path, direction)
+
+    def countLookups() -> Tuple[int, int]:
+        config.instrumentation = HopCounter()
+        try:
+            run()
+            stats = next(iter(config.instrumentation.stats.values()))
+            return stats.hops, stats.repeatedHops
+        finally:
+            config.instrumentation = None
+
+    return run, countLookups
+
+
+def _aspaLogicRunner(aspa: ASPAObject, paths: List[GeneratedPath], direction: ASPADirection):
+    manager = aspa_logic.ASPA({aspa_logic.IPv4: {asn: set(providers) for asn, providers in aspa.items()}})
+    check = manager.check_downflow_path if direction == ASPADirection.DOWNSTREAM else manager.check_upflow_path
+    segmentPaths = [[aspa_logic.Segment(asn, segmentType) for asn, segmentType in reversed(path)] for path in paths]
+
+    def run():
+        for segmentPath in segmentPaths:
+            check(segmentPath, segmentPath[-1].value, aspa_logic.IPv4)
+
+    # repeated lookups are not tracked by aspa_logic
+    def countLookups() -> Tuple[int, int]:
+        lookups = 0
+        verifyPair = manager._verify_pair
+
+        def countingVerifyPair(aspaRecordsAFI, as1, as2):
+            nonlocal lookups
+            lookups += 1
+            return verifyPair(aspaRecordsAFI, as1, as2)
+
+        manager._verify_pair = countingVerifyPair
+        try:
+            run()
+        finally:
+            del manager._verify_pair
+        return lookups, 0
+
+    return run, countLookups
+
+
+# dict counting the customer lookups of the fast path verifiers, one per hop
+class _CountingASPA(dict):
+    lookups = 0
+
+    def get(self, asn, default=None):
+        _CountingASPA.lookups += 1
+        return dict.get(self, asn, default)
+
+
+def _fastpathRunner(aspa: ASPAObject, paths: List[ASPath], direction: ASPADirection):
+    verify = verify_downstream if direction == ASPADirection.DOWNSTREAM else verify_upstream
+    tuplePaths = [tuple(path) for path in paths]
+
+    def run():
+        for path in tuplePaths:
+            verify(aspa, path)
+
+    def countLookups() -> Tuple[int, int]:
+        countingASPA = _CountingASPA(aspa)
+        _CountingASPA.lookups = 0
+        for path in tuplePaths:
+            verify(countingASPA, path)
+        return _CountingASPA.lookups, 0
+
+    return run, countLookups
+
+
+# Inserts all paths into a fresh trie, the time includes building it
+def _trieRunner(aspa: ASPAObject, paths: List[ASPath], direction: ASPADirection):
+    def run() -> ASPathTrie:
+        trie = ASPathTrie(aspa)
+        for path in paths:
+            trie.result(trie.insert(path), direction)
+        return trie
+
+    return run, lambda: (run().hopLookups, 0)
+
+
+def _vectorizedRunner(aspa: ASPAObject, paths: List[ASPath], direction: ASPADirection):
+    table = NumpyASPATable.fromASPA(aspa)
+    values = [asn for path in paths for asn in path]
+    offsets = [0]
+    for path in paths:
+        offsets.append(offsets[-1] + len(path))
+
+    def run():
+        verifyASPathRagged(table, values, offsets, direction)
+
+    # every hop is evaluated once per direction
+    hopsPerDirection = sum(len(path) - 1 for path in paths)
+    return run, lambda: (hopsPerDirection * (2 if direction == ASPADirection.DOWNSTREAM else 1), 0)
+
+
+def runBenchmark(pathCount: int = 20000, adoption: float = 0.2, tier1Count: int = 15, transitCount: int = 2000,
+                 stubCount: int = 20000, seed: int = 0, distributions: List[str] = DISTRIBUTIONS,
+                 impls: List[str] = None) -> dict:
+    config.instrumentation = None
+    rng = random.Random(seed)
+    topology = Topology(rng, tier1Count, transitCount, stubCount)
+    aspa = topology.aspa(rng, adoption)
+    impls = impls or list(IMPLS) + ["fastpath", "trie", "aspa_logic"] + (["vectorized"] if NumpyASPATable is not None else [])
+
+    results = []
+    for distribution in distributions:
+        paths = [topology.path(rng, distribution) for _ in range(pathCount)]
+        hasSets = any(segmentType != aspa_logic.AS_SEQUENCE for path in paths for _, segmentType in path)
+        asPaths = [[asn for asn, _ in path] for path in paths]
+        meanLength = sum(len(path) for path in paths) / len(paths)
+
+        for direction in ASPADirection:
+            for implID in impls:
+                if implID == "aspa_logic":
+                    run, countLookups = _aspaLogicRunner(aspa, paths, direction)
+                elif hasSets:
+                    # the list of ASNs of ASPath can't express AS_SETs
+                    continue
+                elif implID == "fastpath":
+                    run, countLookups = _fastpathRunner(aspa, asPaths, direction)
+                elif implID == "trie":
+                    run, countLookups = _trieRunner(aspa, asPaths, direction)
+                elif implID == "vectorized":
+                    run, countLookups = _vectorizedRunner(aspa, asPaths, direction)
+                else:
+                    run, countLookups = _hackathonRunner(IMPLS[implID], aspa, asPaths, direction)
+
+                seconds, (lookups, repeatedLookups), peak = _measure(run, countLookups)
+                results.append({
+                    "impl": implID,
+                    "distribution": distribution,
+                    "direction": direction.name,
+                    "paths": len(paths),
+                    "meanPathLength": meanLength,
+                    "seconds": seconds,
+                    "pathsPerSecond": len(paths) / seconds,
+                    "hopLookupsPerPath": lookups / len(paths),
+                    "repeatedLookupsPerPath": repeatedLookups / len(paths),
+                    "peakTracedBytes": peak,
+                })
+
+    return {
+        "parameters": {
+            "paths": pathCount, "adoption": adoption, "tier1s": tier1Count, "transits": transitCount,
+            "stubs": stubCount, "seed": seed, "aspaRecords": len(aspa),
+        },
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+
+def printReport(report: dict):
+    print(f"{'impl':<12} {'distribution':<13} {'direction':<10} {'paths/s':>10} {'lookups/path':>12} "
+          f"{'repeated':>9} {'peak KiB':>9}")
+    for result in report["results"]:
+        print(f"{result['impl']:<12} {result['distribution']:<13} {result['direction']:<10} "
+              f"{result['pathsPerSecond']:>10.0f} {result['hopLookupsPerPath']:>12.2f} "
+              f"{result['repeatedLookupsPerPath']:>9.2f} {result['peakTracedBytes'] / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the AS_PATH verification implementations")
+    parser.add_argument("--paths", type=int, default=20000, help="AS_PATHs per distribution")
+    parser.add_argument("--adoption", type=float, default=0.2, help="share of non Tier-1 ASes with an ASPA")
+    parser.add_argument("--transits", type=int, default=2000)
+    parser.add_argument("--stubs", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--distributions", nargs="+", default=DISTRIBUTIONS, choices=DISTRIBUTIONS)
+    parser.add_argument("--impls", nargs="+", help="implementations to run, default all")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    report = runBenchmark(pathCount=args.paths, adoption=args.adoption, transitCount=args.transits,
+                          stubCount=args.stubs, seed=args.seed, distributions=args.distributions, impls=args.impls)
+    printReport(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
@@ -1 +1,3 @@
-enableDebugLogging = True
+# definitions.Instrumentation receiving the hops and log messages of the verification impls,
+# e.g. definitions.DebugLog() or definitions.HopCounter(), None disables it
+instrumentation = None
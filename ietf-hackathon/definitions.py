@@ -1,14 +1,33 @@
+import functools
+import time
+from array import array
 from enum import Enum
-from typing import List, Dict, TypeAlias
+from typing import List, Dict, Tuple, TypeAlias
 import config
 
 ASPAObject: TypeAlias = Dict[int, List[int]]
 ASPath: TypeAlias = List[int]
 
 
-def log(msg: str):
-    if config.enableDebugLogging:
-        print(msg)
+# Logs msg to config.instrumentation. The {} fields of msg are AS positions in asPath,
+# rendered by describeAS only when the message is printed.
+def log(msg: str, asPath: ASPath = None, *positions: int):
+    if config.instrumentation is not None:
+        config.instrumentation.message(msg, asPath, positions)
+
+
+def renderMessage(msg: str, asPath: ASPath, positions: Tuple[int, ...]) -> str:
+    if not positions:
+        return msg
+    return msg.format(*(describeAS(None, asPath, i, len(asPath)) for i in positions))
+
+
+# Returns asPath as an ASPath: lists and tuples as they are, objects with an as_path
+# attribute like aspa_logic.CanonicalPath as their prepend-collapsed AS_PATH
+def plainASPath(asPath) -> ASPath:
+    if isinstance(asPath, (list, tuple)):
+        return asPath
+    return getattr(asPath, "as_path", asPath)
 
 
 def inclusiveRange(start, stop):
@@ -50,8 +69,41 @@ class Hop(Enum):
     P = "P+"
 
 
+# Caches hop verdicts of one ASPAObject per (customer, provider) pair across paths, packed
+# into one dict keyed by customer << 32 | provider. invalidate() drops only the verdicts
+# of the customer whose ASPA changed.
+class HopCache:
+    def __init__(self, aspa: ASPAObject):
+        self.aspa = aspa
+        self.verdicts: Dict[int, Hop] = {}
+        self.customerProviders: Dict[int, List[int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def hop(self, customer: int, provider: int) -> Hop:
+        res = self.verdicts.get(customer << 32 | provider)
+        if res is not None:
+            self.hits += 1
+            return res
+
+        self.misses += 1
+        if customer not in self.aspa:
+            res = Hop.nA
+        elif provider in self.aspa[customer]:
+            res = Hop.P
+        else:
+            res = Hop.nP
+        self.verdicts[customer << 32 | provider] = res
+        self.customerProviders.setdefault(customer, []).append(provider)
+        return res
+
+    def invalidate(self, customer: int):
+        for provider in self.customerProviders.pop(customer, ()):
+            del self.verdicts[customer << 32 | provider]
+
+
 # 5. Hop Check Function
-def _hop(aspa: ASPAObject, asPath: ASPath, i: int, j: int, N: int):
+def _uncachedHop(aspa: ASPAObject, asPath: ASPath, i: int, j: int, N: int):
     if not (i >= 1 and i <= N and j >= 1 and j <= N):
         raise ValueError(f"Invalid AS_PATH ASN position: i={i} j={j}, must between 1 and N={N}")
     if asPath[N - i] not in aspa:
@@ -62,8 +114,209 @@ def _hop(aspa: ASPAObject, asPath: ASPath, i: int, j: int, N: int):
         return Hop.nP
 
 
-# Prints and returns AS index in AS_PATH and ASN
+def _cachedHop(aspa: ASPAObject, asPath: ASPath, i: int, j: int, N: int):
+    if not (i >= 1 and i <= N and j >= 1 and j <= N):
+        raise ValueError(f"Invalid AS_PATH ASN position: i={i} j={j}, must between 1 and N={N}")
+    if _hopCache.aspa is not aspa:
+        return _uncachedHop(aspa, asPath, i, j, N)
+    return _hopCache.hop(asPath[N - i], asPath[N - j])
+
+
+_hop = _uncachedHop
+_hopCache: HopCache = None
+
+
+# Makes hopAndLog consult hopCache for the ASPAObject it was created for, None disables it.
+# The hop function is picked here once rather than checked on every hop.
+def setHopCache(hopCache: HopCache):
+    global _hop, _hopCache
+    _hopCache = hopCache
+    _hop = _uncachedHop if hopCache is None else _cachedHop
+
+
+# Returns the hop and reports it to config.instrumentation
 def hopAndLog(aspa: ASPAObject, asPath: ASPath, i: int, j: int, N: int) -> Hop:
     res = _hop(aspa, asPath, i, j, N)
-    log(f"Hop {describeAS(aspa, asPath, i, N)} C->P {describeAS(aspa, asPath, j, N)} is {res.value}")
+    if config.instrumentation is not None:
+        config.instrumentation.hop(asPath, i, j, N, res)
     return res
+
+
+# Hooks called by the verification implementations while config.instrumentation is set.
+# All hooks do nothing, subclasses override the ones they need.
+class Instrumentation:
+    # A verifyASPath* impl starts verifying asPath, calls can nest
+    def begin(self, implID: str, asPath: ASPath, direction: ASPADirection):
+        pass
+
+    # The innermost running impl returned result, None if it raised
+    def end(self, result: ASPAVerificationResult):
+        pass
+
+    # hop(AS(i), AS(j)) was looked up
+    def hop(self, asPath: ASPath, i: int, j: int, N: int, res: Hop):
+        pass
+
+    # log(msg, asPath, *positions) was called
+    def message(self, msg: str, asPath: ASPath, positions: Tuple[int, ...]):
+        pass
+
+
+# Prints the log messages and hops, the former config.enableDebugLogging = True
+class DebugLog(Instrumentation):
+    def hop(self, asPath: ASPath, i: int, j: int, N: int, res: Hop):
+        print(f"Hop {describeAS(None, asPath, i, N)} C->P {describeAS(None, asPath, j, N)} is {res.value}")
+
+    def message(self, msg: str, asPath: ASPath, positions: Tuple[int, ...]):
+        print(renderMessage(msg, asPath, positions))
+
+
+# Records the events of the verification impls into a ring buffer of the last capacity
+# events without formatting anything. Hops fill preallocated columns, text is only
+# rendered by lines() / dump().
+class TraceBuffer(Instrumentation):
+    BEGIN, END, HOP, MESSAGE = range(4)
+    HOPS = (Hop.nA, Hop.nP, Hop.P)
+    HOP_CODES = {hop: code for code, hop in enumerate(HOPS)}
+
+    def __init__(self, capacity: int = 4096):
+        if capacity < 1:
+            raise ValueError("TraceBuffer capacity must be at least 1")
+        self.capacity = capacity
+        self.kinds = bytearray(capacity)
+        self.i = array("q", bytes(8 * capacity))
+        self.j = array("q", bytes(8 * capacity))
+        self.asnI = array("q", bytes(8 * capacity))
+        self.asnJ = array("q", bytes(8 * capacity))
+        self.verdicts = bytearray(capacity)
+        # (implID, direction), result or (msg, asPath, positions) of the other events
+        self.payloads: List[object] = [None] * capacity
+        # total number of events recorded, the next event goes to slot written % capacity
+        self.written = 0
+
+    def _next(self, kind: int) -> int:
+        slot = self.written % self.capacity
+        self.written += 1
+        self.kinds[slot] = kind
+        return slot
+
+    def begin(self, implID: str, asPath: ASPath, direction: ASPADirection):
+        self.payloads[self._next(self.BEGIN)] = (implID, direction)
+
+    def end(self, result: ASPAVerificationResult):
+        self.payloads[self._next(self.END)] = result
+
+    def hop(self, asPath: ASPath, i: int, j: int, N: int, res: Hop):
+        slot = self._next(self.HOP)
+        self.i[slot] = i
+        self.j[slot] = j
+        self.asnI[slot] = asPath[N - i]
+        self.asnJ[slot] = asPath[N - j]
+        self.verdicts[slot] = self.HOP_CODES[res]
+        self.payloads[slot] = None
+
+    def message(self, msg: str, asPath: ASPath, positions: Tuple[int, ...]):
+        self.payloads[self._next(self.MESSAGE)] = (msg, asPath, positions)
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def clear(self):
+        self.written = 0
+
+    # (kind, data) of the buffered events, oldest first. data is (i, j, asn_i, asn_j, Hop)
+    # for hops and the payload for the other events.
+    def events(self):
+        for index in range(self.written - len(self), self.written):
+            slot = index % self.capacity
+            kind = self.kinds[slot]
+            if kind == self.HOP:
+                yield kind, (self.i[slot], self.j[slot], self.asnI[slot], self.asnJ[slot],
+                             self.HOPS[self.verdicts[slot]])
+            else:
+                yield kind, self.payloads[slot]
+
+    # Hop events as (i, j, asn_i, asn_j, Hop), oldest first
+    def hops(self):
+        return [data for kind, data in self.events() if kind == self.HOP]
+
+    def lines(self):
+        for kind, data in self.events():
+            if kind == self.BEGIN:
+                yield f"==== {data[0]} {data[1].name} ===="
+            elif kind == self.END:
+                yield f"Returned {data.name if data is not None else 'no result'}"
+            elif kind == self.HOP:
+                i, j, asnI, asnJ, res = data
+                yield f"Hop #{i}:{asnI} C->P #{j}:{asnJ} is {res.value}"
+            else:
+                yield renderMessage(*data)
+
+    def dump(self, file=None):
+        for line in self.lines():
+            print(line, file=file)
+
+
+class ImplStats:
+    def __init__(self):
+        self.paths = 0
+        self.hops = 0
+        # lookups of an (i, j) hop already looked up for the same path
+        self.repeatedHops = 0
+        self.seconds = 0.0
+
+
+# Counts hop lookups, repeated (i, j) lookups and time per (implID, direction)
+class HopCounter(Instrumentation):
+    def __init__(self):
+        self.stats: Dict[Tuple[str, ASPADirection], ImplStats] = {}
+        # (stats, (i, j) hops seen, start time) of the running impls, innermost last
+        self._running: List[Tuple[ImplStats, set, float]] = []
+
+    def begin(self, implID: str, asPath: ASPath, direction: ASPADirection):
+        stats = self.stats.get((implID, direction))
+        if stats is None:
+            stats = self.stats[(implID, direction)] = ImplStats()
+        self._running.append((stats, set(), time.perf_counter()))
+
+    def end(self, result: ASPAVerificationResult):
+        stats, _, started = self._running.pop()
+        stats.paths += 1
+        stats.seconds += time.perf_counter() - started
+
+    def hop(self, asPath: ASPath, i: int, j: int, N: int, res: Hop):
+        if not self._running:
+            return
+        stats, seen, _ = self._running[-1]
+        stats.hops += 1
+        if (i, j) in seen:
+            stats.repeatedHops += 1
+        else:
+            seen.add((i, j))
+
+    def clear(self):
+        self.stats.clear()
+
+
+# Decorator reporting the begin and end of a verifyASPath* impl to config.instrumentation
+# and passing aspa_logic.CanonicalPath AS_PATHs on in their ASPath form.
+# Without instrumentation the only cost is the wrapper call.
+def instrumented(implID: str):
+    def decorate(verify):
+        @functools.wraps(verify)
+        def wrapper(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
+            asPath = plainASPath(asPath)
+            instrumentation = config.instrumentation
+            if instrumentation is None:
+                return verify(aspa, asPath, direction)
+            instrumentation.begin(implID, asPath, direction)
+            result = None
+            try:
+                result = verify(aspa, asPath, direction)
+                return result
+            finally:
+                instrumentation.end(result)
+
+        return wrapper
+
+    return decorate
@@ -4,11 +4,9 @@ from definitions import *
 
 # Performs draft-ietf-sidrops-aspa-verification-16 verification algorithm
 # on an AS_PATH
+@instrumented("draft-16")
 def verifyASPathDraft16(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
     # See citation at the end of the file
-    def describe(i: int):
-        return describeAS(aspa, asPath, i, N)
-
     def hop(i: int, j: int) -> Hop:
         return hopAndLog(aspa, asPath, i, j, N)
 
@@ -71,7 +69,7 @@ def verifyASPathDraft16(aspa: ASPAObject, asPath: ASPath, direction: ASPADirecti
                 u_min = u
                 break
 
-        log(f"u_min = {describe(u_min)}")
+        log("u_min = {}", asPath, u_min)
 
         # Find the highest value of v (N-1 ≥ v ≥ 1) for which
         # hop(AS(v+1), AS(v)) = "Not Provider+". Call it v_max.
@@ -82,7 +80,7 @@ def verifyASPathDraft16(aspa: ASPAObject, asPath: ASPath, direction: ASPADirecti
                 v_max = v
                 break
 
-        log(f"v_max = {describe(v_max)}")
+        log("v_max = {}", asPath, v_max)
 
         # If u_min ≤ v_max, then the procedure halts with the outcome "Invalid".
         # Else, continue.
@@ -0,0 +1,98 @@
+from definitions import *
+
+# Production verifiers of the draft-ietf-sidrops-aspa-verification-16 procedures,
+# one function per direction. AS_PATHs are int tuples (or lists) in the ASPath
+# order, i.e. the origin AS is the last element, or aspa_logic.CanonicalPath
+# objects, and the result is the int value of ASPAVerificationResult. aspa is any
+# mapping with get(customer) returning the providers or None, e.g. an ASPAObject
+# or aspa_table.FrozenAFITable.
+#
+# Hops are not materialized: a missing customer is nA, a provider in the set is
+# P+ and anything else is nP+, and each loop stops as soon as the outcome is known.
+
+UNKNOWN, INVALID, VALID = (ASPAVerificationResult.UNKNOWN.value, ASPAVerificationResult.INVALID.value,
+                           ASPAVerificationResult.VALID.value)
+
+
+# Section 6.1: Invalid on any nP+ hop, else Unknown on any nA hop, else Valid
+def verify_upstream(aspa, as_path) -> int:
+    as_path = plainASPath(as_path)
+    if not as_path:
+        raise ValueError("AS_PATH cannot have length zero")
+
+    get = aspa.get
+    unknown = False
+    # hop(AS(i-1), AS(i)): customer as_path[k], provider as_path[k - 1]
+    for k in range(len(as_path) - 1, 0, -1):
+        providers = get(as_path[k])
+        if providers is None:
+            unknown = True
+        elif as_path[k - 1] not in providers:
+            return INVALID
+
+    return UNKNOWN if unknown else VALID
+
+
+# Section 6.2.2, with u_min and K from one scan from the origin and v_max and L
+# from one scan from the neighbor AS
+def verify_downstream(aspa, as_path) -> int:
+    as_path = plainASPath(as_path)
+    N = len(as_path)
+    if N <= 2:
+        if N == 0:
+            raise ValueError("AS_PATH cannot have length zero")
+        return VALID
+
+    get = aspa.get
+
+    # Up: hop(AS(u-1), AS(u)) has the customer as_path[k], u = N - k + 1.
+    # Stops at u_min, the up-ramp (K) always ends there or earlier.
+    K = 1
+    ramp = True
+    u_min = N + 1
+    for k in range(N - 1, 0, -1):
+        providers = get(as_path[k])
+        if providers is None:
+            ramp = False
+        elif as_path[k - 1] in providers:
+            if ramp:
+                K += 1
+        else:
+            u_min = N - k + 1
+            break
+
+    if K == N:
+        return VALID
+
+    # Down: hop(AS(v+1), AS(v)) has the customer as_path[k], v = N - k - 1.
+    # Stops at v_max, or once the down-ramp (L) ended and v < u_min as no
+    # later nP+ hop could make u_min <= v_max.
+    L = N
+    ramp = True
+    v_max = 0
+    for k in range(N - 1):
+        if not ramp and N - k - 1 < u_min:
+            break
+        providers = get(as_path[k])
+        if providers is None:
+            ramp = False
+        elif as_path[k + 1] in providers:
+            if ramp:
+                L -= 1
+        else:
+            v_max = N - k - 1
+            break
+
+    if u_min <= v_max:
+        return INVALID
+    return VALID if L - K <= 1 else UNKNOWN
+
+
+# Adapter with the signature of the other implementations
+@instrumented("fastpath")
+def verifyASPathFastPath(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
+    if direction == ASPADirection.UPSTREAM:
+        return ASPAVerificationResult(verify_upstream(aspa, asPath))
+    if direction == ASPADirection.DOWNSTREAM:
+        return ASPAVerificationResult(verify_downstream(aspa, asPath))
+    raise ValueError("Invalid ASPA direction")
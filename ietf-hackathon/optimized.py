@@ -4,10 +4,8 @@ from definitions import *
 
 # Optimized AS_PATH verification algorithm.
 # Doesn't check any hop twice.
+@instrumented("optimized")
 def verifyASPathOptimized(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
-    def describe(i: int):
-        return describeAS(aspa, asPath, i, N)
-
     def hop(i: int, j: int) -> Hop:
         return hopAndLog(aspa, asPath, i, j, N)
 
@@ -33,7 +31,7 @@ def verifyASPathOptimized(aspa: ASPAObject, asPath: ASPath, direction: ASPADirec
     while R < N and (lastHopRight := hop(R, R + 1)) == Hop.P:
         R += 1
 
-    log(f"UP-RAMP: ends at {describe(R)}.")
+    log("UP-RAMP: ends at {}.", asPath, R)
     log("............. UP done ............")
 
     if direction == ASPADirection.UPSTREAM and R == N:
@@ -50,13 +48,13 @@ def verifyASPathOptimized(aspa: ASPAObject, asPath: ASPath, direction: ASPADirec
             L -= 1
 
         assert L >= R
-        log(f"DOWN-RAMP: ends at {describe(L)}.")
+        log("DOWN-RAMP: ends at {}.", asPath, L)
         log("............. DOWN done ............")
 
         # If gap does not exist (sharp tip) or is just a single hop wide,
         # there's no way to create a route leak, return VALID.
         if L - R <= 1:
-            log(f"GAP: gap is {L - R} wide, that's a VALID AS_PATH.")
+            log("GAP: gap from {} to {} is at most one hop wide, that's a VALID AS_PATH.", asPath, R, L)
             return ASPAVerificationResult.VALID
 
     # ===========================
@@ -84,7 +82,7 @@ def verifyASPathOptimized(aspa: ASPAObject, asPath: ASPath, direction: ASPADirec
     RR: int = R
     if lastHopRight == Hop.nP:
         foundNPFromRight = True
-        log(f"Found nP+ from right!")
+        log("Found nP+ from right!")
     else:
         while RR < (L - 1 if direction == ASPADirection.DOWNSTREAM else N):
             c = RR
@@ -94,7 +92,7 @@ def verifyASPathOptimized(aspa: ASPAObject, asPath: ASPath, direction: ASPADirec
                 foundNPFromRight = True
                 break
 
-    log(f"Stopped at {describe(RR)}")
+    log("Stopped at {}", asPath, RR)
     log("............. |<---- nP+ ? -----| done ............")
 
     # II. FROM LEFT
@@ -128,7 +126,7 @@ def verifyASPathOptimized(aspa: ASPAObject, asPath: ASPath, direction: ASPADirec
                     foundNPFromLeft = True
                     break
 
-        log(f"Stopped at {describe(LL)}")
+        log("Stopped at {}", asPath, LL)
         log("............. |----- nP+ ? ---->| done ............")
 
     if direction == ASPADirection.DOWNSTREAM and foundNPFromLeft and foundNPFromRight:
@@ -6,12 +6,10 @@ from definitions import *
 # where the origin AS has index N - 1 and the latest AS in the AS_PATH
 # has index 0.
 # Doesn't check any hop twice.
+@instrumented("optimized0")
 def verifyASPathOptimizedZeroBased(
     aspa: ASPAObject, asPath: ASPath, direction: ASPADirection
 ) -> ASPAVerificationResult:
-    def describe(i: int):
-        return describeAS(aspa, asPath, N - i, N)
-
     def hop(i: int, j: int) -> Hop:
         return hopAndLog(aspa, asPath, N - i, N - j, N)
 
@@ -37,7 +35,7 @@ def verifyASPathOptimizedZeroBased(
     while R > 0 and (lastHopRight := hop(R, R - 1)) == Hop.P:
         R -= 1
 
-    log(f"UP-RAMP: ends at {describe(R)}.")
+    log("UP-RAMP: ends at {}.", asPath, N - R)
     log("............. UP done ............")
 
     if direction == ASPADirection.UPSTREAM and R == 0:
@@ -54,14 +52,14 @@ def verifyASPathOptimizedZeroBased(
             L += 1
 
         assert L <= R
-        log(f"DOWN-RAMP: ends at {describe(L)}.")
+        log("DOWN-RAMP: ends at {}.", asPath, N - L)
         log("............. DOWN done ............")
 
         # If gap does not exist (sharp tip) or is just a single hop wide,
         # there's no way to create a route leak, return VALID.
         # CAUTION: L is smaller than R, because the array is zero-based.
         if R - L <= 1:
-            log(f"GAP: gap is {R - L} wide, that's a VALID AS_PATH.")
+            log("GAP: gap from {} to {} is at most one hop wide, that's a VALID AS_PATH.", asPath, N - R, N - L)
             return ASPAVerificationResult.VALID
 
     # ===========================
@@ -89,7 +87,7 @@ def verifyASPathOptimizedZeroBased(
     RR: int = R
     if lastHopRight == Hop.nP:
         foundNPFromRight = True
-        log(f"Found nP+ from right!")
+        log("Found nP+ from right!")
     else:
         while RR > (L + 1 if direction == ASPADirection.DOWNSTREAM else 0):
             c = RR
@@ -99,7 +97,7 @@ def verifyASPathOptimizedZeroBased(
                 foundNPFromRight = True
                 break
 
-    log(f"Stopped at {describe(RR)}")
+    log("Stopped at {}", asPath, N - RR)
     log("............. |<---- nP+ ? -----| done ............")
 
     # II. FROM LEFT
@@ -133,7 +131,7 @@ def verifyASPathOptimizedZeroBased(
                     foundNPFromLeft = True
                     break
 
-        log(f"Stopped at {describe(LL)}")
+        log("Stopped at {}", asPath, N - LL)
         log("............. |----- nP+ ? ---->| done ............")
 
     if direction == ASPADirection.DOWNSTREAM and foundNPFromLeft and foundNPFromRight:
@@ -0,0 +1,191 @@
+from typing import Dict, Optional, Set
+from definitions import *
+
+
+# AS_PATH trie keyed origin first, i.e. on the reversed ASPath, so paths sharing the
+# origin side (same origin and upstreams seen via different neighbors) share nodes.
+#
+# The node at depth d stands for AS(1) .. AS(d) and holds the state of the draft-16
+# procedures over the up hops hop(AS(u-1), AS(u)) inside that prefix, which doesn't depend
+# on the rest of the path:
+#   K       up-ramp end, the R of verifyASPathOptimized (hops 2..K are P+)
+#   uMin    lowest u with hop(AS(u-1), AS(u)) = nP+, 0 if none yet
+#   hasNA   any hop(AS(u-1), AS(u)) = nA before uMin
+# The state is computed when a result needs it (K is None until then) and kept until the
+# ASPA of a hop changes. Once uMin is set no further up hop can change the state, so the
+# children of such a node copy it without a lookup. The down hop hop(AS(d), AS(d-1)) of a
+# node is only looked up by DOWNSTREAM results, walking from the neighbor AS towards the
+# origin until the outcome is decided, and kept in down. A path only looks up the hops
+# beyond its longest cached origin side part, and never more than verifyASPathDraft16.
+class TrieNode:
+    __slots__ = ("asn", "parent", "children", "depth", "paths", "terminal", "K", "uMin", "hasNA", "down")
+
+    def __init__(self, asn: int, parent: Optional["TrieNode"]):
+        self.asn = asn
+        self.parent = parent
+        self.children: Dict[int, TrieNode] = {}
+        self.depth = parent.depth + 1 if parent is not None else 0
+        # number of inserted paths through this node and ending at it
+        self.paths = 0
+        self.terminal = 0
+        self.K: Optional[int] = None
+        self.down: Optional[Hop] = None
+
+
+class ASPathTrie:
+    def __init__(self, aspa: ASPAObject):
+        self.aspa = aspa
+        self.root = TrieNode(0, None)
+        self.root.K, self.root.uMin, self.root.hasNA = 0, 0, False
+        # customer -> nodes whose hops to their parent have this customer
+        self.customerNodes: Dict[int, Set[TrieNode]] = {}
+        self.nodeCount = 0
+        self.hopLookups = 0
+
+    def _hop(self, customer: int, provider: int) -> Hop:
+        self.hopLookups += 1
+        if customer not in self.aspa:
+            return Hop.nA
+        return Hop.P if provider in self.aspa[customer] else Hop.nP
+
+    # Sets the state of node from its parent's state and the up hop between them
+    def _update(self, node: TrieNode):
+        parent = node.parent
+        if parent.depth == 0:
+            node.K, node.uMin, node.hasNA = 1, 0, False
+            return
+
+        if parent.uMin:
+            node.K, node.uMin, node.hasNA = parent.K, parent.uMin, parent.hasNA
+            return
+
+        d = node.depth
+        up = self._hop(parent.asn, node.asn)
+        node.K = parent.K + 1 if parent.K == d - 1 and up == Hop.P else parent.K
+        node.uMin = d if up == Hop.nP else 0
+        node.hasNA = parent.hasNA or up == Hop.nA
+
+    # Sets the state of node and of its ancestors without one
+    def _upState(self, node: TrieNode):
+        pending = []
+        while node.K is None:
+            pending.append(node)
+            node = node.parent
+        for node in reversed(pending):
+            self._update(node)
+
+    # hop(AS(d), AS(d-1)) of the node at depth d >= 2, looked up once
+    def _down(self, node: TrieNode) -> Hop:
+        if node.down is None:
+            node.down = self._hop(node.asn, node.parent.asn)
+        return node.down
+
+    def _addChild(self, parent: TrieNode, asn: int) -> TrieNode:
+        node = parent.children[asn] = TrieNode(asn, parent)
+        self.nodeCount += 1
+        if parent.depth > 0:
+            self.customerNodes.setdefault(parent.asn, set()).add(node)
+            self.customerNodes.setdefault(asn, set()).add(node)
+        return node
+
+    def _find(self, asPath: ASPath) -> Optional[TrieNode]:
+        node = self.root
+        for asn in reversed(asPath):
+            node = node.children.get(asn)
+            if node is None:
+                return None
+        return node
+
+    # Adds the path of a route and returns its node, paths are counted per node
+    def insert(self, asPath: ASPath) -> TrieNode:
+        asPath = plainASPath(asPath)
+        if len(asPath) == 0:
+            raise ValueError("AS_PATH cannot have length zero")
+
+        node = self.root
+        node.paths += 1
+        for asn in reversed(asPath):
+            child = node.children.get(asn)
+            if child is None:
+                child = self._addChild(node, asn)
+            child.paths += 1
+            node = child
+        node.terminal += 1
+        return node
+
+    # Removes one inserted path, nodes without paths are dropped
+    def remove(self, asPath: ASPath):
+        asPath = plainASPath(asPath)
+        node = self._find(asPath)
+        # an origin side prefix of an inserted path has a node too, but no path ending at it
+        if node is None or node.terminal == 0 or len(asPath) == 0:
+            raise KeyError(f"AS_PATH {asPath} is not in the trie")
+
+        node.terminal -= 1
+        while node is not None:
+            node.paths -= 1
+            parent = node.parent
+            if node.paths == 0 and parent is not None:
+                del parent.children[node.asn]
+                self.nodeCount -= 1
+                if parent.depth > 0:
+                    self.customerNodes[parent.asn].discard(node)
+                    self.customerNodes[node.asn].discard(node)
+            node = parent
+
+    # Drops the state of the nodes with hops of customer and of their subtrees after its ASPA changed
+    def invalidate(self, customer: int):
+        stack = list(self.customerNodes.get(customer, ()))
+        for node in stack:
+            if node.asn == customer:
+                node.down = None
+        while stack:
+            node = stack.pop()
+            if node.K is not None:
+                node.K = None
+                stack.extend(node.children.values())
+
+    # Verifies asPath, inserting it for as long as the call runs only (see insert for routes)
+    def verify(self, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
+        node = self.insert(asPath)
+        try:
+            return self.result(node, direction)
+        finally:
+            self.remove(asPath)
+
+    # Outcome of the draft-16 procedures for the path ending at node
+    def result(self, node: TrieNode, direction: ASPADirection) -> ASPAVerificationResult:
+        N = node.depth
+        if direction == ASPADirection.UPSTREAM:
+            if N == 1:
+                return ASPAVerificationResult.VALID
+            self._upState(node)
+            if node.uMin:
+                return ASPAVerificationResult.INVALID
+            if node.hasNA:
+                return ASPAVerificationResult.UNKNOWN
+            return ASPAVerificationResult.VALID
+
+        if direction == ASPADirection.DOWNSTREAM:
+            if N <= 2:
+                return ASPAVerificationResult.VALID
+            self._upState(node)
+            # down hops v = N-1 .. 1 from the neighbor AS: the down-ramp runs to the first
+            # hop that is not P+, an nP+ hop at v >= uMin makes the path Invalid
+            uMin, downRun, onRamp = node.uMin, 0, True
+            hopNode, v = node, N - 1
+            while v >= 1 and (onRamp or uMin and v >= uMin):
+                down = self._down(hopNode)
+                if down == Hop.nP and uMin and v >= uMin:
+                    return ASPAVerificationResult.INVALID
+                if onRamp and down == Hop.P:
+                    downRun += 1
+                else:
+                    onRamp = False
+                hopNode, v = hopNode.parent, v - 1
+            L = N - downRun
+            if L - node.K <= 1:
+                return ASPAVerificationResult.VALID
+            return ASPAVerificationResult.UNKNOWN
+
+        raise ValueError("Invalid ASPA direction")
@@ -5,6 +5,7 @@ from typing import List, Dict
 from definitions import *
 
 
+@instrumented("simplified")
 def verifyASPathSimplified(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
     N = len(asPath)
 
@@ -17,12 +18,7 @@ def verifyASPathSimplified(aspa: ASPAObject, asPath: ASPath, direction: ASPADire
         elif (N, N + 1) == (i, j):
             return Hop.P if direction == ASPADirection.UPSTREAM else Hop.nA
 
-        if asPath[N - i] not in aspa:
-            return Hop.nA
-        if asPath[N - j] in aspa[asPath[N - i]]:
-            return Hop.P
-        else:
-            return Hop.nP
+        return hopAndLog(aspa, asPath, i, j, N)
 
     R: int = 1
     while R < N + 1 and hop(R, R + 1) == Hop.P:
@@ -5,6 +5,7 @@ from typing import List, Dict
 from definitions import *
 
 
+@instrumented("simplified2")
 def verifyASPathSimplified2(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
     N = len(asPath)
 
@@ -1,4 +1,8 @@
 from enum import Enum
+import os
+import random
+import sys
+import tempfile
 import config
 from definitions import *
 from simplified import *
@@ -6,20 +10,61 @@ from simplified2 import *
 from draft import *
 from optimized import *
 from optimizedZeroBased import *
+from fastpath import *
+from pathtrie import *
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aspa_logic import CanonicalPath
+from aspa_table import FrozenAFITable, write_snapshot
+from aspa_pool import VerificationPool
+
+# Only a missing numpy skips the vectorized impl, and the skip is reported below
+try:
+    from vectorized import *
+except ModuleNotFoundError as error:
+    if error.name != "numpy":
+        raise
+    verifyASPathVectorized = None
 
 REFERENCE_IMPL_ID = "draft-16"
 REFERENCE_IMPL = verifyASPathDraft16
 
+
+# Runs the optimized impl twice with a fresh HopCache, the second run only sees cached hops.
+def verifyASPathOptimizedHopCache(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
+    hopCache = HopCache(aspa)
+    setHopCache(hopCache)
+    try:
+        first = verifyASPathOptimized(aspa, asPath, direction)
+        misses = hopCache.misses
+        second = verifyASPathOptimized(aspa, asPath, direction)
+        if first != second or hopCache.misses != misses:
+            raise ValueError("HopCache did not serve the second run from cache")
+        return second
+    finally:
+        setHopCache(None)
+
+
+# Runs the reference impl against the packed table instead of the dict.
+def verifyASPathDraft16Frozen(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
+    return verifyASPathDraft16(FrozenAFITable.build(aspa), asPath, direction)
+
+
 def testASPACase(label: str, aspa: ASPAObject, path: ASPath, direction: ASPADirection):
-    config.enableDebugLogging = False
+    config.instrumentation = None
 
     impls = {
         REFERENCE_IMPL_ID: REFERENCE_IMPL,
         "optimized": verifyASPathOptimized,
         "optimized0": verifyASPathOptimizedZeroBased,
         "simplified": verifyASPathSimplified,
-        "simplified2": verifyASPathSimplified2
+        "simplified2": verifyASPathSimplified2,
+        "optimized+hopcache": verifyASPathOptimizedHopCache,
+        "draft-16+frozen": verifyASPathDraft16Frozen,
+        "fastpath": verifyASPathFastPath,
     }
+    if verifyASPathVectorized is not None:
+        impls["vectorized"] = verifyASPathVectorized
 
     results = {}
 
@@ -379,3 +424,154 @@ testASPACase(
     path = [30, 20, 40],
     direction=ASPADirection.UPSTREAM,
 )
+
+# HopCache invalidation only drops the changed customer
+hopCacheASPA = {20: [30], 30: [40]}
+hopCache = HopCache(hopCacheASPA)
+setHopCache(hopCache)
+assert verifyASPathDraft16(hopCacheASPA, [40, 30, 20], ASPADirection.UPSTREAM) == ASPAVerificationResult.VALID
+hopCacheASPA[30] = [50]
+hopCache.invalidate(30)
+assert (20 << 32 | 30) in hopCache.verdicts and (30 << 32 | 40) not in hopCache.verdicts
+assert verifyASPathDraft16(hopCacheASPA, [40, 30, 20], ASPADirection.UPSTREAM) == ASPAVerificationResult.INVALID
+setHopCache(None)
+
+# HopCounter counts every hop lookup and the ones repeated within a path per impl and direction
+hopCounter = HopCounter()
+config.instrumentation = hopCounter
+assert verifyASPathDraft16({20: [30], 30: [40]}, [40, 30, 20], ASPADirection.UPSTREAM) == ASPAVerificationResult.VALID
+assert verifyASPathDraft16({20: [30], 30: [40]}, [40, 30, 20], ASPADirection.UPSTREAM) == ASPAVerificationResult.VALID
+assert verifyASPathOptimized({20: [30], 30: [40]}, [40, 30, 20], ASPADirection.UPSTREAM) == ASPAVerificationResult.VALID
+draftStats = hopCounter.stats[(REFERENCE_IMPL_ID, ASPADirection.UPSTREAM)]
+optimizedStats = hopCounter.stats[("optimized", ASPADirection.UPSTREAM)]
+assert (draftStats.paths, draftStats.hops, draftStats.repeatedHops) == (2, 8, 4)
+assert (optimizedStats.paths, optimizedStats.hops, optimizedStats.repeatedHops) == (1, 2, 0)
+config.instrumentation = None
+
+# TraceBuffer keeps the last events only and renders them on demand
+traceBuffer = TraceBuffer(capacity=4)
+config.instrumentation = traceBuffer
+assert verifyASPathDraft16({20: [30], 30: [40]}, [40, 30, 20], ASPADirection.UPSTREAM) == ASPAVerificationResult.VALID
+assert (traceBuffer.written, len(traceBuffer)) == (7, 4)
+assert traceBuffer.hops() == [(2, 3, 30, 40, Hop.P), (1, 2, 20, 30, Hop.P), (2, 3, 30, 40, Hop.P)]
+assert list(traceBuffer.lines())[-1] == "Returned VALID"
+config.instrumentation = None
+
+# Fast path verifiers match the reference impl on random ASPA sets and int tuple AS_PATHs
+rng = random.Random(3)
+for _ in range(5000):
+    asns = list(range(1, rng.randint(2, 12)))
+    aspa = {asn: rng.sample(asns, rng.randint(0, min(3, len(asns)))) for asn in rng.sample(asns, rng.randint(0, len(asns)))}
+    path = tuple(rng.choice(asns) for _ in range(rng.randint(1, 10)))
+    for direction, verify in ((ASPADirection.UPSTREAM, verify_upstream), (ASPADirection.DOWNSTREAM, verify_downstream)):
+        expected = REFERENCE_IMPL(aspa, list(path), direction).value
+        if verify(aspa, path) != expected:
+            raise ValueError(f"fastpath: {aspa} {path} {direction.name} -- Expected {expected}, but result was {verify(aspa, path)}.")
+print("\nfastpath: random AS_PATHs match the reference impl")
+
+# CanonicalPath AS_PATHs verify like the AS_PATH with the prepends removed
+rng = random.Random(4)
+for _ in range(1000):
+    asns = list(range(1, 9))
+    aspa = {asn: rng.sample(asns, rng.randint(0, 3)) for asn in rng.sample(asns, rng.randint(0, 8))}
+    path = [asn for asn in (rng.choice(asns) for _ in range(rng.randint(1, 6))) for _ in range(rng.randint(1, 3))]
+    canonicalPath = CanonicalPath.intern_as_path(path)
+    for direction in ASPADirection:
+        expected = REFERENCE_IMPL(aspa, list(canonicalPath.as_path), direction)
+        for implID, impl in (("draft-16", verifyASPathDraft16), ("simplified", verifyASPathSimplified),
+                             ("simplified2", verifyASPathSimplified2), ("fastpath", verifyASPathFastPath)):
+            if impl(aspa, canonicalPath, direction) != expected:
+                raise ValueError(f"CanonicalPath: {implID} {aspa} {path} {direction.name} -- Expected {expected.name}.")
+print("canonical: prepend-collapsed paths match the reference impl")
+
+# ASPathTrie matches the reference impl while routes come and go and ASPAs change
+rng = random.Random(5)
+for _ in range(200):
+    asns = list(range(1, 10))
+    aspa = {asn: rng.sample(asns, rng.randint(0, 3)) for asn in rng.sample(asns, rng.randint(0, 9))}
+    trie = ASPathTrie(aspa)
+    originSides = [[rng.choice(asns) for _ in range(rng.randint(1, 4))] for _ in range(5)]
+    paths = [[rng.choice(asns) for _ in range(rng.randint(0, 4))] + rng.choice(originSides) for _ in range(40)]
+    for path in paths:
+        trie.insert(path)
+    for path in paths[::2]:
+        trie.remove(path)
+    for path in paths[1::2]:
+        trie.verify(path, ASPADirection.DOWNSTREAM)
+    customer = rng.choice(asns)
+    aspa[customer] = rng.sample(asns, 2)
+    trie.invalidate(customer)
+    for path in paths[1::2]:
+        for direction in ASPADirection:
+            expected = REFERENCE_IMPL(aspa, path, direction)
+            if trie.verify(path, direction) != expected:
+                raise ValueError(f"ASPathTrie: {aspa} {path} {direction.name} -- Expected {expected.name}.")
+    for path in paths[1::2]:
+        trie.remove(path)
+    if trie.nodeCount != 0:
+        raise ValueError(f"ASPathTrie: {trie.nodeCount} nodes left after removing all paths.")
+
+# removing an origin side prefix of an inserted path that was never inserted itself leaves the trie intact
+trie = ASPathTrie({})
+trie.insert([1, 2, 3])
+try:
+    trie.remove([2, 3])
+    raise ValueError("ASPathTrie: removed a path that was never inserted.")
+except KeyError:
+    pass
+assert trie.nodeCount == 3
+trie.remove([1, 2, 3])
+assert trie.nodeCount == 0
+
+# a path verified in a fresh trie looks up no more hops than the draft-16 impl
+rng = random.Random(6)
+config.instrumentation = HopCounter()
+for _ in range(2000):
+    asns = list(range(1, 10))
+    aspa = {asn: rng.sample(asns, rng.randint(0, 3)) for asn in rng.sample(asns, rng.randint(0, 9))}
+    path = [rng.choice(asns) for _ in range(rng.randint(1, 8))]
+    for direction in ASPADirection:
+        config.instrumentation.clear()
+        verifyASPathDraft16(aspa, path, direction)
+        trie = ASPathTrie(aspa)
+        trie.verify(path, direction)
+        draftLookups = config.instrumentation.stats[("draft-16", direction)].hops
+        if trie.hopLookups > draftLookups:
+            raise ValueError(f"ASPathTrie: {trie.hopLookups} lookups for {aspa} {path} {direction.name}, draft-16 {draftLookups}.")
+config.instrumentation = None
+print("trie: results match the reference impl")
+
+# Vectorized batches match the reference impl on random ASPA sets and AS_PATHs
+if verifyASPathVectorized is not None:
+    rng = random.Random(0)
+    for _ in range(200):
+        asns = list(range(1, 12))
+        aspa = {asn: rng.sample(asns, rng.randint(0, 3)) for asn in rng.sample(asns, rng.randint(0, 11))}
+        paths = [[rng.choice(asns) for _ in range(rng.randint(1, 9))] for _ in range(40)]
+        values = [asn for path in paths for asn in path]
+        offsets = [0]
+        for path in paths:
+            offsets.append(offsets[-1] + len(path))
+
+        for direction in ASPADirection:
+            expected = [REFERENCE_IMPL(aspa, path, direction).value for path in paths]
+            result = list(verifyASPathRagged(NumpyASPATable.fromASPA(aspa), values, offsets, direction))
+            if result != expected:
+                raise ValueError(f"vectorized: {aspa} {direction.name} -- Expected {expected}, but result was {result}.")
+    print("\nvectorized: random batches match the reference impl")
+else:
+    print("\nvectorized: skipped, numpy is not installed")
+
+# VerificationPool runs the implementations against the shared snapshot and keeps the order
+with tempfile.TemporaryDirectory() as directory:
+    rng = random.Random(1)
+    asns = list(range(1, 12))
+    aspa = {asn: rng.sample(asns, rng.randint(0, 3)) for asn in rng.sample(asns, 8)}
+    paths = [[rng.choice(asns) for _ in range(rng.randint(1, 9))] for _ in range(500)]
+    write_snapshot({4: aspa}, os.path.join(directory, "aspa.snapshot"))
+    with VerificationPool(os.path.join(directory, "aspa.snapshot"), workers=2, chunk_size=32) as pool:
+        for direction in ASPADirection:
+            expected = [REFERENCE_IMPL(aspa, path, direction) for path in paths]
+            if pool.map_verifier(REFERENCE_IMPL, paths, 4, direction) != expected:
+                raise ValueError(f"VerificationPool: {direction.name} results differ from the reference impl.")
+    print("pool: results match the reference impl")
@@ -0,0 +1,132 @@
+import numpy as np
+from definitions import *
+from aspa_table import FrozenAFITable
+
+# Integer hop verdicts
+NA, NP, P = 0, 1, 2
+
+# Result codes are the ASPAVerificationResult values
+UNKNOWN, INVALID, VALID = (ASPAVerificationResult.UNKNOWN.value, ASPAVerificationResult.INVALID.value,
+                           ASPAVerificationResult.VALID.value)
+
+
+# Frozen ASPA table as NumPy arrays: the sorted customers and the sorted
+# (customer << 32 | provider) keys of all attested hops.
+class NumpyASPATable:
+    def __init__(self, table: FrozenAFITable):
+        self.customers = np.asarray(table.customers, dtype=np.uint64)
+        offsets = np.asarray(table.offsets, dtype=np.int64)
+        providers = np.asarray(table.providers, dtype=np.uint64)
+        self.pairKeys = (np.repeat(self.customers, np.diff(offsets)) << np.uint64(32)) | providers
+
+    @classmethod
+    def fromASPA(cls, aspa: ASPAObject):
+        return cls(aspa if isinstance(aspa, FrozenAFITable) else FrozenAFITable.build(aspa))
+
+    # Verdicts (NA, NP, P) of the hops customers[k] -> providers[k], any shape
+    def hops(self, customers: np.ndarray, providers: np.ndarray) -> np.ndarray:
+        customers = customers.astype(np.uint64)
+        keys = (customers << np.uint64(32)) | providers.astype(np.uint64)
+        attested = _member(self.customers, customers)
+        provider = _member(self.pairKeys, keys)
+        return np.where(attested, np.where(provider, P, NP), NA).astype(np.int8)
+
+
+def _member(sortedValues: np.ndarray, values: np.ndarray) -> np.ndarray:
+    if len(sortedValues) == 0:
+        return np.zeros(values.shape, dtype=bool)
+    index = np.minimum(np.searchsorted(sortedValues, values), len(sortedValues) - 1)
+    return sortedValues[index] == values
+
+
+# Index of the first True per row, -1 if none
+def _firstTrue(mask: np.ndarray) -> np.ndarray:
+    if mask.shape[1] == 0:
+        return np.full(mask.shape[0], -1)
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), -1)
+
+
+# Index of the last True per row, -1 if none
+def _lastTrue(mask: np.ndarray) -> np.ndarray:
+    if mask.shape[1] == 0:
+        return np.full(mask.shape[0], -1)
+    return np.where(mask.any(axis=1), mask.shape[1] - 1 - mask[:, ::-1].argmax(axis=1), -1)
+
+
+# Performs the draft-ietf-sidrops-aspa-verification-16 procedures on a batch of
+# AS_PATHs given as a zero padded matrix, one AS_PATH per row in the ASPath order
+# (origin AS at column lengths[row] - 1). Returns the ASPAVerificationResult values.
+#
+# Column c of the hop matrices holds the hop between columns c and c + 1:
+#   up[c]   = hop(AS(N-c-1), AS(N-c)) customer in column c + 1, i.e. hop(u-1, u) with u = N - c
+#   down[c] = hop(AS(N-c), AS(N-c-1)) customer in column c,     i.e. hop(v+1, v) with v = N - c - 1
+def verifyASPathMatrix(table: NumpyASPATable, paths: np.ndarray, lengths: np.ndarray,
+                       direction: ASPADirection) -> np.ndarray:
+    paths = np.asarray(paths, dtype=np.uint32)
+    N = np.asarray(lengths, dtype=np.int64)
+    if paths.ndim != 2 or len(N) != len(paths):
+        raise ValueError("paths must be a 2-D matrix with one length per row")
+    if np.any(N < 1) or np.any(N > paths.shape[1]):
+        raise ValueError("AS_PATH length must be between 1 and the matrix width")
+
+    columns = np.arange(max(paths.shape[1] - 1, 0))
+    valid = columns[None, :] < (N - 1)[:, None]
+
+    if direction == ASPADirection.UPSTREAM:
+        up = table.hops(paths[:, 1:], paths[:, :-1])
+        result = np.full(len(N), VALID, dtype=np.int8)
+        result[((up == NA) & valid).any(axis=1)] = UNKNOWN
+        result[((up == NP) & valid).any(axis=1)] = INVALID
+        return result
+
+    if direction != ASPADirection.DOWNSTREAM:
+        raise ValueError("Invalid ASPA direction")
+
+    up = table.hops(paths[:, 1:], paths[:, :-1])
+    down = table.hops(paths[:, :-1], paths[:, 1:])
+
+    # u_min: lowest u with up hop nP+ is the highest such column, N + 1 if none
+    lastNPUp = _lastTrue((up == NP) & valid)
+    u_min = np.where(lastNPUp >= 0, N - lastNPUp, N + 1)
+
+    # v_max: highest v with down hop nP+ is the lowest such column, 0 if none
+    firstNPDown = _firstTrue((down == NP) & valid)
+    v_max = np.where(firstNPDown >= 0, N - 1 - firstNPDown, 0)
+
+    # K: up-ramp from the origin (column N - 2 downwards) while hops are P+
+    lastNotPUp = _lastTrue((up != P) & valid)
+    K = 1 + (N - 2) - lastNotPUp
+
+    # L: down-ramp from the neighbor (column 0 upwards) while hops are P+
+    firstNotPDown = _firstTrue((down != P) & valid)
+    L = N - np.where(firstNotPDown >= 0, firstNotPDown, N - 1)
+
+    result = np.where(L - K <= 1, VALID, UNKNOWN).astype(np.int8)
+    result[u_min <= v_max] = INVALID
+    result[N <= 2] = VALID
+    return result
+
+
+# Same as verifyASPathMatrix for ragged AS_PATHs: path k is values[offsets[k]:offsets[k+1]]
+def verifyASPathRagged(table: NumpyASPATable, values: np.ndarray, offsets: np.ndarray,
+                       direction: ASPADirection) -> np.ndarray:
+    values = np.asarray(values, dtype=np.uint32)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int8)
+
+    paths = np.zeros((len(lengths), max(int(lengths.max()), 1)), dtype=np.uint32)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    columns = np.arange(offsets[0], offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    paths[rows, columns] = values[offsets[0]:offsets[-1]]
+    return verifyASPathMatrix(table, paths, lengths, direction)
+
+
+# Single AS_PATH adapter with the signature of the other implementations
+@instrumented("vectorized")
+def verifyASPathVectorized(aspa: ASPAObject, asPath: ASPath, direction: ASPADirection) -> ASPAVerificationResult:
+    if len(asPath) == 0:
+        raise ValueError("AS_PATH cannot have length zero")
+    result = verifyASPathMatrix(NumpyASPATable.fromASPA(aspa), np.array([asPath]), np.array([len(asPath)]), direction)
+    return ASPAVerificationResult(int(result[0]))
@@ -1,5 +1,23 @@
+import asyncio
+import gzip
+import io
+import ipaddress
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
 import unittest
 from aspa_logic import *
+from aspa_table import *
+from aspa_pool import VerificationPool
+from aspa_mrt import *
+from aspa_rtr import *
+from aspa_der import *
+from aspa_json import iter_export_entries, load_json_export
+from aspa_rcu import ASPAGenerations
+from aspa_sweep import sweep
 
 
 # just an example for the tests
@@ -22,6 +40,26 @@ aspa_records = {
 
 aspa_manager = ASPA(aspa_records)
 
+
+# random paths over the ASNs above (plus a few without ASPA) with prepends and sets,
+# mostly ending in neighbor_as
+def random_paths(count, neighbor_as=None, seed=0):
+    rng = random.Random(seed)
+    asns = list(aspa_records[IPv4]) + [1, 2, 20485, 208722, 9002]
+    paths = []
+    for _ in range(count):
+        aspath = []
+        for _ in range(rng.randint(0, 7)):
+            segment_type = AS_SEQUENCE if rng.random() < 0.9 else rng.choice([AS_SET, AS_CONFED_SEQUENCE])
+            if aspath and rng.random() < 0.2:
+                aspath.append(Segment(aspath[-1].value, segment_type))
+            else:
+                aspath.append(Segment(rng.choice(asns), segment_type))
+        if neighbor_as is not None and rng.random() < 0.9:
+            aspath.append(Segment(neighbor_as, AS_SEQUENCE))
+        paths.append(aspath)
+    return paths
+
 class ASPATests(unittest.TestCase):
     def __init__(self, *args, **kwargs):
         super(ASPATests, self).__init__(*args, **kwargs)
@@ -292,6 +330,829 @@ class ASPATests(unittest.TestCase):
         with self.subTest():
             self.assertEqual(aspa_manager.check_ix_path(aspath, 6695, IPv4), Unknown)
 
+
+class ASPABatchTests(unittest.TestCase):
+    def test_verify_many_matches_single_path_checks(self):
+        checks = {Upflow: aspa_manager.check_upflow_path,
+                  Downflow: aspa_manager.check_downflow_path,
+                  IXflow: aspa_manager.check_ix_path}
+        for direction, check in checks.items():
+            for neighbor_as in (3356, 13238):
+                paths = random_paths(1000, neighbor_as)
+                expected = [check(aspath, neighbor_as, IPv4) for aspath in paths]
+                with self.subTest(direction=direction, neighbor_as=neighbor_as):
+                    self.assertEqual(list(aspa_manager.verify_many(paths, neighbor_as, IPv4, direction)), expected)
+                with self.subTest(direction=direction, neighbor_as=neighbor_as, batch=True):
+                    batch = PathBatch.from_paths(paths)
+                    self.assertEqual(list(aspa_manager.verify_many(batch, neighbor_as, IPv4, direction)), expected)
+
+    def test_verify_many_unknown_afi(self):
+        paths = [[Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)], []]
+        self.assertEqual(list(aspa_manager.verify_many(paths, 3356, IPv6, Upflow)), [Unknown, Invalid])
+
+
+
+class ASPABidirectionalScanTests(unittest.TestCase):
+    # the downflow verdict from two complete scans, forward and over a reversed copy
+    def full_scan_downflow(self, aspath, neighbor_as):
+        if not aspath or aspath[-1].type == AS_SEQUENCE and aspath[-1].value != neighbor_as:
+            return Invalid
+        forward_invalid_index, forward_unknown_index, forward_unverifiable = aspa_manager.get_indexes(aspath, IPv4)
+        backward_invalid_index, backward_unknown_index, backward_unverifiable = \
+            aspa_manager.get_indexes(list(reversed(aspath)), IPv4)
+        if forward_invalid_index + backward_invalid_index < len(aspath):
+            return Invalid
+        if forward_unverifiable or backward_unverifiable:
+            return Unverifiable
+        if forward_unknown_index + backward_unknown_index < len(aspath):
+            return Unknown
+        return Valid
+
+    def test_early_exit_matches_full_scans(self):
+        for neighbor_as in (3356, 13238, 1):
+            paths = random_paths(2000, neighbor_as, seed=neighbor_as)
+            expected = [self.full_scan_downflow(aspath, neighbor_as) for aspath in paths]
+            self.assertEqual([aspa_manager.check_downflow_path(aspath, neighbor_as, IPv4) for aspath in paths],
+                             expected)
+            self.assertEqual(list(aspa_manager.verify_many(PathBatch.from_paths(paths), neighbor_as, IPv4,
+                                                           Downflow)), expected)
+
+    def test_bidirectional_indexes(self):
+        for aspath in random_paths(500, 3356):
+            self.assertEqual(aspa_manager.get_bidirectional_indexes(aspath, IPv4),
+                             (aspa_manager.get_indexes(aspath, IPv4),
+                              aspa_manager.get_indexes(list(reversed(aspath)), IPv4)))
+
+    def test_stops_at_backward_unknown(self):
+        # none of the ASes has an ASPA, the backward scan stops at its first unknown hop as no
+        # backward invalid hop could make the path Invalid
+        manager = ASPA(aspa_records)
+        pair_checks = []
+        verify_pair = manager._verify_pair
+        manager._verify_pair = lambda *args: pair_checks.append(args[1:]) or verify_pair(*args)
+        aspath = [Segment(asn, AS_SEQUENCE) for asn in (1, 2, 20485, 9002, 1299)]
+        self.assertEqual(manager.check_downflow_path(aspath, 1299, IPv4), Unknown)
+        self.assertEqual(pair_checks, [(1, 2), (2, 20485), (20485, 9002), (9002, 1299), (1299, 9002)])
+
+
+class ASPAPathCacheTests(unittest.TestCase):
+    def test_cached_results_match_uncached(self):
+        cached_manager = ASPA(aspa_records, path_cache_size=64)
+        paths = random_paths(500, 13238)
+        for check, cached_check in ((aspa_manager.check_upflow_path, cached_manager.check_upflow_path),
+                                    (aspa_manager.check_downflow_path, cached_manager.check_downflow_path),
+                                    (aspa_manager.check_ix_path, cached_manager.check_ix_path)):
+            expected = [check(aspath, 13238, IPv4) for aspath in paths + paths]
+            self.assertEqual([cached_check(aspath, 13238, IPv4) for aspath in paths + paths], expected)
+        self.assertLessEqual(len(cached_manager.path_cache), 64)
+        self.assertGreater(cached_manager.path_cache.hits, 0)
+
+    def test_counters_and_batches_share_entries(self):
+        cached_manager = ASPA(aspa_records, path_cache_size=16)
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        cached_manager.check_upflow_path(aspath, 3356, IPv4)
+        cached_manager.verify_many([aspath], 3356, IPv4, Upflow)
+        cached_manager.verify_many(PathBatch.from_paths([aspath]), 3356, IPv4, Upflow)
+        self.assertEqual((cached_manager.path_cache.hits, cached_manager.path_cache.misses), (2, 1))
+
+    def test_cache_dropped_when_records_change(self):
+        cached_manager = ASPA({IPv4: {43247: {13238}, 13238: {3356}}}, path_cache_size=16)
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Valid)
+
+        cached_manager.set_record(IPv4, 13238, {174})
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Invalid)
+
+        cached_manager.remove_record(IPv4, 13238)
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Unknown)
+
+        cached_manager.aspa_records = {IPv4: {43247: {13238}, 13238: {3356}}}
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Valid)
+        self.assertEqual(cached_manager.path_cache.hits, 0)
+
+        cached_manager.aspa_records = FrozenASPATable.build({IPv4: {43247: {13238}}})
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Unknown)
+
+    def test_in_place_edits_need_records_changed(self):
+        records = {IPv4: {43247: {13238}, 13238: {3356}}}
+        cached_manager = ASPA(records, path_cache_size=16)
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Valid)
+
+        records[IPv4][13238] = {174}
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Valid)
+        cached_manager.records_changed()
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Invalid)
+
+
+class ASPAPairCacheTests(unittest.TestCase):
+    def test_cached_pairs_match_uncached(self):
+        for records in (aspa_records, FrozenASPATable.build(aspa_records)):
+            cached_manager = ASPA(records, pair_cache=True)
+            paths = random_paths(500, 13238)
+            for direction in (Upflow, Downflow, IXflow):
+                with self.subTest(records=type(records).__name__, direction=direction):
+                    self.assertEqual(cached_manager.verify_many(paths, 13238, IPv4, direction),
+                                     aspa_manager.verify_many(paths, 13238, IPv4, direction))
+            pair_cache = cached_manager.pair_caches[IPv4]
+            misses = pair_cache.misses
+            self.assertEqual(misses, len(pair_cache))
+            cached_manager.verify_many(paths, 13238, IPv4, Downflow)
+            self.assertEqual(pair_cache.misses, misses)
+            self.assertEqual(cached_manager.verify_pair(1, 2, IPv6), Unknown)
+
+    def test_single_record_change_keeps_other_verdicts(self):
+        cached_manager = ASPA({IPv4: {43247: {13238}, 13238: {3356}}}, pair_cache=True)
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Valid)
+
+        cached_manager.set_record(IPv4, 13238, {174})
+        pair_cache = cached_manager.pair_caches[IPv4]
+        self.assertEqual(pair_cache.verdicts, {43247 << 32 | 13238: Valid})
+        self.assertEqual(cached_manager.check_upflow_path(aspath, 3356, IPv4), Invalid)
+
+        cached_manager.remove_record(IPv4, 43247)
+        self.assertEqual(pair_cache.verdicts, {13238 << 32 | 3356: Invalid})
+        self.assertEqual(cached_manager.verify_pair(43247, 13238, IPv4), Unknown)
+        self.assertEqual(cached_manager.verify_pair(13238, 174, IPv4), Valid)
+
+        cached_manager.apply_delta(added={IPv4: {13238: {3356}}})
+        self.assertEqual(pair_cache.verdicts, {43247 << 32 | 13238: Unknown})
+        self.assertEqual(cached_manager.verify_pair(13238, 3356, IPv4), Valid)
+
+        cached_manager.aspa_records[IPv4][43247] = {13238}
+        cached_manager.records_changed(IPv4, 43247)
+        self.assertEqual(cached_manager.verify_pair(43247, 13238, IPv4), Valid)
+        self.assertIs(cached_manager.pair_caches[IPv4], pair_cache)
+
+        cached_manager.set_record(IPv6, 43247, {13238})
+        self.assertEqual(cached_manager.verify_pair(43247, 13238, IPv6), Valid)
+
+
+class ASPAPrefilterTests(unittest.TestCase):
+    def test_prefiltered_results_match(self):
+        paths = random_paths(500, 13238) + [[Segment(asn, AS_SEQUENCE) for asn in path]
+                                            for path in ((1, 2, 1, 13238), (1, 1, 2, 13238), (2, 9002, 9002, 13238))]
+        batch = PathBatch.from_paths(paths)
+        canonical_paths = [CanonicalPath.intern(aspath) for aspath in paths]
+        for records in (aspa_records, FrozenASPATable.build(aspa_records)):
+            for pair_cache in (False, True):
+                manager = ASPA(records, pair_cache=pair_cache, prefilter=True)
+                for direction in (Upflow, Downflow, IXflow):
+                    with self.subTest(records=type(records).__name__, pair_cache=pair_cache, direction=direction):
+                        expected = aspa_manager.verify_many(paths, 13238, IPv4, direction)
+                        self.assertEqual(manager.verify_many(batch, 13238, IPv4, direction), expected)
+                        self.assertEqual(manager.verify_many(canonical_paths, 13238, IPv4, direction), expected)
+
+    def test_nA_hops_skip_verify_pair(self):
+        manager = ASPA({IPv4: {43247: {13238}}}, prefilter=True)
+        pair_checks = []
+        verify_pair = manager._verify_pair
+        manager._verify_pair = lambda *args: pair_checks.append(args[1:]) or verify_pair(*args)
+        batch = PathBatch.from_paths([[Segment(asn, AS_SEQUENCE) for asn in (1, 2, 20485, 1299)],
+                                      [Segment(asn, AS_SEQUENCE) for asn in (1, 43247, 13238, 1299)]])
+        self.assertEqual(list(manager.verify_many(batch, 1299, IPv4, Downflow)), [Unknown, Unknown])
+        self.assertEqual(pair_checks, [(43247, 13238)])
+
+        manager.set_record(IPv4, 1, {2})
+        self.assertEqual(list(manager.verify_many(batch, 1299, IPv4, Upflow)), [Unknown, Invalid])
+        self.assertEqual(pair_checks[1:], [(1, 2), (1, 43247)])
+
+
+class ASPADeltaTests(unittest.TestCase):
+    def test_apply_delta_matches_full_revalidation(self):
+        manager = ASPA({afi: {customer: set(providers) for customer, providers in records.items()}
+                        for afi, records in aspa_records.items()}, pair_cache=True)
+        routes = {}
+        for direction in (Upflow, Downflow, IXflow):
+            for number, aspath in enumerate(random_paths(300, 13238, seed=direction)):
+                routes[(direction, number)] = manager.add_route((direction, number), aspath, 13238, IPv4, direction)
+
+        deltas = [({IPv4: {13238: {3356}}}, None),
+                  (None, {IPv4: [12389, 3]}),
+                  ({IPv4: {1: {13238}, 2: {1, 174}, 12389: {3356, 2914}}}, {IPv4: [43247]}),
+                  ({IPv6: {13238: {3356}}}, None)]
+        for added, removed in deltas:
+            transitions = manager.apply_delta(added, removed)
+            full_manager = ASPA(manager.aspa_records)
+            for route, old_state, new_state in transitions:
+                self.assertEqual(routes[route], old_state)
+                routes[route] = new_state
+            with self.subTest(added=added, removed=removed):
+                self.assertEqual({route: full_manager._check_path(*manager.routes[route][:4]) for route in routes}, routes)
+
+    def test_what_if_matches_apply_delta(self):
+        manager = ASPA({afi: {customer: set(providers) for customer, providers in records.items()}
+                        for afi, records in aspa_records.items()}, prefilter=True)
+        for direction in (Upflow, Downflow, IXflow):
+            for number, aspath in enumerate(random_paths(300, 13238, seed=direction)):
+                if number % 2:
+                    aspath = CanonicalPath.intern(aspath)
+                manager.add_route((direction, number), aspath, 13238, IPv4, direction)
+
+        for added, removed in (({IPv4: {13238: {3356}}}, None),
+                               ({IPv4: {1: {13238}, 2: {1, 174}}}, {IPv4: [12389, 43247]})):
+            records = {afi: dict(records_afi) for afi, records_afi in manager.aspa_records.items()}
+            states = {route: manager.route_state(route) for route in manager.routes}
+            transitions = manager.what_if(added, removed)
+            self.assertEqual(manager.aspa_records, records)
+            self.assertEqual({route: manager.route_state(route) for route in manager.routes}, states)
+
+            expected = {}
+            for route, old_state, new_state in manager.apply_delta(added, removed):
+                aspath, neighbor_as = manager.routes[route][:2]
+                expected.setdefault((neighbor_as, aspath[0].value), []).append((route, old_state, new_state))
+            self.assertTrue(transitions)
+            self.assertEqual({key: sorted(group) for key, group in transitions.items()},
+                             {key: sorted(group) for key, group in expected.items()})
+
+    def test_remove_route_updates_index(self):
+        manager = ASPA({IPv4: {}})
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(manager.add_route('r1', aspath, 3356, IPv4, Upflow), Unknown)
+        self.assertEqual(set(manager.customer_routes[IPv4]), {43247, 13238})
+
+        self.assertEqual(manager.apply_delta({IPv4: {43247: {13238}, 13238: {3356}}}), [('r1', Unknown, Valid)])
+        self.assertEqual(manager.apply_delta({IPv4: {3356: {174}}}), [])
+
+        manager.remove_route('r1')
+        self.assertEqual(manager.customer_routes[IPv4], {})
+        self.assertEqual(manager.apply_delta(removed={IPv4: [13238]}), [])
+
+
+class CanonicalPathTests(unittest.TestCase):
+    def test_prepends_collapsed_and_markers_kept(self):
+        aspath = [Segment(1, AS_SEQUENCE), Segment(1, AS_SEQUENCE), Segment(2, AS_SET), Segment(2, AS_SEQUENCE),
+                  Segment(2, AS_SEQUENCE), Segment(3, AS_CONFED_SEQUENCE), Segment(3, AS_CONFED_SEQUENCE)]
+        path = CanonicalPath.intern(aspath)
+        self.assertEqual([(segment.value, segment.type) for segment in path],
+                         [(1, AS_SEQUENCE), (2, AS_SET), (2, AS_SEQUENCE), (3, AS_CONFED_SEQUENCE),
+                          (3, AS_CONFED_SEQUENCE)])
+        self.assertEqual((path[-1].value, path[-1].type), (3, AS_CONFED_SEQUENCE))
+        with self.assertRaises(ValueError):
+            path.as_path
+
+    def test_interned(self):
+        path = CanonicalPath.intern([Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)])
+        self.assertIs(CanonicalPath.intern([Segment(13238, AS_SEQUENCE), Segment(13238, AS_SEQUENCE),
+                                            Segment(3356, AS_SEQUENCE)]), path)
+        self.assertIs(CanonicalPath.intern_as_path([3356, 3356, 13238]), path)
+        self.assertIs(CanonicalPath.intern(path), path)
+        self.assertEqual(path.as_path, (3356, 13238))
+        self.assertEqual(len({path, CanonicalPath.intern_as_path([3356, 13238])}), 1)
+
+    def test_verdicts_match_segment_lists(self):
+        checks = {Upflow: aspa_manager.check_upflow_path,
+                  Downflow: aspa_manager.check_downflow_path,
+                  IXflow: aspa_manager.check_ix_path}
+        cached_manager = ASPA(aspa_records, path_cache_size=64)
+        for direction, check in checks.items():
+            paths = random_paths(1000, 3356, seed=direction)
+            expected = [check(aspath, 3356, IPv4) for aspath in paths]
+            canonical_paths = [CanonicalPath.intern(aspath) for aspath in paths]
+            with self.subTest(direction=direction):
+                self.assertEqual([check(path, 3356, IPv4) for path in canonical_paths], expected)
+            with self.subTest(direction=direction, cache=True):
+                self.assertEqual(list(cached_manager.verify_many(canonical_paths, 3356, IPv4, direction)), expected)
+            with self.subTest(direction=direction, batch=True):
+                batch = PathBatch.from_paths(canonical_paths)
+                self.assertEqual(list(aspa_manager.verify_many(batch, 3356, IPv4, direction)), expected)
+
+
+class FrozenASPATableTests(unittest.TestCase):
+    def test_frozen_table_is_drop_in_backend(self):
+        frozen_manager = ASPA(FrozenASPATable.build(aspa_records))
+        cached_frozen_manager = ASPA(FrozenASPATable.build(aspa_records), pair_cache=True)
+        for direction in (Upflow, Downflow, IXflow):
+            paths = random_paths(500, 13238, seed=direction)
+            expected = aspa_manager.verify_many(paths, 13238, IPv4, direction)
+            with self.subTest(direction=direction):
+                self.assertEqual(frozen_manager.verify_many(paths, 13238, IPv4, direction), expected)
+                self.assertEqual(cached_frozen_manager.verify_many(paths, 13238, IPv4, direction), expected)
+
+    def test_lookups_and_thaw(self):
+        table = FrozenASPATable.build(aspa_records)
+        self.assertEqual(table.thaw(), aspa_records)
+        self.assertEqual(len(table[IPv4]), len(aspa_records[IPv4]))
+        self.assertIn(1273, table[IPv4][12389])
+        self.assertNotIn(1274, table[IPv4][12389])
+        self.assertNotIn(12390, table[IPv4])
+        self.assertIsNone(table[IPv4].get(12390))
+        self.assertIsNone(table.get(IPv6).get(12389))
+        with self.assertRaises(KeyError):
+            table[IPv4][12390]
+
+
+class ASPASnapshotTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'aspa.snapshot')
+
+    def test_snapshot_round_trip(self):
+        write_snapshot(aspa_records, self.path)
+        snapshot = FrozenASPATable.open(self.path)
+        self.assertEqual(snapshot.thaw(), aspa_records)
+
+        snapshot_manager = ASPA(snapshot)
+        for direction in (Upflow, Downflow, IXflow):
+            paths = random_paths(300, 13238, seed=direction)
+            with self.subTest(direction=direction):
+                self.assertEqual(snapshot_manager.verify_many(paths, 13238, IPv4, direction),
+                                 aspa_manager.verify_many(paths, 13238, IPv4, direction))
+
+    def test_snapshot_rejects_other_versions(self):
+        write_snapshot({IPv4: {1: {2}}}, self.path)
+        with open(self.path, 'r+b') as snapshot:
+            snapshot.seek(4)
+            snapshot.write(b'\xff\xff')
+        with self.assertRaises(ValueError):
+            FrozenASPATable.open(self.path)
+
+    def test_snapshot_rejects_damaged_files(self):
+        write_snapshot(aspa_records, self.path)
+        with open(self.path, 'rb') as snapshot:
+            data = snapshot.read()
+        # the last offset of IPv4 is its provider count, 4 bytes before its providers
+        providers_start = SNAPSHOT_HEADER.size + 2 * SNAPSHOT_AFI_ENTRY.size + 8 * len(aspa_records[IPv4]) + 4
+        for damaged in (data[:-4], data + b'\0' * 4, data[:8],
+                        data[:providers_start - 4] + struct.pack('<I', 1) + data[providers_start:]):
+            with open(self.path, 'wb') as snapshot:
+                snapshot.write(damaged)
+            with self.subTest(size=len(damaged)):
+                with self.assertRaises(ValueError):
+                    FrozenASPATable.open(self.path)
+
+
+class VerificationPoolTests(unittest.TestCase):
+    def test_pool_results_match_serial_in_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_path = os.path.join(directory, 'aspa.snapshot')
+            write_snapshot(aspa_records, snapshot_path)
+            with VerificationPool(snapshot_path, workers=2, chunk_size=64) as pool:
+                for direction in (Upflow, Downflow, IXflow):
+                    paths = random_paths(1000, 13238, seed=direction)
+                    expected = aspa_manager.verify_many(paths, 13238, IPv4, direction)
+                    with self.subTest(direction=direction):
+                        self.assertEqual(pool.verify_many(paths, 13238, IPv4, direction), expected)
+                        self.assertEqual(pool.verify_many(PathBatch.from_paths(paths), 13238, IPv4, direction),
+                                         expected)
+                self.assertEqual(len(pool.verify_many([], 13238, IPv4, Upflow)), 0)
+
+
+# builders for locally generated MRT files, segments are (type, asns) in wire order
+def mrt_record(record_type, subtype, body):
+    return struct.pack('>IHHI', 0, record_type, subtype, len(body)) + body
+
+
+def bgp_attribute(attribute_type, value):
+    return struct.pack('>BBH', 0x50, attribute_type, len(value)) + value
+
+
+def bgp_as_path(segments, asn_size=4):
+    return b''.join(struct.pack(f'>BB{len(asns)}{"I" if asn_size == 4 else "H"}', segment_type, len(asns), *asns)
+                    for segment_type, asns in segments)
+
+
+def mrt_prefix(prefix):
+    network = ipaddress.ip_network(prefix)
+    return bytes([network.prefixlen]) + network.network_address.packed[:(network.prefixlen + 7) // 8]
+
+
+def mrt_table_dump(peer_asns, ribs):
+    peers = b''.join(struct.pack('>BIII', 0x02, index, index, peer_as) for index, peer_as in enumerate(peer_asns))
+    records = mrt_record(TABLE_DUMP_V2, PEER_INDEX_TABLE, struct.pack('>IHH', 1, 0, len(peer_asns)) + peers)
+    for sequence, (prefix, entries) in enumerate(ribs):
+        subtype = RIB_IPV4_UNICAST if ipaddress.ip_network(prefix).version == 4 else RIB_IPV6_UNICAST
+        body = struct.pack('>I', sequence) + mrt_prefix(prefix) + struct.pack('>H', len(entries))
+        for peer_index, segments in entries:
+            attributes = bgp_attribute(ATTR_AS_PATH, bgp_as_path(segments))
+            body += struct.pack('>HIH', peer_index, 0, len(attributes)) + attributes
+        records += mrt_record(TABLE_DUMP_V2, subtype, body)
+    return records
+
+
+def mrt_bgp4mp_update(peer_as, attributes, nlri, asn_size=4):
+    update = struct.pack('>HH', 0, len(attributes)) + attributes + nlri
+    message = b'\xff' * 16 + struct.pack('>HB', 19 + len(update), BGP_UPDATE) + update
+    if asn_size == 4:
+        header = struct.pack('>IIHH', peer_as, 64512, 0, AFI_IPV4)
+        subtype = BGP4MP_MESSAGE_AS4
+    else:
+        header = struct.pack('>HHHH', peer_as, 64512, 0, AFI_IPV4)
+        subtype = BGP4MP_MESSAGE
+    return mrt_record(BGP4MP, subtype, header + bytes(8) + message)
+
+
+class MRTTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_table_dump_v2(self):
+        data = mrt_table_dump([3356, 13238], [
+            ('192.0.2.0/24', [(0, [(AS_SEQUENCE, [3356, 12389])]),
+                              (1, [(AS_SEQUENCE, [13238, 174]), (AS_SET, [1, 2])])]),
+            ('2001:db8::/32', [(1, [(AS_SEQUENCE, [13238, 13238, 43247])])]),
+        ])
+        path = os.path.join(self.directory, 'rib.gz')
+        with gzip.open(path, 'wb') as rib:
+            rib.write(data)
+
+        routes = list(read_routes(path))
+        self.assertEqual([(route.prefix, route.afi, route.peer_as) for route in routes],
+                         [('192.0.2.0/24', IPv4, 3356), ('192.0.2.0/24', IPv4, 13238), ('2001:db8::/32', IPv6, 13238)])
+        self.assertEqual([(segment.value, segment.type) for segment in routes[1].aspath],
+                         [(2, AS_SET), (1, AS_SET), (174, AS_SEQUENCE), (13238, AS_SEQUENCE)])
+        self.assertEqual([segment.value for segment in routes[2].aspath], [43247, 13238, 13238])
+
+    def test_bgp4mp_updates(self):
+        mp_reach = struct.pack('>HBB', AFI_IPV6, 1, 16) + bytes(16) + b'\0' + mrt_prefix('2001:db8:1::/48')
+        as_path = bgp_as_path([(AS_SEQUENCE, [3356, 23456])], asn_size=2)
+        data = (mrt_bgp4mp_update(3356, bgp_attribute(ATTR_AS_PATH, bgp_as_path([(AS_SEQUENCE, [3356, 12389])]))
+                                  + bgp_attribute(ATTR_MP_REACH_NLRI, mp_reach), mrt_prefix('198.51.100.0/24'))
+                + mrt_bgp4mp_update(3356, bgp_attribute(ATTR_AS_PATH, as_path)
+                                    + bgp_attribute(ATTR_AS4_PATH, bgp_as_path([(AS_SEQUENCE, [12389])])),
+                                    mrt_prefix('203.0.113.0/24'), asn_size=2))
+
+        routes = list(read_routes(io.BytesIO(data)))
+        self.assertEqual([(route.prefix, route.afi, route.peer_as) for route in routes],
+                         [('198.51.100.0/24', IPv4, 3356), ('2001:db8:1::/48', IPv6, 3356),
+                          ('203.0.113.0/24', IPv4, 3356)])
+        self.assertEqual([segment.value for segment in routes[2].aspath], [12389, 3356])
+
+    def test_as4_path_merge_counts_sets_and_confeds(self):
+        # the AS_SET of the AS4_PATH counts as one AS, so only 23456 23456 are replaced
+        with_set = bgp_as_path([(AS_SEQUENCE, [3356, 23456, 23456])], asn_size=2)
+        with_set4 = bgp_as_path([(AS_SEQUENCE, [196608]), (AS_SET, [196609, 174])])
+        # the confed segment counts as no AS, so the AS4_PATH is longer and ignored
+        with_confed = bgp_as_path([(AS_CONFED_SEQUENCE, [65001]), (AS_SEQUENCE, [23456])], asn_size=2)
+        with_confed4 = bgp_as_path([(AS_SEQUENCE, [196608, 196609])])
+        data = (mrt_bgp4mp_update(3356, bgp_attribute(ATTR_AS_PATH, with_set) + bgp_attribute(ATTR_AS4_PATH, with_set4),
+                                  mrt_prefix('203.0.113.0/24'), asn_size=2)
+                + mrt_bgp4mp_update(65001, bgp_attribute(ATTR_AS_PATH, with_confed)
+                                    + bgp_attribute(ATTR_AS4_PATH, with_confed4),
+                                    mrt_prefix('198.51.100.0/24'), asn_size=2))
+
+        routes = list(read_routes(io.BytesIO(data)))
+        self.assertEqual([(segment.value, segment.type) for segment in routes[0].aspath],
+                         [(174, AS_SET), (196609, AS_SET), (196608, AS_SEQUENCE), (3356, AS_SEQUENCE)])
+        self.assertEqual([(segment.value, segment.type) for segment in routes[1].aspath],
+                         [(23456, AS_SEQUENCE), (65001, AS_CONFED_SEQUENCE)])
+
+    def test_verify_mrt(self):
+        data = mrt_table_dump([3356, 13238], [
+            ('192.0.2.0/24', [(0, [(AS_SEQUENCE, [3356, 12389])]), (1, [(AS_SEQUENCE, [13238, 20485, 13238])])]),
+            ('198.51.100.0/24', [(0, [(AS_SEQUENCE, [3356, 2914])]), (1, [(AS_SET, [13238])])]),
+        ])
+        output = io.StringIO()
+        counts = verify_mrt(aspa_manager, io.BytesIO(data), Upflow, output, batch_size=1)
+        self.assertEqual(counts, {'Valid': 1, 'Invalid': 2, 'Unknown': 0, 'Unverifiable': 1})
+        self.assertEqual(sorted(output.getvalue().splitlines()), [
+            '192.0.2.0/24|13238|13238 20485 13238|Invalid',
+            '192.0.2.0/24|3356|3356 12389|Valid',
+            '198.51.100.0/24|13238|{13238}|Unverifiable',
+            '198.51.100.0/24|3356|3356 2914|Invalid',
+        ])
+
+
+class WirePathTests(unittest.TestCase):
+    # wire format of a Segment list: neighbor first, consecutive segments of one type in one segment
+    def wire_path(self, aspath, asn_size=4):
+        segments = []
+        for segment in reversed(aspath):
+            if segments and segments[-1][0] == segment.type:
+                segments[-1][1].append(segment.value)
+            else:
+                segments.append((segment.type, [segment.value]))
+        return bgp_as_path(segments, asn_size)
+
+    def test_matches_segment_lists(self):
+        checks = {Upflow: aspa_manager.check_upflow_path,
+                  Downflow: aspa_manager.check_downflow_path,
+                  IXflow: aspa_manager.check_ix_path}
+        for direction, check in checks.items():
+            paths = random_paths(1000, 3356, seed=direction)
+            expected = [check(aspath, 3356, IPv4) for aspath in paths]
+            with self.subTest(direction=direction):
+                self.assertEqual([aspa_manager.verify_wire_path(memoryview(self.wire_path(aspath)), 3356, IPv4,
+                                                                direction) for aspath in paths], expected)
+            with self.subTest(direction=direction, asn_size=2):
+                two_byte = [(aspath, result) for aspath, result in zip(paths, expected)
+                            if all(segment.value < 65536 for segment in aspath)]
+                self.assertEqual([aspa_manager.verify_wire_path(self.wire_path(aspath, 2), 3356, IPv4, direction,
+                                                                asn_size=2) for aspath, _ in two_byte],
+                                 [result for _, result in two_byte])
+
+    def test_columns_and_truncation(self):
+        data = bgp_as_path([(AS_SEQUENCE, [3356, 3356, 13238]), (AS_SET, [4200000000, 1])])
+        values, types = wire_path_columns(memoryview(data))
+        self.assertEqual(list(values), [1, 4200000000, 13238, 3356, 3356])
+        self.assertEqual(list(types), [AS_SET, AS_SET, AS_SEQUENCE, AS_SEQUENCE, AS_SEQUENCE])
+        with self.assertRaises(ValueError):
+            wire_path_columns(data[:-1])
+        with self.assertRaises(ValueError):
+            wire_path_columns(data + b'\x02')
+
+
+class RTRTests(unittest.TestCase):
+    announced = {43247: {13238}, 13238: {3356}, 174: {3356}}
+
+    # syncs once per exchange and returns the client, server and (transitions, IPv4 records) per sync
+    def sync(self, exchanges, manager, atomic=False, syncs=None):
+        async def run():
+            async with RTRReplayServer(exchanges) as server:
+                async with RTRClient(manager, '127.0.0.1', server.port, afis=(IPv4,), atomic=atomic) as client:
+                    results = []
+                    for _ in range(syncs or len(exchanges)):
+                        results.append((await client.sync(), manager.aspa_records.get(IPv4)))
+            return client, server, results
+        return asyncio.run(run())
+
+    def test_incremental_sync(self):
+        exchanges = [(reset_query_pdu(), cache_response(7, 1, self.announced)),
+                     (serial_query_pdu(7, 1), cache_response(7, 2, {13238: {174}}, withdrawn=[174]))]
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        for atomic in (False, True):
+            with self.subTest(atomic=atomic):
+                manager = ASPA({})
+                manager.add_route('route', aspath, 3356, IPv4, Upflow)
+                client, server, results = self.sync(exchanges, manager, atomic)
+                self.assertEqual([transitions for transitions, _ in results],
+                                 [[('route', Unknown, Valid)], [('route', Valid, Invalid)]])
+                self.assertEqual(manager.aspa_records, {IPv4: {43247: {13238}, 13238: {174}}})
+                self.assertEqual((client.session_id, client.serial), (7, 2))
+                # the atomic swap leaves the records of the previous serial untouched for their readers
+                self.assertEqual(results[0][1] == self.announced, atomic)
+
+    def test_cache_reset(self):
+        exchanges = [(reset_query_pdu(), cache_response(7, 1, self.announced)),
+                     (serial_query_pdu(7, 1), cache_reset_pdu()),
+                     (reset_query_pdu(), cache_response(8, 5, {43247: {13238, 174}}))]
+        manager = ASPA({})
+        client, server, _ = self.sync(exchanges, manager, syncs=2)
+        self.assertEqual(manager.aspa_records, {IPv4: {43247: {13238, 174}}})
+        self.assertEqual((client.session_id, client.serial), (8, 5))
+        self.assertEqual(server.received, [query for query, _ in exchanges])
+
+    def test_errors(self):
+        exchanges = [(reset_query_pdu(), cache_response(7, 1, self.announced)),
+                     (serial_query_pdu(7, 1), cache_response(7, 2, {}, withdrawn=[65000]))]
+        manager = ASPA({})
+        with self.assertRaises(RTRError) as raised:
+            self.sync(exchanges, manager)
+        self.assertEqual(raised.exception.code, WITHDRAWAL_OF_UNKNOWN_RECORD)
+        self.assertEqual(manager.aspa_records, {IPv4: self.announced})
+
+        with self.assertRaises(RTRError) as raised:
+            self.sync([], manager, syncs=1)
+        self.assertEqual(raised.exception.code, INVALID_REQUEST)
+
+    def test_error_reports(self):
+        short_aspa = PDU_HEADER.pack(RTR_VERSION, ASPA_PDU, ASPA_ANNOUNCE << 8, 10) + b'\0\0'
+        short_end_of_data = PDU_HEADER.pack(RTR_VERSION, END_OF_DATA, 7, 12) + SERIAL.pack(2)
+        for response, code in ((cache_response(7, 2, {43247: {13238}, 64500: {174}}), DUPLICATE_ANNOUNCEMENT_RECEIVED),
+                               (cache_response(7, 2, {}, withdrawn=[65000]), WITHDRAWAL_OF_UNKNOWN_RECORD),
+                               (cache_response_pdu(7) + short_aspa + end_of_data_pdu(7, 2), CORRUPT_DATA),
+                               (cache_response_pdu(7) + short_end_of_data, CORRUPT_DATA),
+                               (cache_response_pdu(7) + b'\x01' + cache_reset_pdu()[1:], UNSUPPORTED_PROTOCOL_VERSION)):
+            exchanges = [(reset_query_pdu(), cache_response(7, 1, self.announced)), (serial_query_pdu(7, 1), response)]
+
+            async def run():
+                async with RTRReplayServer(exchanges) as server:
+                    async with RTRClient(ASPA({}), '127.0.0.1', server.port, afis=(IPv4,)) as client:
+                        await client.sync()
+                        with self.assertRaises(RTRError) as raised:
+                            await client.sync()
+                        self.assertIsNone(client.writer)
+                return raised.exception, server.received
+
+            with self.subTest(code=code):
+                error, received = asyncio.run(run())
+                self.assertEqual(error.code, code)
+                version, pdu_type, reported_code, _ = PDU_HEADER.unpack_from(received[-1])
+                self.assertEqual((pdu_type, reported_code), (ERROR_REPORT, code))
+                self.assertEqual(received[-1][12:12 + len(error.pdu)], error.pdu)
+                self.assertTrue(error.pdu)
+
+    def test_run_syncs_on_notify(self):
+        exchanges = [(reset_query_pdu(), cache_response(7, 1, self.announced)),
+                     (serial_query_pdu(7, 1), cache_response(7, 2, {64500: {174}}))]
+        manager = ASPA({})
+
+        async def run():
+            async with RTRReplayServer(exchanges) as server:
+                client = RTRClient(manager, '127.0.0.1', server.port)
+                task = asyncio.create_task(client.run())
+                while client.serial != 1:
+                    await asyncio.sleep(0.01)
+                await server.notify(7, 2)
+                while client.serial != 2:
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await client.close()
+        asyncio.run(asyncio.wait_for(run(), 10))
+        self.assertEqual(manager.aspa_records[IPv6][64500], {174})
+
+
+class ASPADERTests(unittest.TestCase):
+    # example eContent of draft-ietf-sidrops-aspa-profile
+    example = bytes.fromhex('301da00302010102023cca301202020b620202205b020300c790020303259e')
+
+    def test_decode_example(self):
+        self.assertEqual(decode_aspa(self.example), (15562, [2914, 8283, 51088, 206238]))
+        self.assertEqual(encode_aspa(15562, [206238, 2914, 51088, 8283]), self.example)
+        self.assertEqual(decode_asa(encode_asa(4294967295, [0, 128, 65536])), (4294967295, [0, 128, 65536]))
+
+    def test_profile_constraints(self):
+        for data in (self.example[:-1], self.example + b'\x00',
+                     encode_aspa(15562, [15562, 2914]),
+                     bytes.fromhex('3009020101300402020b62'),                     # implicit version
+                     bytes.fromhex('300ea003020100020101300402020b62'),           # version 0
+                     bytes.fromhex('3011a003020101020101300702020b6202010a'),     # not ascending
+                     bytes.fromhex('3012a003020101020101300802020b6202020b62'),   # duplicate
+                     bytes.fromhex('300aa0030201010201013000'),                   # no providers
+                     bytes.fromhex('300ea0030201010201ff300402020b62'),           # negative
+                     bytes.fromhex('300fa003020101020200ff300402020b62')[:-1]):
+            with self.subTest(data=data.hex()):
+                with self.assertRaises(ValueError):
+                    decode_aspa(data)
+        with self.assertRaises(ValueError):
+            decode_asa(self.example)
+
+    def test_load_directory(self):
+        records = {customer: {customer + 1, customer + 7} for customer in range(100, 400, 3)}
+        with tempfile.TemporaryDirectory() as root:
+            for customer, providers in records.items():
+                os.makedirs(os.path.join(root, str(customer % 8)), exist_ok=True)
+                with open(os.path.join(root, str(customer % 8), f'{customer}.asa'), 'wb') as asa:
+                    asa.write(encode_asa(customer, providers))
+            # a second object of a customer adds its providers, broken objects are reported
+            with open(os.path.join(root, 'second.asa'), 'wb') as asa:
+                asa.write(encode_asa(100, {174}))
+            with open(os.path.join(root, 'broken.asa'), 'wb') as asa:
+                asa.write(encode_asa(1, {2})[:-3])
+            records[100] = records[100] | {174}
+
+            for workers in (0, 2):
+                with self.subTest(workers=workers):
+                    manager = ASPA({})
+                    report = load_asa_directory(manager, root, afis=(IPv4,), workers=workers, chunk_size=16)
+                    self.assertEqual(manager.aspa_records, {IPv4: records})
+                    self.assertEqual((report['objects'], report['customers']), (len(records) + 1, len(records)))
+                    self.assertEqual([os.path.basename(path) for path, _ in report['rejected']], ['broken.asa'])
+
+
+class JSONExportTests(unittest.TestCase):
+    export = {
+        'metadata': {'counts': [1, 2.5, None]},
+        'roas': [{'asn': 13238, 'prefix': '192.0.2.0/24', 'maxLength': 24}] * 50,
+        'aspas': [
+            {'customer_asid': 43247, 'expires': 1700000000, 'providers': [13238]},
+            {'customer': 'AS13238', 'providers': ['AS3356', 'AS174']},
+            {'customer_asid': 20485, 'provider_set': [{'asid': 3356, 'afi_limit': 'ipv4'},
+                                                      {'asid': 1299, 'afi_limit': 'none'}]},
+            {'customer_asid': 9002, 'providers': {'ipv6': [6939]}},
+            {'customer_asid': 43247, 'providers': [174]},
+        ],
+        'bgpsec_keys': [],
+    }
+    expected = {IPv4: {43247: {13238, 174}, 13238: {3356, 174}, 20485: {3356, 1299}, 9002: set()},
+                IPv6: {43247: {13238, 174}, 13238: {3356, 174}, 20485: {1299}, 9002: {6939}}}
+
+    def test_streaming_matches_json_load(self):
+        for indent in (None, 2):
+            document = json.dumps(self.export, indent=indent)
+            for chunk_size in (1, 7, 1 << 16):
+                with self.subTest(indent=indent, chunk_size=chunk_size):
+                    self.assertEqual(list(iter_export_entries(io.StringIO(document), chunk_size)),
+                                     self.export['aspas'])
+        document = json.dumps(self.export['aspas'])
+        self.assertEqual(list(iter_export_entries(io.StringIO(document), 5)), self.export['aspas'])
+
+    def test_numbers_split_by_chunks(self):
+        aspas = [{'customer_asid': 43247, 'providers': [13238]}]
+        for document, expected in (('[1,2.5,3e10,12345.678, -0.5E-3 ]', [1, 2.5, 3e10, 12345.678, -0.5e-3]),
+                                   ('{"generated": 1718000000.25, "scale": 1e+10, "aspas": %s}' % json.dumps(aspas),
+                                    aspas)):
+            for chunk_size in range(1, len(document) + 1):
+                with self.subTest(document=document, chunk_size=chunk_size):
+                    self.assertEqual(list(iter_export_entries(io.StringIO(document), chunk_size)), expected)
+
+    def test_load_into_aspa(self):
+        document = json.dumps(self.export, indent=1)
+        for frozen in (False, True):
+            with self.subTest(frozen=frozen):
+                manager = ASPA({})
+                report = load_json_export(manager, io.StringIO(document), frozen=frozen, chunk_size=16)
+                records = manager.aspa_records.thaw() if frozen else manager.aspa_records
+                self.assertEqual(records, self.expected)
+                self.assertEqual(report['aspas'], 5)
+
+        # without AFI limits the provider sets are shared between the AFIs
+        manager = ASPA({})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.json.gz')
+            with gzip.open(path, 'wt') as export:
+                json.dump({'aspas': self.export['aspas'][:2]}, export)
+            load_json_export(manager, path)
+        self.assertIs(manager.aspa_records[IPv4][13238], manager.aspa_records[IPv6][13238])
+
+    def test_invalid_exports(self):
+        for document in ('{"aspas": [{"customer_asid": 1, "providers": [2]}', '{"aspas": [1]}',
+                         '{"aspas": [{"customer_asid": -1, "providers": [2]}]}', '{"aspas": [{"providers": [2]}]}',
+                         '{"aspas": [{"customer_asid": 1, "providers": ["ASx"]}]}', '{"aspas" [] }'):
+            with self.subTest(document=document):
+                with self.assertRaises(ValueError):
+                    load_json_export(ASPA({}), io.StringIO(document), chunk_size=4)
+
+
+class ASPAGenerationsTests(unittest.TestCase):
+    def test_batches_use_one_generation(self):
+        # odd generations publish aspa_records, even ones the same records without 13238
+        records = [{IPv4: {customer: providers for customer, providers in aspa_records[IPv4].items()
+                           if customer != 13238}}, aspa_records]
+        paths = PathBatch.from_paths(random_paths(300, 3356))
+        expected = [ASPA(afi_records).verify_many(paths, 3356, IPv4, Downflow) for afi_records in records]
+        self.assertNotEqual(expected[0], expected[1])
+
+        generations = ASPAGenerations(aspa_records, path_cache_size=64, pair_cache=True)
+        stop = threading.Event()
+
+        def reload():
+            while not stop.is_set():
+                generations.publish(records[(generations.last_generation + 1) % 2])
+
+        thread = threading.Thread(target=reload)
+        thread.start()
+        try:
+            used = set()
+            for _ in range(50):
+                generation, results = generations.verify_many(paths, 3356, IPv4, Downflow)
+                self.assertEqual(results, expected[generation % 2])
+                used.add(generation)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertGreater(len(used), 1)
+
+    def test_old_generations_freed_after_their_batches(self):
+        generations = ASPAGenerations(aspa_records, pair_cache=True)
+        with generations.acquire() as aspa:
+            self.assertEqual(generations.publish({IPv4: {}}), 2)
+            self.assertEqual(aspa.generation, 1)
+            self.assertEqual(aspa.verify_pair(13238, 3356, IPv4), Valid)
+            self.assertEqual(generations.live_generations(), [1, 2])
+        del aspa
+        generations.reclaim()
+        self.assertEqual(generations.live_generations(), [2])
+        self.assertEqual(generations.verify_many([], 3356, IPv4, Upflow)[0], 2)
+        with self.assertRaises(TypeError):
+            generations.current.set_record(IPv4, 13238, {174})
+
+
+class ProviderSetInterningTests(unittest.TestCase):
+    def test_interning_keeps_verdicts(self):
+        records = {afi: {customer: set(providers) for customer, providers in aspa_records[IPv4].items()}
+                   for afi in (IPv4, IPv6)}
+        records[IPv4][64500] = {3356, 174}
+        records[IPv4][64501] = {174, 3356}
+        paths = random_paths(500, 3356)
+        expected = [ASPA(records).verify_many(paths, 3356, afi, Downflow) for afi in (IPv4, IPv6)]
+
+        report = intern_provider_sets(records)
+        self.assertIs(records[IPv4][64500], records[IPv4][64501])
+        self.assertIs(records[IPv4][13238], records[IPv6][13238])
+        self.assertEqual(report['records'], 2 * len(aspa_records[IPv4]) + 2)
+        self.assertEqual(report['provider_sets'], len({frozenset(providers) for providers in records[IPv4].values()}))
+        self.assertGreater(report['dedupe_ratio'], 2)
+        self.assertGreater(report['bytes_saved'], report['bytes'])
+        for manager in (ASPA(records), ASPA(records, pair_cache=True)):
+            self.assertEqual([manager.verify_many(paths, 3356, afi, Downflow) for afi in (IPv4, IPv6)], expected)
+
+
+class ScenarioSweepTests(unittest.TestCase):
+    def test_matrix_matches_verification_per_scenario(self):
+        rng = random.Random(1)
+        customers = list(aspa_records[IPv4])
+        scenarios = [rng.sample(customers, rng.randint(0, len(customers))) for _ in range(70)] + [customers, [], [1]]
+        for direction in (Upflow, Downflow, IXflow):
+            paths = random_paths(1000, 13238, seed=direction)
+            paths += [CanonicalPath.intern(aspath) for aspath in paths[:100]]
+            expected = []
+            for scenario in scenarios:
+                manager = ASPA({IPv4: {customer: aspa_records[IPv4][customer] for customer in scenario
+                                        if customer in aspa_records[IPv4]}})
+                results = manager.verify_many(paths, 13238, IPv4, direction)
+                expected.append([results.count(verdict) for verdict in (Valid, Invalid, Unknown, Unverifiable)])
+            for workers in (0, 2):
+                with self.subTest(direction=direction, workers=workers):
+                    self.assertEqual(sweep(aspa_records, scenarios, paths, 13238, IPv4, direction, workers,
+                                           chunk_size=128), expected)
+
+
 if __name__ == '__main__':
     # aspa_manager = ASPA(aspa_records)
     # aspath = [Segment(3356, AS_SEQUENCE), Segment(1, AS_SEQUENCE), Segment(4635, AS_SEQUENCE)]